@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+acoustic_scoring.py - 聲學特徵評分引擎
+在Audio-LLM無法使用時，直接從波形計算語速、停頓、音高與能量特徵並評分
+"""
+
+import os
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.025          # 能量分析視窗
+HOP_SECONDS = 0.010            # 視窗間隔
+PITCH_FRAME_SECONDS = 0.040    # 音高分析視窗（需涵蓋兩個以上的週期）
+MIN_PAUSE_SECONDS = 0.25       # 短於此長度的靜音不算停頓
+MIN_NUCLEUS_GAP_SECONDS = 0.10 # 音節核之間的最小間隔
+PITCH_MIN_HZ = 75
+PITCH_MAX_HZ = 400
+MAX_PITCH_FRAMES = 400         # 音高估計最多取樣的幀數
+EPS = 1e-10
+
+# 各級別的評分基準：語速範圍（字/分鐘）、可接受的停頓比例、每分鐘停頓次數、音高變化（半音）
+ACOUSTIC_CALIBRATION = {
+    "beginner": {
+        "speech_rate_wpm": (60, 150),
+        "max_pause_ratio": 0.45,
+        "max_pauses_per_minute": 24,
+        "min_pitch_range_st": 3.0
+    },
+    "elementary": {
+        "speech_rate_wpm": (70, 160),
+        "max_pause_ratio": 0.40,
+        "max_pauses_per_minute": 20,
+        "min_pitch_range_st": 3.5
+    },
+    "intermediate": {
+        "speech_rate_wpm": (90, 170),
+        "max_pause_ratio": 0.33,
+        "max_pauses_per_minute": 16,
+        "min_pitch_range_st": 4.0
+    },
+    "upper_intermediate": {
+        "speech_rate_wpm": (105, 180),
+        "max_pause_ratio": 0.27,
+        "max_pauses_per_minute": 13,
+        "min_pitch_range_st": 4.5
+    },
+    "advanced": {
+        "speech_rate_wpm": (115, 190),
+        "max_pause_ratio": 0.22,
+        "max_pauses_per_minute": 10,
+        "min_pitch_range_st": 5.0
+    }
+}
+
+
+def load_waveform(audio_path, sr=SAMPLE_RATE):
+    """載入單聲道音頻並重新取樣"""
+    import librosa
+    audio, _ = librosa.load(audio_path, sr=sr, mono=True)
+    return audio
+
+
+def to_mono_float(sample_rate, data, target_rate=SAMPLE_RATE):
+    """將 Gradio numpy 音頻（任意取樣率、整數或浮點、單/雙聲道）轉為 16kHz 單聲道 float32"""
+    audio = np.asarray(data)
+    # 先正規化整數樣本再混成單聲道（平均後已是浮點，無法再判斷原本的整數範圍）
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / np.iinfo(audio.dtype).max
+    audio = audio.astype(np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+
+    if sample_rate != target_rate and len(audio):
+        # 需經過抗混疊濾波；直接線性插值會把高於 8kHz 的成分折回語音頻段
+        import librosa
+        audio = librosa.resample(audio, orig_sr=sample_rate, target_sr=target_rate).astype(np.float32)
+    return audio
+
+
+def has_audio(audio):
+    """音頻輸入是否可用：存在的檔案路徑、Gradio 的 (取樣率, 樣本) 或非空的波形"""
+    if audio is None:
+        return False
+    if isinstance(audio, np.ndarray):
+        return audio.size > 0
+    if isinstance(audio, tuple):
+        return len(audio) == 2 and audio[1] is not None and np.asarray(audio[1]).size > 0
+    return os.path.exists(audio)
+
+
+def load_audio(audio, sr=SAMPLE_RATE):
+    """將音頻輸入轉為 16kHz 單聲道 float32 波形；已是波形時直接回傳，不經過磁碟
+
+    Args:
+        audio: 檔案路徑、Gradio 的 (取樣率, 樣本) 或 16kHz 單聲道波形
+    """
+    if isinstance(audio, np.ndarray):
+        return audio if audio.dtype == np.float32 else audio.astype(np.float32)
+    if isinstance(audio, tuple):
+        return to_mono_float(audio[0], audio[1], sr)
+    return load_waveform(audio, sr).astype(np.float32)
+
+
+def audio_nbytes(audio):
+    """音頻輸入的大小（位元組），用於剖析紀錄"""
+    if isinstance(audio, np.ndarray):
+        return audio.nbytes
+    if isinstance(audio, tuple):
+        return np.asarray(audio[1]).nbytes
+    if audio and os.path.exists(audio):
+        return os.path.getsize(audio)
+    return None
+
+
+def _frame(audio, frame_length, hop_length):
+    if len(audio) < frame_length:
+        audio = np.pad(audio, (0, frame_length - len(audio)))
+    return np.lib.stride_tricks.sliding_window_view(audio, frame_length)[::hop_length]
+
+
+def _runs(mask):
+    """回傳布林序列中連續 True 區段的 (起點, 長度)"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+
+def _estimate_pitch(audio, speech_mask, sr, hop_length):
+    """以FFT自相關批次估計有聲幀的基頻（Hz），並回傳分析的幀數"""
+    frame_length = int(PITCH_FRAME_SECONDS * sr)
+    frames = _frame(audio, frame_length, hop_length)
+    count = min(len(frames), len(speech_mask))
+    voiced_index = np.flatnonzero(speech_mask[:count])
+    if len(voiced_index) == 0:
+        return np.empty(0), 0
+
+    if len(voiced_index) > MAX_PITCH_FRAMES:
+        voiced_index = voiced_index[np.linspace(0, len(voiced_index) - 1, MAX_PITCH_FRAMES).astype(int)]
+
+    voiced = frames[voiced_index] * np.hanning(frame_length)
+    voiced = voiced - voiced.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(voiced, n=2 * frame_length, axis=1)
+    autocorr = np.fft.irfft(np.abs(spectrum) ** 2, axis=1)[:, :frame_length]
+    autocorr = autocorr / (autocorr[:, :1] + EPS)
+
+    min_lag = int(sr / PITCH_MAX_HZ)
+    max_lag = min(int(sr / PITCH_MIN_HZ), frame_length - 1)
+    search = autocorr[:, min_lag:max_lag]
+    best_lag = np.argmax(search, axis=1)
+    strength = search[np.arange(len(search)), best_lag]
+
+    periodic = strength > 0.3
+    return sr / (best_lag[periodic] + min_lag), len(voiced_index)
+
+
+def extract_acoustic_features(audio, sr=SAMPLE_RATE, word_count=None):
+    """從波形計算語速、停頓、音高與能量特徵"""
+    audio = np.asarray(audio, dtype=np.float32)
+    duration = len(audio) / sr
+    frame_length = int(FRAME_SECONDS * sr)
+    hop_length = int(HOP_SECONDS * sr)
+
+    frames = _frame(audio, frame_length, hop_length)
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    db = 20 * np.log10(rms + EPS)
+
+    noise_floor = np.percentile(db, 10)
+    peak = db.max()
+    threshold = max(noise_floor + 10, peak - 35)
+    speech_mask = db > threshold
+
+    features = {
+        "duration": duration,
+        "speech_duration": 0.0,
+        "active_duration": 0.0,
+        "pause_count": 0,
+        "pause_ratio": 0.0,
+        "mean_pause": 0.0,
+        "speech_rate_wpm": 0.0,
+        "syllable_rate": 0.0,
+        "pitch_range_st": 0.0,
+        "pitch_std_st": 0.0,
+        "energy_std_db": 0.0,
+        "snr_db": float(peak - noise_floor),
+        "voiced_ratio": 0.0
+    }
+
+    speech_index = np.flatnonzero(speech_mask)
+    if len(speech_index) == 0:
+        return features
+
+    first, last = speech_index[0], speech_index[-1]
+    active = speech_mask[first:last + 1]
+    active_duration = len(active) * HOP_SECONDS
+    speech_duration = active.sum() * HOP_SECONDS
+
+    # 停頓：語音區段內足夠長的靜音
+    _, silence_lengths = _runs(~active)
+    pause_lengths = silence_lengths[silence_lengths * HOP_SECONDS >= MIN_PAUSE_SECONDS] * HOP_SECONDS
+    pause_total = pause_lengths.sum()
+
+    # 音節核：平滑後能量包絡中，高於門檻且彼此相隔足夠遠的局部峰值
+    envelope = np.convolve(db[first:last + 1], np.ones(5) / 5, mode="same")
+    is_peak = np.r_[False, (envelope[1:-1] > envelope[:-2]) & (envelope[1:-1] >= envelope[2:]), False]
+    peaks = np.flatnonzero(is_peak & active & (envelope > threshold + 3))
+    if len(peaks) > 1:
+        min_gap = int(MIN_NUCLEUS_GAP_SECONDS / HOP_SECONDS)
+        keep = np.r_[True, np.diff(peaks) >= min_gap]
+        peaks = peaks[keep]
+    syllable_count = len(peaks)
+
+    if word_count:
+        speech_rate_wpm = word_count / active_duration * 60
+    else:
+        speech_rate_wpm = syllable_count / 1.4 / active_duration * 60
+
+    f0, analyzed_frames = _estimate_pitch(audio, speech_mask, sr, hop_length)
+    if len(f0) >= 3:
+        semitones = 12 * np.log2(f0 / np.median(f0))
+        p10, p90 = np.percentile(semitones, [10, 90])
+        features["pitch_range_st"] = float(p90 - p10)
+        features["pitch_std_st"] = float(semitones.std())
+        features["voiced_ratio"] = len(f0) / analyzed_frames
+
+    features.update({
+        "speech_duration": float(speech_duration),
+        "active_duration": float(active_duration),
+        "pause_count": int(len(pause_lengths)),
+        "pause_ratio": float(pause_total / active_duration),
+        "mean_pause": float(pause_lengths.mean()) if len(pause_lengths) else 0.0,
+        "speech_rate_wpm": float(speech_rate_wpm),
+        "syllable_rate": float(syllable_count / max(speech_duration, HOP_SECONDS)),
+        "energy_std_db": float(db[first:last + 1][active].std())
+    })
+    return features
+
+
+def _range_penalty(value, low, high, scale):
+    if value < low:
+        return (low - value) / scale
+    if value > high:
+        return (value - high) / scale
+    return 0.0
+
+
+def score_fluency(features, level="intermediate"):
+    """依級別基準計算流暢度分數（0-100）"""
+    calibration = ACOUSTIC_CALIBRATION.get(level, ACOUSTIC_CALIBRATION["intermediate"])
+    if features["active_duration"] <= 0:
+        return 40
+
+    low, high = calibration["speech_rate_wpm"]
+    pauses_per_minute = features["pause_count"] / features["active_duration"] * 60
+
+    score = 95.0
+    score -= min(25, 25 * _range_penalty(features["speech_rate_wpm"], low, high, low))
+    score -= min(20, 60 * max(0.0, features["pause_ratio"] - calibration["max_pause_ratio"]))
+    score -= min(15, 1.5 * max(0.0, pauses_per_minute - calibration["max_pauses_per_minute"]))
+    score -= min(10, 8 * max(0.0, features["mean_pause"] - 0.6))
+    return int(round(max(40, min(100, score))))
+
+
+def score_pronunciation(features, level="intermediate"):
+    """依級別基準計算發音清晰度分數（0-100）"""
+    calibration = ACOUSTIC_CALIBRATION.get(level, ACOUSTIC_CALIBRATION["intermediate"])
+    if features["speech_duration"] <= 0:
+        return 40
+
+    score = 95.0
+    # 語調過於平板
+    score -= min(15, 4 * max(0.0, calibration["min_pitch_range_st"] - features["pitch_range_st"]))
+    # 能量起伏過小（含糊）或過大（忽大忽小）
+    score -= min(10, _range_penalty(features["energy_std_db"], 4, 14, 1.0))
+    # 錄音訊噪比偏低時清晰度難以判斷，但也代表發聲不夠清楚
+    score -= min(15, 0.75 * max(0.0, 25 - features["snr_db"]))
+    # 有聲段落缺乏穩定週期，通常是氣音過多或咬字不清
+    score -= min(10, 20 * max(0.0, 0.6 - features["voiced_ratio"]))
+    return int(round(max(40, min(100, score))))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+analysis_cache.py - Audio-LLM 分析結果快取
+預設場景中的常見句子會重複出現，以正規化後的辨識文字、分析設定與對話上下文的摘要為鍵，
+重用先前以確定性解碼產生的分析結果，略過整次 Qwen2-Audio 生成
+
+對話回應與建議回覆取決於先前的對話，因此上下文是鍵的一部分：開場回合（沒有上下文）
+與批次評分最常命中，對話中途的回合只有重試同一句話時才會命中
+
+只快取由文字決定的部分（助教回應與建議回覆）；發音分數與分析來自某位學習者的錄音，
+命中時由目前的錄音以本地聲學評分重新計算，不會把一個人的發音評語給另一個人
+"""
+
+import re
+import copy
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+
+# 可共用的欄位：只取決於辨識文字、設定與對話上下文
+CACHED_FIELDS = ("response_text", "suggested_responses")
+ANALYSIS_MODE_CACHED = "audio_llm_cached"
+
+_PUNCTUATION = re.compile(r"[^\w\s']+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_transcript(text):
+    """轉小寫、移除標點並合併空白，讓大小寫或標點不同的相同句子共用快取"""
+    text = _PUNCTUATION.sub(" ", (text or "").lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def context_digest(conversation_history):
+    """對話上下文的摘要（空白差異不影響）；沒有上下文時為空字串"""
+    context = _WHITESPACE.sub(" ", conversation_history or "").strip()
+    if not context:
+        return ""
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()[:16]
+
+
+class AnalysisCache:
+    """LRU + TTL 的分析結果快取，並統計命中率"""
+
+    def __init__(self, enabled=True, max_entries=2048, ttl_seconds=6 * 3600, deterministic=True):
+        """
+        Args:
+            enabled (bool): 關閉時不查詢也不寫入快取
+            max_entries (int): 最多保留的結果數，超過時淘汰最久未使用者
+            ttl_seconds (float): 結果的有效時間（秒）
+            deterministic (bool): 可快取的請求改用 greedy 解碼，讓相同輸入得到相同分析
+        """
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.deterministic = deterministic
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(transcribed_text, scenario, difficulty, pronunciation_focus, accent_preference,
+                 feedback_detail, catalog_version=0, conversation_history=""):
+        """產生快取鍵；無法辨識出文字時回傳None（不快取）"""
+        normalized = normalize_transcript(transcribed_text)
+        if not normalized:
+            return None
+        focus = tuple(sorted(set(pronunciation_focus))) if pronunciation_focus else ()
+        return (normalized, catalog_version, scenario, difficulty, focus, accent_preference, feedback_detail,
+                context_digest(conversation_history))
+
+    def get(self, key):
+        """取得快取的分析結果（副本），未命中時回傳None"""
+        if not self.enabled or key is None:
+            return None
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+
+        # 呼叫端會再加入閘門與辨識信心度等欄位，因此回傳副本
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        """保存分析結果中可共用的欄位（CACHED_FIELDS），發音分數與分析不寫入"""
+        if not self.enabled or key is None or not result:
+            return
+
+        result = copy.deepcopy({field: result[field] for field in CACHED_FIELDS if field in result})
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+            self.evictions = 0
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+analysis_gate.py - Audio-LLM 分析閘門
+依語音辨識後即可取得的信號，決定是否需要執行 Qwen2-Audio 的完整分析
+"""
+
+import threading
+
+GATE_LLM = "audio_llm"
+GATE_LOCAL = "local"
+
+
+class AnalysisGate:
+    """以辨識信心度、錄音長度、文字長度與難度判斷是否呼叫Audio-LLM，並統計閘門比例"""
+
+    def __init__(self, enabled=True, min_intelligibility=80, max_low_confidence_words=0,
+                 max_duration=8.0, max_words=14, llm_levels=("upper_intermediate", "advanced")):
+        """
+        Args:
+            enabled (bool): 關閉時一律使用Audio-LLM
+            min_intelligibility (int): 可懂度低於此值時需要詳細分析
+            max_low_confidence_words (int): 低信心單字超過此數量時需要詳細分析
+            max_duration (float): 錄音超過此秒數時需要詳細分析
+            max_words (int): 句子超過此字數時需要詳細分析
+            llm_levels (tuple): 一律使用詳細分析的級別
+        """
+        self.enabled = enabled
+        self.min_intelligibility = min_intelligibility
+        self.max_low_confidence_words = max_low_confidence_words
+        self.max_duration = max_duration
+        self.max_words = max_words
+        self.llm_levels = llm_levels
+
+        self._lock = threading.Lock()
+        self.decisions = {GATE_LLM: 0, GATE_LOCAL: 0}
+        self.reasons = {}
+
+    def decide(self, confidence, duration, word_count, level, has_preset_responses=True):
+        """回傳 (是否使用Audio-LLM, 原因)
+
+        has_preset_responses 為 False（自由對話等沒有預設回應的場景）時一律使用Audio-LLM，
+        本地評分只能給出通用的罐頭回應，無法回應學習者自訂的情境
+        """
+        if not self.enabled:
+            use_llm, reason = True, "gate_disabled"
+        elif not has_preset_responses:
+            use_llm, reason = True, "no_preset_responses"
+        elif level in self.llm_levels:
+            use_llm, reason = True, "level"
+        elif confidence is None:
+            use_llm, reason = True, "no_confidence"
+        elif confidence["low_confidence_count"] > self.max_low_confidence_words:
+            use_llm, reason = True, "low_confidence_words"
+        elif confidence["intelligibility_score"] < self.min_intelligibility:
+            use_llm, reason = True, "low_intelligibility"
+        elif duration is not None and duration > self.max_duration:
+            use_llm, reason = True, "long_audio"
+        elif word_count > self.max_words:
+            use_llm, reason = True, "long_transcript"
+        else:
+            use_llm, reason = False, "routine"
+
+        with self._lock:
+            self.decisions[GATE_LLM if use_llm else GATE_LOCAL] += 1
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+        return use_llm, reason
+
+    def get_stats(self):
+        with self._lock:
+            total = self.decisions[GATE_LLM] + self.decisions[GATE_LOCAL]
+            return {
+                "total": total,
+                "audio_llm": self.decisions[GATE_LLM],
+                "local": self.decisions[GATE_LOCAL],
+                "gating_rate": self.decisions[GATE_LOCAL] / total if total else 0.0,
+                "reasons": dict(self.reasons)
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.decisions = {GATE_LLM: 0, GATE_LOCAL: 0}
+            self.reasons = {}
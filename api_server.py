@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+api_server.py - 無介面的 HTTP / WebSocket 推論服務
+行動裝置與批次評分程式直接以 JSON 呼叫 process_user_input，不需操作 Gradio 介面；
+與介面共用同一個對話管理器，因此模型執行緒池、階段限制與快取都是同一份
+
+API 的工作階段一律以 "api-" 開頭，用戶端無法讀寫介面使用者的對話與學習紀錄；
+設定 auth_token（或環境變數 API_AUTH_TOKEN）後，除健康檢查外的端點都需帶
+"Authorization: Bearer <token>"（WebSocket 也可用 ?token=<token>）
+
+端點:
+    GET  /api/health             服務與模型狀態（程序存活即回傳 200）
+    GET  /api/ready              Whisper載入完成後回傳 200，載入中回傳 503 與載入進度
+    GET  /api/scenarios          可用的場景與難度
+    POST /api/analyze            分析一段錄音，回傳完整結果
+    WS   /api/analyze/stream     送出同樣的請求，逐段收到分析事件，最後收到完整結果
+
+範例:
+    API_AUTH_TOKEN=secret python api_server.py --host 0.0.0.0 --port 8000
+"""
+
+import io
+import os
+import re
+import hmac
+import time
+import uuid
+import base64
+import asyncio
+import argparse
+from typing import List, Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+from scenario_catalog import get_scenario_index
+
+FREE_CONVERSATION_SCENARIO = "自由對話"
+AUDIO_FORMATS = ("wav", "flac", "ogg", "pcm_s16le", "f32le")
+API_SESSION_PREFIX = "api-"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class AnalysisRequest(BaseModel):
+    """分析請求；audio 為 base64 編碼的音檔（wav/flac/ogg）或原始 PCM（需提供 sample_rate）"""
+    audio: str
+    audio_format: str = "wav"
+    sample_rate: Optional[int] = None
+    scenario: str = FREE_CONVERSATION_SCENARIO
+    difficulty: str = "中級 (TOEIC 605-780分)"
+    pronunciation_focus: Optional[List[str]] = None
+    accent_preference: str = "不指定"
+    feedback_detail: str = "詳細回饋"
+    show_comparison: bool = True
+    focus_area: Optional[str] = None
+    conversation_context: Optional[str] = None
+    session_id: Optional[str] = None
+    track_progress: bool = True
+
+
+class AnalysisResponse(BaseModel):
+    """分析結果；其餘欄位（流暢度指標、分析模式等）與 process_user_input 的回傳值相同"""
+    model_config = ConfigDict(extra="allow")
+
+    success: bool
+    error_message: str = ""
+    recognized_text: str = ""
+    pronunciation_analysis: str = ""
+    response_text: str = ""
+    suggested_responses: List[str] = []
+    pronunciation_score: float = 0
+    fluency_score: float = 0
+    session_id: str
+    latency_ms: float
+
+
+def decode_audio(audio_b64, audio_format="wav", sample_rate=None):
+    """將 base64 音頻解碼為 (取樣率, 樣本)，全程在記憶體中完成"""
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"不支援的音頻格式: {audio_format}，可用: {', '.join(AUDIO_FORMATS)}")
+    try:
+        raw = base64.b64decode(audio_b64, validate=True)
+    except ValueError:
+        raise ValueError("audio 不是有效的 base64 字串")
+    if not raw:
+        raise ValueError("audio 為空")
+
+    if audio_format == "pcm_s16le":
+        if not sample_rate:
+            raise ValueError("原始 PCM 需提供 sample_rate")
+        return sample_rate, np.frombuffer(raw[:len(raw) // 2 * 2], dtype="<i2")
+    if audio_format == "f32le":
+        if not sample_rate:
+            raise ValueError("原始 PCM 需提供 sample_rate")
+        return sample_rate, np.frombuffer(raw[:len(raw) // 4 * 4], dtype="<f4")
+
+    import soundfile
+    try:
+        data, file_rate = soundfile.read(io.BytesIO(raw), dtype="float32")
+    except RuntimeError as e:
+        raise ValueError(f"無法解碼音檔: {e}")
+    return file_rate, data
+
+
+def api_session_id(session_id=None):
+    """API 請求的工作階段ID：未提供時隨機產生，否則加上 "api-" 前綴，與介面的工作階段分開"""
+    if session_id is None:
+        return f"{API_SESSION_PREFIX}{uuid.uuid4().hex[:12]}"
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError("session_id 只能包含英數字、- 與 _，長度 1-64")
+    if session_id.startswith(API_SESSION_PREFIX):
+        return session_id
+    return API_SESSION_PREFIX + session_id
+
+
+def token_matches(auth_token, header=None, query_token=None):
+    """檢查 Authorization: Bearer 標頭或查詢參數中的權杖；未設定權杖時一律通過"""
+    if not auth_token:
+        return True
+    supplied = query_token or ""
+    if header and header.lower().startswith("bearer "):
+        supplied = header[7:].strip()
+    return hmac.compare_digest(supplied.encode(), auth_token.encode())
+
+
+def to_jsonable(value):
+    """將結果中的 numpy 數值與 tuple 轉為 JSON 可用的型別"""
+    if isinstance(value, dict):
+        return {str(k): to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+class AdmissionControl:
+    """API 請求的並行上限與等候上限；等候的請求已滿時立即拒絕，不無限堆積"""
+
+    def __init__(self, concurrency_limit=4, max_queue=64):
+        self.concurrency_limit = concurrency_limit
+        self.max_queue = max_queue
+        self._semaphore = None
+        self.waiting = 0
+        self.active = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def try_enter(self):
+        """排入等候；已滿時回傳 False"""
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            return False
+        self.waiting += 1
+        return True
+
+    async def acquire(self):
+        # 號誌需在事件迴圈中建立
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency_limit)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def get_stats(self):
+        return {
+            "limit": self.concurrency_limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "completed": self.completed
+        }
+
+
+class InferenceService:
+    """把 JSON 請求轉為 process_user_input_async 呼叫"""
+
+    def __init__(self, conversation_manager, concurrency_limit=4, max_queue=64):
+        self.manager = conversation_manager
+        self.admission = AdmissionControl(concurrency_limit, max_queue)
+
+    def validate(self, request):
+        """檢查場景與難度；回傳 (錄音, 工作階段ID)，不合法時拋出 ValueError"""
+        from processors import DIFFICULTY_CONFIGS
+
+        if request.scenario != FREE_CONVERSATION_SCENARIO and request.scenario not in get_scenario_index():
+            raise ValueError(f"未知的場景: {request.scenario}")
+        if request.difficulty not in DIFFICULTY_CONFIGS:
+            raise ValueError(f"未知的難度: {request.difficulty}")
+        audio = decode_audio(request.audio, request.audio_format, request.sample_rate)
+        return audio, api_session_id(request.session_id)
+
+    async def analyze(self, request, audio, session_id, on_event=None):
+        """執行分析並回傳 JSON 可用的結果（呼叫前需先通過 admission.try_enter）"""
+        start = time.perf_counter()
+        await self.admission.acquire()
+        try:
+            conversation_context = request.conversation_context
+            if conversation_context is None:
+                conversation_context = self.manager.get_conversation_context(session_id=session_id)
+            result = await self.manager.process_user_input_async(
+                audio,
+                request.scenario,
+                conversation_context=conversation_context,
+                difficulty=request.difficulty,
+                pronunciation_focus=request.pronunciation_focus,
+                accent_preference=request.accent_preference,
+                feedback_detail=request.feedback_detail,
+                show_comparison=request.show_comparison,
+                session_id=session_id,
+                track_progress=request.track_progress,
+                focus_area=request.focus_area,
+                on_event=on_event
+            )
+        finally:
+            self.admission.release()
+
+        result = to_jsonable(result)
+        result["session_id"] = session_id
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def readiness(self):
+        model_manager = self.manager.audio_processor.model_manager
+        if hasattr(model_manager, "get_readiness"):
+            return model_manager.get_readiness()
+        return {"ready": getattr(model_manager, "whisper_model", None) is not None, "loaded": True}
+
+    def health(self):
+        model_manager = self.manager.audio_processor.model_manager
+        return {
+            "status": "ok",
+            "whisper": getattr(model_manager, "whisper_model", None) is not None,
+            "audio_llm": bool(getattr(model_manager, "use_audio_llm", False)),
+            "readiness": self.readiness(),
+            "active_requests": self.manager.active_requests,
+            "admission": self.admission.get_stats()
+        }
+
+
+def create_status_router(service):
+    """健康檢查與就緒檢查（不需權杖）；介面單獨啟動時也掛上這兩個端點"""
+    router = APIRouter()
+
+    @router.get("/api/health")
+    def health():
+        return service.health()
+
+    @router.get("/api/ready")
+    def ready():
+        readiness = service.readiness()
+        return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+    return router
+
+
+def create_api_app(conversation_manager=None, concurrency_limit=4, max_queue=64, auth_token=None):
+    """建立 FastAPI 應用；可單獨執行，或由 app.py 掛上 Gradio 介面共用同一程序
+
+    auth_token 為 None 時使用環境變數 API_AUTH_TOKEN；兩者皆未設定時不驗證
+    """
+    if conversation_manager is None:
+        from processors import get_conversation_manager
+        conversation_manager = get_conversation_manager()
+    if auth_token is None:
+        auth_token = os.environ.get("API_AUTH_TOKEN") or None
+
+    service = InferenceService(conversation_manager, concurrency_limit, max_queue)
+    api = FastAPI(title="語言學習助教 API")
+    api.state.service = service
+
+    def require_token(request: Request):
+        if not token_matches(auth_token, request.headers.get("authorization")):
+            raise HTTPException(status_code=401, detail="缺少或錯誤的 API 權杖")
+
+    api.include_router(create_status_router(service))
+
+    @api.get("/api/scenarios", dependencies=[Depends(require_token)])
+    def scenarios():
+        from processors import DIFFICULTY_CONFIGS
+        return {
+            "scenarios": list(get_scenario_index().names) + [FREE_CONVERSATION_SCENARIO],
+            "difficulties": list(DIFFICULTY_CONFIGS)
+        }
+
+    @api.post("/api/analyze", response_model=AnalysisResponse, dependencies=[Depends(require_token)])
+    async def analyze(request: AnalysisRequest):
+        try:
+            audio, session_id = service.validate(request)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not service.admission.try_enter():
+            raise HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
+        return await service.analyze(request, audio, session_id)
+
+    @api.websocket("/api/analyze/stream")
+    async def analyze_stream(websocket: WebSocket):
+        """同一連線可依序送出多個請求；每個請求回傳 accepted、分析事件與 result"""
+        if not token_matches(auth_token, websocket.headers.get("authorization"), websocket.query_params.get("token")):
+            await websocket.close(code=1008)
+            return
+        await websocket.accept()
+        try:
+            while True:
+                message = await websocket.receive_json()
+                try:
+                    request = AnalysisRequest(**message)
+                    audio, session_id = service.validate(request)
+                except (ValidationError, ValueError, TypeError) as e:
+                    await websocket.send_json({"type": "error", "message": str(e)})
+                    continue
+                if not service.admission.try_enter():
+                    await websocket.send_json({"type": "error", "message": "伺服器忙碌中，請稍後再試"})
+                    continue
+
+                await websocket.send_json({
+                    "type": "accepted", "session_id": session_id, "queue_position": service.admission.waiting
+                })
+                # 分析事件由事件迴圈依序排入，分析結束後放入None作為結尾
+                events = asyncio.Queue()
+                task = asyncio.ensure_future(service.analyze(request, audio, session_id, on_event=events.put_nowait))
+                task.add_done_callback(lambda _: events.put_nowait(None))
+                while True:
+                    event = await events.get()
+                    if event is None:
+                        break
+                    await websocket.send_json({"type": event.type, "data": to_jsonable(event.data)})
+
+                if task.exception() is not None:
+                    await websocket.send_json({"type": "error", "message": f"處理過程出錯: {task.exception()}"})
+                else:
+                    await websocket.send_json({"type": "result", "result": task.result()})
+        except WebSocketDisconnect:
+            pass
+
+    return api
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="無介面的推論 API 服務")
+    parser.add_argument("--host", default="127.0.0.1", help="監聽位址（對外開放時請設定 API_AUTH_TOKEN）")
+    parser.add_argument("--port", type=int, default=8000, help="監聽埠號")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時處理的分析請求數")
+    parser.add_argument("--max-queue", type=int, default=64, help="等候中的請求上限，超過時回傳 503")
+    parser.add_argument("--token", default=os.environ.get("API_AUTH_TOKEN"), help="API 權杖（預設讀取 API_AUTH_TOKEN）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import uvicorn
+
+    args = parse_args(argv)
+    print("=== 啟動語言學習助教 API（無介面）===")
+    from processors import get_conversation_manager
+    # 先開始服務，模型在背景載入；載入期間 /api/ready 回傳 503，分析請求排隊等待
+    conversation_manager = get_conversation_manager(config={"models": {"load_in_background": True}})
+    model_manager = conversation_manager.audio_processor.model_manager
+    model_manager.when_loaded(lambda: print(f"✅ 模型載入完成: {model_manager.get_readiness()['models']}"))
+    if not args.token and args.host not in ("127.0.0.1", "localhost"):
+        print(f"⚠️  API 未設定權杖且監聽 {args.host}，任何人都可以呼叫分析端點")
+    api = create_api_app(conversation_manager, concurrency_limit=args.concurrency, max_queue=args.max_queue,
+                         auth_token=args.token or "")
+    uvicorn.run(api, host=args.host, port=args.port)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
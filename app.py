@@ -6,16 +6,22 @@ app.py - 語言學習助教
 import os
 import datetime
 import gradio as gr
-import random
 import numpy as np
 from PIL import Image
 import wave
 import struct
+import asyncio
 
-from models import get_model_manager
 from processors import get_conversation_manager
-
-for dir_name in ["scenario_images", "temp_audio", "user_recordings", "generations"]:
+from session_store import DEFAULT_SESSION_ID
+from tracing import get_tracer
+from profiling import get_request_profiler, install_signal_handler, DEFAULT_PROFILE_REQUESTS
+from scenario_catalog import get_scenario_index
+from streaming_asr import StreamingTranscriber
+from acoustic_scoring import SAMPLE_RATE
+from response_parser import EVENT_SCORE, EVENT_ANALYSIS_DELTA, EVENT_RESPONSE_DELTA, EVENT_SUGGESTION
+
+for dir_name in ["scenario_images", "temp_audio", "generations"]:
     if not os.path.exists(dir_name):
         os.makedirs(dir_name)
 
@@ -32,139 +38,93 @@ def load_css_file(css_file_path):
 
 css_content = load_css_file("styles.css")
 
-scenario_examples = [
-    {
-        "name": "機場對話",
-        "image_path": "scenario_images/airport.jpg",
-        "preview_text": "練習機場通關、登機和問詢的對話",
-        "scenario": "機場對話 (Airport Conversation)",
-        "icon": "✈️"
-    },
-    {
-        "name": "餐廳點餐",
-        "image_path": "scenario_images/restaurant.jpg",
-        "preview_text": "練習餐廳點餐、詢問菜單和結帳的對話",
-        "scenario": "餐廳點餐 (Restaurant Ordering)",
-        "icon": "🍽️"
-    },
-    {
-        "name": "求職面試",
-        "image_path": "scenario_images/interview.jpg",
-        "preview_text": "練習工作面試中的自我介紹和問答",
-        "scenario": "求職面試 (Job Interview)",
-        "icon": "💼"
-    },
-    {
-        "name": "日常社交",
-        "image_path": "scenario_images/socializing.jpg",
-        "preview_text": "練習日常問候、閒聊和社交對話",
-        "scenario": "日常社交 (Daily Social Conversation)",
-        "icon": "🤝"
-    },
-    {
-        "name": "醫療諮詢",
-        "image_path": "scenario_images/medical.jpg",
-        "preview_text": "練習在診所或醫院的醫療對話",
-        "scenario": "醫療諮詢 (Medical Consultation)",
-        "icon": "🏥"
-    },
-    {
-        "name": "學術討論",
-        "image_path": "scenario_images/academic.jpg",
-        "preview_text": "練習課堂或研討會的學術討論",
-        "scenario": "學術討論 (Academic Discussion)",
-        "icon": "📚"
-    }
-]
-
-scenario_presets = {
-    "機場對話 (Airport Conversation)": {
-        "description": "在機場通關、護照檢查和登機的相關對話情境",
-        "roles": {
-            "assistant": "機場工作人員/海關人員",
-            "user": "旅客"
-        },
-        "sample_dialog": {
-            "assistant": "Good morning. Passport please?",
-            "user": "Good morning. Here is my passport.",
-            "next_prompt": "Thank you. Where are you traveling to today?"
-        }
-    },
-    "餐廳點餐 (Restaurant Ordering)": {
-        "description": "在餐廳點餐、詢問菜單和結帳的對話情境",
-        "roles": {
-            "assistant": "服務生/餐廳工作人員",
-            "user": "顧客"
-        },
-        "sample_dialog": {
-            "assistant": "Hello, welcome to our restaurant. Are you ready to order?",
-            "user": "Hi, yes. Could I see the menu please?",
-            "next_prompt": "Of course, here's our menu. Today's special is grilled salmon with vegetables."
-        }
-    },
-    "求職面試 (Job Interview)": {
-        "description": "求職面試中的自我介紹和問答情境",
-        "roles": {
-            "assistant": "面試官/招聘人員",
-            "user": "求職者"
-        },
-        "sample_dialog": {
-            "assistant": "Thank you for coming in today. Could you tell us a bit about yourself?",
-            "user": "Thank you for having me. I graduated from...",
-            "next_prompt": "That's interesting. What would you say are your greatest strengths?"
-        }
-    },
-    "日常社交 (Daily Social Conversation)": {
-        "description": "日常問候、閒聊和社交對話情境",
-        "roles": {
-            "assistant": "朋友/同事",
-            "user": "您自己"
-        },
-        "sample_dialog": {
-            "assistant": "Hey there! How's your day going so far?",
-            "user": "Hi! It's going well, thanks for asking. How about yours?",
-            "next_prompt": "Pretty good! I just got back from that new coffee shop downtown."
-        }
+# 場景卡片在介面建立時決定；角色與範例對話在選擇場景時才從目錄讀取，修改資料檔即可生效
+scenario_examples = get_scenario_index().examples
+
+print("正在初始化系統...")
+GPU_MEMORY_LIMIT = 20     # 可設為單一數值，或 {0: 20, 1: 12} 針對每張GPU個別設定
+CPU_OFFLOAD_GB = 8        # GPU預算不足時，Qwen2-Audio可卸載到CPU的記憶體
+QWEN_AUDIO_SIZE_GB = None # Qwen2-Audio權重大小（GB）；None 時由模型設定估算
+INFERENCE_RESERVE_GB = 2  # 每張GPU保留給activation/KV cache的空間（GB）
+STAGE_CONCURRENCY = {"asr": 1, "audio_llm": 1}   # 各模型階段同時執行的呼叫數
+AUDIO_CONCURRENCY_LIMIT = 4   # 同時處理的錄音分析請求（預設場景與自由對話共用）
+UI_CONCURRENCY_LIMIT = 16     # 其他介面事件的並行上限
+QUEUE_MAX_SIZE = 64           # 等候中的請求上限，佇列已滿時新請求會被拒絕
+RECORDING_MAX_MB = 2048       # 保留錄音與暫存音檔的總容量上限
+RECORDING_MAX_AGE_DAYS = 14   # 錄音保存天數
+EXPORT_FILE_TTL_MINUTES = 60  # 學習歷程匯出檔在完成後保留的時間
+GRADIO_CACHE_SECONDS = 3600   # Gradio 上傳暫存檔的保留時間（同時為清理間隔）
+LOAD_MODELS_IN_BACKGROUND = True   # 先啟動介面與健康檢查，模型在背景載入；Whisper就緒前提交按鈕停用
+READINESS_POLL_SECONDS = 2    # 狀態卡的更新間隔（模型全部載入後放慢為 STATUS_POLL_SECONDS）
+STATUS_POLL_SECONDS = 15
+LIVE_ENDPOINT_SILENCE_SECONDS = 1.2   # 即時模式：說話後靜音多久視為回答結束（太短會在思考停頓時截斷回答）
+SERVE_HTTP_API = False        # True 時同一程序同時提供 /api 推論端點（見 api_server.py，權杖由 API_AUTH_TOKEN 設定）；預設使用 demo.launch 並開啟 share 連結
+conversation_manager = get_conversation_manager(config={
+    "models": {
+        "gpu_memory_limit": GPU_MEMORY_LIMIT,
+        "cpu_offload_gb": CPU_OFFLOAD_GB,
+        "qwen_audio_size_gb": QWEN_AUDIO_SIZE_GB,
+        "inference_reserve_gb": INFERENCE_RESERVE_GB,
+        "stage_concurrency": STAGE_CONCURRENCY,
+        "load_in_background": LOAD_MODELS_IN_BACKGROUND
     },
-    "醫療諮詢 (Medical Consultation)": {
-        "description": "在診所或醫院與醫生進行病情諮詢的對話",
-        "roles": {
-            "assistant": "醫生/護士",
-            "user": "病人"
-        },
-        "sample_dialog": {
-            "assistant": "Good afternoon. What seems to be the problem today?",
-            "user": "I've been having a headache for three days.",
-            "next_prompt": "I see. Can you describe the pain and when it started?"
-        }
+    "recordings": {
+        "max_bytes": RECORDING_MAX_MB * 1024 ** 2,
+        "max_age_days": RECORDING_MAX_AGE_DAYS,
+        "sweep_dirs": ("temp_audio", "generations")
     },
-    "學術討論 (Academic Discussion)": {
-        "description": "課堂或研討會中的學術討論和問答",
-        "roles": {
-            "assistant": "教授/演講者",
-            "user": "學生/聽眾"
-        },
-        "sample_dialog": {
-            "assistant": "The research shows significant results in this area. Does anyone have questions?",
-            "user": "Yes, I'm wondering about the methodology used in the study.",
-            "next_prompt": "That's a good question. The methodology involved a mixed-methods approach..."
-        }
+    "exports": {
+        "file_ttl_seconds": EXPORT_FILE_TTL_MINUTES * 60
     }
-}
-
-print("正在初始化系統...")
-GPU_MEMORY_LIMIT = 20
-model_manager = get_model_manager(gpu_memory_limit=GPU_MEMORY_LIMIT)
-conversation_manager = get_conversation_manager()
-device_info = model_manager.get_device_info()
-
-print(f"🔒 GPU記憶體限制: {GPU_MEMORY_LIMIT}GB")
-print(f"📊 當前記憶體使用: {device_info.get('current_memory_usage', 0):.2f}GB")
+})
+recording_store = conversation_manager.recording_store
+model_manager = conversation_manager.audio_processor.model_manager
+
+print(f"🔒 GPU記憶體限制: {GPU_MEMORY_LIMIT}GB, CPU卸載額度: {CPU_OFFLOAD_GB}GB")
+
+MAX_HISTORY_DISPLAY = 20
+
+def get_session(request):
+    """依 Gradio session 取得使用者的工作階段狀態"""
+    session_id = request.session_hash if request is not None else None
+    return conversation_manager.get_session(session_id or DEFAULT_SESSION_ID)
+
+def get_learner_id(request):
+    """目前分頁連結的學習者代號（學習進度、儀表板與匯出以此為鍵）"""
+    return conversation_manager.get_learner_id(get_session(request).session_id)
+
+# Gradio session 每次重新整理頁面都會改變；學習紀錄金鑰（128 位元隨機值）保存在瀏覽器 localStorage，
+# 重新開啟頁面時讀回並連結，學習紀錄才會累積到同一位學習者。金鑰就是存取學習紀錄的憑證，
+# 在其他裝置輸入相同金鑰即可接續；crypto.getRandomValues 在非 HTTPS 的頁面也可使用
+LEARNER_STORAGE_KEY = "language_tutor_learner_key"
+LOAD_LEARNER_JS = f"""
+(current) => {{
+    let learnerKey = localStorage.getItem("{LEARNER_STORAGE_KEY}");
+    if (!learnerKey) {{
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        learnerKey = Array.from(bytes, (b) => b.toString(16).padStart(2, "0")).join("");
+        localStorage.setItem("{LEARNER_STORAGE_KEY}", learnerKey);
+    }}
+    return learnerKey;
+}}
+"""
+SAVE_LEARNER_JS = f"""
+(learnerKey) => {{
+    learnerKey = (learnerKey || "").trim().toLowerCase();
+    if (/^[0-9a-f]{{32,128}}$/.test(learnerKey)) {{
+        localStorage.setItem("{LEARNER_STORAGE_KEY}", learnerKey);
+    }}
+    return learnerKey;
+}}
+"""
 
-# 全域變數
-current_scenario_name = "機場對話 (Airport Conversation)"
-current_language = "英文 (English)"
-current_difficulty = "初級 (TOEIC 405-600分)"
+def attach_learner(learner_key, request: gr.Request):
+    """以學習紀錄金鑰將目前分頁連結到學習者；金鑰不合法時維持原本的連結"""
+    try:
+        learner_id = conversation_manager.attach_learner(get_session(request).session_id, learner_key)
+    except ValueError as e:
+        return gr.update(), f"❌ {e}"
+    return learner_key.strip().lower(), f"👤 已連結學習紀錄 {learner_id}"
 
 def ensure_scenario_images():
     for example in scenario_examples:
@@ -184,6 +144,78 @@ def ensure_scenario_images():
             img.save(image_path)
             print(f"已創建佔位圖片: {image_path}")
 
+MODEL_STATUS_LABELS = {"pending": "等待中", "loading": "載入中", "ready": "✅", "failed": "❌", "skipped": "略過"}
+
+def render_status_card():
+    """狀態卡 HTML：模型載入期間顯示進度，之後顯示目前的設備與記憶體狀態"""
+    device_info = model_manager.get_device_info()
+    readiness = model_manager.get_readiness()
+    
+    if device_info["use_gpu"]:
+        current_usage = device_info.get('current_memory_usage', 0)
+        status_html = f"""
+        <div style="display: flex; align-items: center; gap: 20px; flex-wrap: wrap;">
+            <div style="display: flex; align-items: center; gap: 8px;">
+                <span style="font-size: 1.2rem;">🚀</span>
+                <strong>GPU加速已啟用</strong>
+                <span style="color: #666;">- {device_info['gpu_name']} ({device_info['gpu_memory']:.1f}GB)</span>
+            </div>
+            <div style="display: flex; align-items: center; gap: 8px;">
+                <span style="font-size: 1.2rem;">💾</span>
+                <strong>記憶體使用:</strong>
+                <span style="color: #4CAF50; font-weight: 600;">{current_usage:.2f}GB / {device_info['memory_limit_gb']}GB</span>
+            </div>
+        """
+        if device_info["use_audio_llm"]:
+            status_html += """
+            <div style="display: flex; align-items: center; gap: 8px;">
+                <span style="font-size: 1.2rem;">✅</span>
+                <strong>Audio-LLM已載入</strong>
+            </div>
+            """
+        else:
+            status_html += """
+            <div style="display: flex; align-items: center; gap: 8px;">
+                <span style="font-size: 1.2rem;">⚠️</span>
+                <strong>Audio-LLM未載入</strong>
+                <span style="color: #666;">(使用簡化分析)</span>
+            </div>
+            """
+        status_html += "</div>"
+    else:
+        status_html = """
+        <div style="display: flex; align-items: center; gap: 8px;">
+            <span style="font-size: 1.2rem;">💻</span>
+            <strong>使用CPU模式</strong>
+        </div>
+        """
+    
+    if not readiness["loaded"]:
+        models = "，".join(f"{name} {MODEL_STATUS_LABELS.get(state, state)}" for name, state in readiness["models"].items())
+        status_html += f"""
+        <div style="display: flex; align-items: center; gap: 8px; margin-top: 8px;">
+            <span style="font-size: 1.2rem;">⏳</span>
+            <strong>模型載入中 {readiness['progress']:.0%}</strong>
+            <span style="color: #666;">{models}（已耗時 {readiness['elapsed_seconds']:.0f} 秒）</span>
+        </div>
+        """
+    elif readiness["error"]:
+        status_html += f"""
+        <div style="display: flex; align-items: center; gap: 8px; margin-top: 8px;">
+            <span style="font-size: 1.2rem;">❌</span>
+            <strong>模型載入失敗</strong>
+            <span style="color: #666;">{readiness['error']}</span>
+        </div>
+        """
+    return status_html
+
+def refresh_model_readiness():
+    """定期更新狀態卡；Whisper就緒前停用提交與錄音，全部載入後降低更新頻率"""
+    readiness = model_manager.get_readiness()
+    ready = gr.update(interactive=readiness["ready"])
+    interval = STATUS_POLL_SECONDS if readiness["loaded"] else READINESS_POLL_SECONDS
+    return render_status_card(), ready, ready, ready, ready, gr.Timer(interval)
+
 def get_memory_status():
     try:
         status = model_manager.get_memory_status()
@@ -196,7 +228,8 @@ def get_memory_status():
             
             if gpu_info:
                 for gpu_id, info in gpu_info.items():
-                    usage_status = "🔴" if info['reserved'] > limits.get('gpu_limit_gb', 20) * 0.8 else "🟢"
+                    gpu_limit = info.get('limit') or info['total']
+                    usage_status = "🔴" if info['reserved'] > gpu_limit * 0.8 else "🟢"
                     status_text += f"{usage_status} {gpu_id}: {info['reserved']:.2f}GB / {info['total']:.2f}GB ({info['usage_percent']:.1f}%)\n"
             
             if cpu_info:
@@ -205,7 +238,12 @@ def get_memory_status():
                 status_text += f"🖥️  系統記憶體: {cpu_info['used']:.2f}GB / {cpu_info['total']:.2f}GB ({cpu_info['percent']:.1f}%)\n"
             
             status_text += f"\n設定限制:\n"
-            status_text += f"GPU限制: {limits.get('gpu_limit_gb', 'N/A')}GB\n"
+            gpu_limits = limits.get('gpu_limits_gb') or {}
+            if gpu_limits:
+                for gpu_id, gpu_limit in gpu_limits.items():
+                    status_text += f"GPU限制 ({gpu_id}): {gpu_limit}GB\n"
+            else:
+                status_text += f"GPU限制: {limits.get('gpu_limit_gb', 'N/A')}GB\n"
             status_text += f"CPU限制: {limits.get('cpu_limit_gb', 'N/A')}GB\n"
             status_text += f"監控狀態: {'✅ 運行中' if status.get('monitoring', False) else '❌ 未運行'}"
             
@@ -215,23 +253,79 @@ def get_memory_status():
     except Exception as e:
         return f"獲取記憶體狀態失敗: {str(e)}"
 
-def get_system_stats():
+def get_system_stats(request: gr.Request):
+    session = get_session(request)
+    device_info = model_manager.get_device_info()
+    dashboard = conversation_manager.get_progress_dashboard(get_learner_id(request))
     stats = {
-        "📊 總對話次數": len(conversation_manager.conversation_history),
+        "📊 總練習回合": dashboard["turns"],
         "🎤 Whisper狀態": "✅ 已載入" if device_info["whisper_available"] else "❌ 未載入",
         "🧠 Audio-LLM狀態": "✅ 已載入" if device_info["use_audio_llm"] else "❌ 未載入",
         "🚀 GPU加速": "✅ 已啟用" if device_info["use_gpu"] else "❌ 使用CPU",
-        "🎭 當前場景": current_scenario_name,
-        "🌍 學習語言": current_language,
-        "📊 難度級別": current_difficulty,
+        "🎭 當前場景": session.scenario,
+        "🌍 學習語言": session.language,
+        "📊 難度級別": session.difficulty,
+        "👥 活躍工作階段": conversation_manager.sessions.get_stats()["active_sessions"],
         "💾 記憶體使用": f"{device_info.get('current_memory_usage', 0):.2f}GB / {device_info.get('memory_limit_gb', 0)}GB"
     }
+    
+    readiness = model_manager.get_readiness()
+    if not readiness["loaded"]:
+        stats["⏳ 模型載入"] = f"{readiness['progress']:.0%}，已耗時 {readiness['elapsed_seconds']:.0f} 秒 ({readiness['models']})"
+    
+    gate_stats = conversation_manager.audio_processor.analysis_gate.get_stats()
+    stats["🚦 略過Audio-LLM比例"] = f"{gate_stats['gating_rate']:.0%} ({gate_stats['local']}/{gate_stats['total']})"
+    stats["🚦 Audio-LLM呼叫原因"] = gate_stats["reasons"]
+    
+    stats["🚦 模型階段佇列"] = {
+        name: f"執行中 {stage['active']}/{stage['limit']}，等待 {stage['waiting']}，平均等待 {stage['avg_wait_ms']:.0f}ms"
+        for name, stage in model_manager.get_stage_stats().items()
+    }
+    
+    cache_stats = conversation_manager.audio_processor.analysis_cache.get_stats()
+    pregenerated_stats = conversation_manager.audio_processor.pregenerated_turns.get_stats()
+    stats["🌙 預先生成回合"] = f"{pregenerated_stats['entries']} 個，命中率 {pregenerated_stats['hit_rate']:.0%} ({pregenerated_stats['hits']}/{pregenerated_stats['hits'] + pregenerated_stats['misses']})"
+    if conversation_manager.pregenerator is not None:
+        stats["🌙 預先生成狀態"] = conversation_manager.pregenerator.status
+    stats["⚡ 分析快取命中率"] = f"{cache_stats['hit_rate']:.0%} ({cache_stats['hits']}/{cache_stats['hits'] + cache_stats['misses']})，{cache_stats['entries']} 筆"
+    
+    recording_stats = recording_store.get_stats()
+    stats["💽 錄音保存"] = f"已保存 {recording_stats['saved']} 個，使用 {recording_stats['managed_mb']:.0f}/{recording_stats['max_mb']:.0f}MB，已清理 {recording_stats['deleted']} 個"
+    
+    trace_stats = get_tracer().get_stats()
+    stats["🔍 請求追蹤"] = f"取樣率 {trace_stats['sample_rate']:.0%}，已追蹤 {trace_stats['sampled_requests']} 個請求"
+    
+    if dashboard["turns"]:
+        pronunciation, fluency = dashboard["pronunciation"], dashboard["fluency"]
+        stats["📈 平均分數"] = f"發音 {pronunciation['mean']} / 流暢度 {fluency['mean']}"
+        stats["📈 最近 {} 回合".format(dashboard["window"])] = (
+            f"發音 {pronunciation['moving_average']} ({pronunciation['recent_slope']:+.1f}/回合) / "
+            f"流暢度 {fluency['moving_average']} ({fluency['recent_slope']:+.1f}/回合)"
+        )
+        stats["📈 各場景平均"] = {
+            name: f"發音 {scenario['avg_pronunciation']} / 流暢度 {scenario['avg_fluency']} ({scenario['count']}次)"
+            for name, scenario in dashboard["scenarios"].items()
+        }
     return stats
 
-def update_language_difficulty(language, difficulty):
-    global current_language, current_difficulty
-    current_language = language
-    current_difficulty = difficulty
+def format_profiler_status():
+    status = get_request_profiler().get_status()
+    text = f"待剖析請求: {status['remaining']}，已擷取: {status['captured']}\n"
+    text += f"輸出資料夾: {status['output_dir']}"
+    if status["last_output"]:
+        text += f"\n最近一次: {status['last_output']}"
+    return text
+
+def start_request_profiling(count):
+    get_request_profiler().arm(count)
+    return format_profiler_status()
+
+def stop_request_profiling():
+    get_request_profiler().disarm()
+    return format_profiler_status()
+
+def update_language_difficulty(language, difficulty, request: gr.Request):
+    get_session(request).update_settings(language=language, difficulty=difficulty)
     return f"✅ 已設定語言: {language}, 難度: {difficulty}"
 
 def show_preset_mode():
@@ -264,14 +358,13 @@ def back_to_initial():
         "initial"
     )
 
-def select_scenario(example_index):
-    global current_scenario_name
+def select_scenario(example_index, request: gr.Request):
     
     selected = scenario_examples[example_index]
     preset_name = selected["scenario"]
-    preset = scenario_presets[preset_name]
+    preset = get_scenario_index().presets[preset_name]
     
-    current_scenario_name = preset_name
+    get_session(request).update_settings(scenario=preset_name)
 
     return (
         gr.update(visible=False),
@@ -294,124 +387,210 @@ def start_free_conversation(scenario_text):
         gr.update(visible=True)
     )
 
-def process_user_audio(audio_path, language, difficulty, focus_area, feedback_detail,
-                      pronunciation_focus, accent_preference, track_progress, show_comparison):
-    """處理用戶音頻 - 完整整合進階功能"""
-    if audio_path is None:
-        return "", "請先錄製您的回應", 0, 0, "", [], ""
+def format_audio_info(audio):
+    """錄音的取樣率與長度（audio 為 Gradio 的 (取樣率, 樣本) 或 16kHz 波形）"""
+    sample_rate, data = audio if isinstance(audio, tuple) else (SAMPLE_RATE, audio)
+    return f"{sample_rate}Hz, {len(data) / sample_rate:.1f} 秒"
+
+async def process_user_audio(audio, language, difficulty, focus_area, feedback_detail,
+                      pronunciation_focus, accent_preference, track_progress, show_comparison,
+                      history, request: gr.Request):
+    """處理用戶音頻 - 完整整合進階功能，生成過程中逐段更新介面"""
+    async for update in analyze_user_audio(
+        audio, None, language, difficulty, focus_area, feedback_detail,
+        pronunciation_focus, accent_preference, track_progress, show_comparison, history, request
+    ):
+        yield update
+
+async def analyze_user_audio(audio, transcription, language, difficulty, focus_area, feedback_detail,
+                             pronunciation_focus, accent_preference, track_progress, show_comparison,
+                             history, request):
+    """預設場景的分析流程；錄音以記憶體中的波形傳入，transcription 為串流辨識的結果時略過語音識別"""
+    if audio is None:
+        yield "", "請先錄製您的回應", 0, 0, "", history, ""
+        return
 
     try:
-        print(f"處理音頻文件: {audio_path}")
+        print(f"處理音頻: {format_audio_info(audio)}")
         print(f"使用語言設定: {language}")
         print(f"使用難度設定: {difficulty}")
         print(f"發音重點: {pronunciation_focus}")
         print(f"口音偏好: {accent_preference}")
         print(f"回饋級別: {feedback_detail}")
         
-        conversation_context = conversation_manager.get_conversation_context()
+        session = get_session(request)
+        scenario = session.scenario
+        conversation_context = conversation_manager.get_conversation_context(session_id=session.session_id)
         
-        result = conversation_manager.process_user_input(
-            audio_path=audio_path, 
-            scenario=current_scenario_name, 
-            conversation_context=conversation_context,
-            difficulty=difficulty,
-            pronunciation_focus=pronunciation_focus,
-            accent_preference=accent_preference,
-            feedback_detail=feedback_detail,
-            show_comparison=show_comparison,
-            track_progress=track_progress,
-            focus_area=focus_area
-        )
+        # 排隊位置與預估時間由 Gradio 佇列顯示（demo.queue 的 status_update_rate）
+        if not model_manager.is_ready():
+            yield (
+                gr.update(), "⏳ 模型載入中，載入完成後會自動開始分析...",
+                gr.update(), gr.update(), gr.update(), gr.update(), gr.update()
+            )
         
-        if not result["success"]:
-            return "", result["error_message"], 0, 0, "", [], ""
+        events = asyncio.Queue()
         
-        suggested_text = ""
-        if result.get("suggested_responses"):
-            suggested_text = "💡 建議回覆句子：\n"
-            for i, suggestion in enumerate(result["suggested_responses"][:3], 1):
-                suggested_text += f"{i}. {suggestion}\n"
+        async def run_pipeline():
+            with get_tracer().span("process_user_audio", scenario=scenario, difficulty=difficulty,
+                                   feedback_detail=feedback_detail):
+                return await conversation_manager.process_user_input_async(
+                    audio_path=audio, 
+                    scenario=scenario, 
+                    conversation_context=conversation_context,
+                    difficulty=difficulty,
+                    pronunciation_focus=pronunciation_focus,
+                    accent_preference=accent_preference,
+                    feedback_detail=feedback_detail,
+                    show_comparison=show_comparison,
+                    track_progress=track_progress,
+                    focus_area=focus_area,
+                    transcription=transcription,
+                    on_event=events.put_nowait,
+                    session_id=session.session_id
+                )
         
-        if feedback_detail == "基本回饋":
-            feedback = f"您說的是：'{result['recognized_text']}'\n發音得分：{result['pronunciation_score']}/100"
-        elif feedback_detail == "詳細回饋":
-            feedback = f"您說的是：'{result['recognized_text']}'\n\n發音分析：\n{result['pronunciation_analysis'][:400]}..."
-        else:
-            feedback = f"您說的是：'{result['recognized_text']}'\n\n詳細發音分析：\n{result['pronunciation_analysis']}"
-
-        if pronunciation_focus:
-            additional_tips = []
-            if "子音發音" in pronunciation_focus:
-                additional_tips.append("💡 注意子音的清晰發音")
-            if "母音發音" in pronunciation_focus:
-                additional_tips.append("💡 練習母音的準確度")
-            if "語調" in pronunciation_focus:
-                additional_tips.append("💡 注意語調的起伏變化")
-            if "連音" in pronunciation_focus:
-                additional_tips.append("💡 練習自然的連音技巧")
-            if "重音" in pronunciation_focus:
-                additional_tips.append("💡 掌握重音模式")
-            if "節奏" in pronunciation_focus:
-                additional_tips.append("💡 控制說話節奏")
+        pipeline = asyncio.ensure_future(run_pipeline())
+        pipeline.add_done_callback(lambda _: events.put_nowait(None))
+        
+        partial_score = 0
+        partial_analysis = ""
+        partial_response = ""
+        partial_suggestions = []
+        
+        while True:
+            event = await events.get()
+            if event is None:
+                break
             
-            if additional_tips:
-                feedback += "\n\n🎯 重點提醒：\n" + "\n".join(additional_tips)
-
-        if accent_preference != "不指定":
-            feedback += f"\n\n🌍 口音提醒：建議關注{accent_preference}的發音特點"
-
-        history_entry = {
-            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "scenario": current_scenario_name,
-            "difficulty": difficulty,
-            "score": result["pronunciation_score"],
-            "feedback": feedback[:50] + "..." if len(feedback) > 50 else feedback
-        }
-
-        history = [history_entry]
-
-        return (
-            result["recognized_text"], 
-            feedback, 
-            result["pronunciation_score"], 
-            result["fluency_score"],
-            result["response_text"], 
-            history,
-            suggested_text
+            if event.type == EVENT_SCORE:
+                partial_score = event.data
+            elif event.type == EVENT_ANALYSIS_DELTA:
+                partial_analysis += event.data
+            elif event.type == EVENT_RESPONSE_DELTA:
+                partial_response += event.data
+            elif event.type == EVENT_SUGGESTION:
+                partial_suggestions.append(event.data)
+            
+            yield (
+                gr.update(),
+                f"發音分析（生成中）：\n{partial_analysis}",
+                partial_score,
+                gr.update(),
+                partial_response,
+                gr.update(),
+                format_suggested_responses(partial_suggestions, "💡 建議回覆句子：\n")
+            )
+        
+        yield format_user_audio_result(
+            pipeline.result(), scenario, difficulty, feedback_detail, pronunciation_focus, accent_preference,
+            history
         )
         
     except Exception as e:
         print(f"處理用戶音頻時出錯: {e}")
-        return "", f"處理過程出現錯誤: {str(e)}", 0, 0, "", [], ""
+        yield "", f"處理過程出現錯誤: {str(e)}", 0, 0, "", history, ""
+
+def format_suggested_responses(suggestions, header):
+    if not suggestions:
+        return ""
+    suggested_text = header
+    for i, suggestion in enumerate(suggestions[:3], 1):
+        suggested_text += f"{i}. {suggestion}\n"
+    return suggested_text
+
+def format_user_audio_result(result, scenario, difficulty, feedback_detail, pronunciation_focus, accent_preference,
+                             history=None):
+    """將處理結果整理為預設場景介面的輸出"""
+    history = history or []
+    if not result["success"]:
+        return "", result["error_message"], 0, 0, "", history, ""
+    
+    suggested_text = format_suggested_responses(result.get("suggested_responses"), "💡 建議回覆句子：\n")
+
+    if feedback_detail == "基本回饋":
+        feedback = f"您說的是：'{result['recognized_text']}'\n發音得分：{result['pronunciation_score']}/100"
+    elif feedback_detail == "詳細回饋":
+        feedback = f"您說的是：'{result['recognized_text']}'\n\n發音分析：\n{result['pronunciation_analysis'][:400]}..."
+    else:
+        feedback = f"您說的是：'{result['recognized_text']}'\n\n詳細發音分析：\n{result['pronunciation_analysis']}"
+
+    if pronunciation_focus:
+        additional_tips = []
+        if "子音發音" in pronunciation_focus:
+            additional_tips.append("💡 注意子音的清晰發音")
+        if "母音發音" in pronunciation_focus:
+            additional_tips.append("💡 練習母音的準確度")
+        if "語調" in pronunciation_focus:
+            additional_tips.append("💡 注意語調的起伏變化")
+        if "連音" in pronunciation_focus:
+            additional_tips.append("💡 練習自然的連音技巧")
+        if "重音" in pronunciation_focus:
+            additional_tips.append("💡 掌握重音模式")
+        if "節奏" in pronunciation_focus:
+            additional_tips.append("💡 控制說話節奏")
+        
+        if additional_tips:
+            feedback += "\n\n🎯 重點提醒：\n" + "\n".join(additional_tips)
+
+    if accent_preference != "不指定":
+        feedback += f"\n\n🌍 口音提醒：建議關注{accent_preference}的發音特點"
+
+    history_entry = {
+        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "scenario": scenario,
+        "difficulty": difficulty,
+        "score": result["pronunciation_score"],
+        "feedback": feedback[:50] + "..." if len(feedback) > 50 else feedback
+    }
+
+    history = (history + [history_entry])[-MAX_HISTORY_DISPLAY:]
 
-def process_free_user_audio(audio_path, language, difficulty, scenario_text, pronunciation_focus, 
-                           accent_preference, feedback_detail, show_comparison):
+    return (
+        result["recognized_text"], 
+        feedback, 
+        result["pronunciation_score"], 
+        result["fluency_score"],
+        result["response_text"], 
+        history,
+        suggested_text
+    )
+
+async def process_free_user_audio(audio, language, difficulty, scenario_text, pronunciation_focus, 
+                           accent_preference, feedback_detail, show_comparison, request: gr.Request):
     """處理自由對話音頻 - 完整整合進階功能"""
-    if audio_path is None:
+    return await analyze_free_user_audio(
+        audio, None, difficulty, scenario_text, pronunciation_focus,
+        accent_preference, feedback_detail, show_comparison, request
+    )
+
+async def analyze_free_user_audio(audio, transcription, difficulty, scenario_text, pronunciation_focus,
+                                  accent_preference, feedback_detail, show_comparison, request):
+    """自由對話的分析流程；錄音以記憶體中的波形傳入，transcription 為串流辨識的結果時略過語音識別"""
+    if audio is None:
         return "", "", ""
 
     try:
         print(f"自由對話處理 - 難度: {difficulty}, 發音重點: {pronunciation_focus}")
         
-        result = conversation_manager.process_user_input(
-            audio_path=audio_path, 
-            scenario="自由對話",
-            conversation_context=f"Context: {scenario_text}",
-            difficulty=difficulty,
-            pronunciation_focus=pronunciation_focus,
-            accent_preference=accent_preference,
-            feedback_detail=feedback_detail,
-            show_comparison=show_comparison
-        )
+        with get_tracer().span("process_free_user_audio", difficulty=difficulty, feedback_detail=feedback_detail):
+            result = await conversation_manager.process_user_input_async(
+                audio_path=audio, 
+                scenario="自由對話",
+                conversation_context=f"Context: {scenario_text}",
+                difficulty=difficulty,
+                pronunciation_focus=pronunciation_focus,
+                accent_preference=accent_preference,
+                feedback_detail=feedback_detail,
+                show_comparison=show_comparison,
+                transcription=transcription,
+                session_id=get_session(request).session_id
+            )
         
         if not result["success"]:
             return "", result["error_message"], ""
 
-        suggested_text = ""
-        if result.get("suggested_responses"):
-            suggested_text = "💡 建議接下來可以說：\n"
-            for i, suggestion in enumerate(result["suggested_responses"][:3], 1):
-                suggested_text += f"{i}. {suggestion}\n"
+        suggested_text = format_suggested_responses(result.get("suggested_responses"), "💡 建議接下來可以說：\n")
 
         return result["recognized_text"], result["response_text"], suggested_text
         
@@ -419,13 +598,114 @@ def process_free_user_audio(audio_path, language, difficulty, scenario_text, pro
         print(f"自由對話處理錯誤: {str(e)}")
         return "處理錯誤", "抱歉，處理您的語音時出現問題。請重試。", ""
 
-def update_history(history):
+def start_live_recording():
+    """開始即時錄音：為這次錄音建立新的串流辨識狀態"""
+    return StreamingTranscriber(model_manager, endpoint_silence=LIVE_ENDPOINT_SILENCE_SECONDS), ""
+
+def stream_live_audio(chunk, transcriber):
+    """接收麥克風串流片段並更新部分辨識結果；偵測到語句結束時觸發提交"""
+    if chunk is None or transcriber is None:
+        return gr.update(), transcriber, gr.update()
+    
+    sample_rate, data = chunk
+    ended = transcriber.feed(sample_rate, data)
+    if ended:
+        _, transcription = transcriber.result
+        text = transcription["text"] if transcription else ""
+        print(f"🎙️ 偵測到語句結束，最後一段辨識耗時 {transcriber.finalize_seconds * 1000:.0f}ms")
+        return text, transcriber, f"endpoint-{id(transcriber)}"
+    return transcriber.display_text(), transcriber, gr.update()
+
+def stop_live_recording(transcriber):
+    """停止錄音時，若尚未偵測到語句結束則以目前的錄音提交"""
+    if transcriber is None or transcriber.ended:
+        return gr.update()
+    return f"stopped-{id(transcriber)}"
+
+async def finish_live_transcription(transcriber):
+    """取得串流辨識的最終結果 (16kHz 波形, 辨識結果)；同一次錄音只提交一次，重複觸發時回傳None"""
+    if transcriber is None or getattr(transcriber, "submitted", False):
+        return None
+    transcriber.submitted = True
+    return await asyncio.get_running_loop().run_in_executor(None, transcriber.finish)
+
+async def process_live_audio(transcriber, language, difficulty, focus_area, feedback_detail,
+                             pronunciation_focus, accent_preference, track_progress, show_comparison,
+                             history, request: gr.Request):
+    """即時模式的預設場景提交"""
+    live_result = await finish_live_transcription(transcriber)
+    if live_result is None:
+        yield gr.update(), gr.update(), gr.update(), gr.update(), gr.update(), history, gr.update()
+        return
+    
+    waveform, transcription = live_result
+    if waveform is None:
+        yield "", "未偵測到語音，請再說一次", 0, 0, gr.update(), history, ""
+        return
+    if transcription is None:
+        yield "", "語音識別失敗，請重新錄製", 0, 0, gr.update(), history, ""
+        return
+    
+    async for update in analyze_user_audio(
+        waveform, transcription, language, difficulty, focus_area, feedback_detail,
+        pronunciation_focus, accent_preference, track_progress, show_comparison, history, request
+    ):
+        yield update
+
+async def process_free_live_audio(transcriber, language, difficulty, scenario_text, pronunciation_focus,
+                                  accent_preference, feedback_detail, show_comparison, request: gr.Request):
+    """即時模式的自由對話提交"""
+    live_result = await finish_live_transcription(transcriber)
+    if live_result is None:
+        return gr.update(), gr.update(), gr.update()
+    
+    waveform, transcription = live_result
+    if waveform is None:
+        return "", "未偵測到語音，請再說一次", ""
+    if transcription is None:
+        return "", "語音識別失敗，請重新錄製", ""
+    return await analyze_free_user_audio(
+        waveform, transcription, difficulty, scenario_text, pronunciation_focus,
+        accent_preference, feedback_detail, show_comparison, request
+    )
+
+def format_progress_dashboard(dashboard):
+    """學習進度儀表板的 Markdown"""
+    if not dashboard["turns"]:
+        return "尚無練習紀錄，完成第一次練習後會顯示進度分析"
+    
+    lines = [
+        f"**已練習 {dashboard['turns']} 回合**",
+        "",
+        f"| 指標 | 整體平均 | 最近 {dashboard['window']} 回合 | 指數平均 | 最佳 | 進步趨勢（最近 / 整體） |",
+        "|---|---|---|---|---|---|"
+    ]
+    for metric, label in (("pronunciation", "發音"), ("fluency", "流暢度")):
+        stats = dashboard[metric]
+        lines.append(
+            f"| {label} | {stats['mean']} | {stats['moving_average']} | {stats['ema']} | {stats['best']} | "
+            f"{stats['recent_slope']:+.1f} / {stats['slope']:+.2f} 分每回合 |"
+        )
+    
+    lines += ["", "| 場景 | 次數 | 發音平均 | 流暢度平均 |", "|---|---|---|---|"]
+    for name, scenario in sorted(dashboard["scenarios"].items(), key=lambda item: -item[1]["count"]):
+        lines.append(f"| {name} | {scenario['count']} | {scenario['avg_pronunciation']} | {scenario['avg_fluency']} |")
+    return "\n".join(lines)
+
+def update_history(history, request: gr.Request):
+    """學習歷程：最近練習場景的圖片、練習記錄與進度分析"""
+    dashboard_text = format_progress_dashboard(
+        conversation_manager.get_progress_dashboard(get_learner_id(request))
+    )
     if not history:
-        return [], []
+        return [], [], dashboard_text
 
-    gallery_images = []
-    for _ in range(min(len(history), 4)):
-        gallery_images.append(random.choice([e["image_path"] for e in scenario_examples]))
+    image_paths = {example["scenario"]: example["image_path"] for example in get_scenario_index().examples}
+    gallery_images = [
+        (image_paths[entry["scenario"]], f"{entry['scenario']} - {entry['score']}分")
+        for entry in reversed(history[-4:])
+        if entry["scenario"] in image_paths
+    ]
 
     history_data = [
         [
@@ -438,39 +718,51 @@ def update_history(history):
         for entry in history
     ]
 
-    return gallery_images, history_data
+    return gallery_images, history_data, dashboard_text
 
-def clear_conversation_history():
-    conversation_manager.clear_history()
+def clear_conversation_history(request: gr.Request):
+    get_session(request).clear_history()
     return "✅ 對話歷史已清除", []
 
-def export_conversation_history():
-    if not conversation_manager.conversation_history:
-        return "❌ 沒有對話記錄可導出"
-    
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"conversation_history_{timestamp}.txt"
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(f"語言學習助教 - 對話歷史記錄\n")
-        f.write(f"導出時間: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"語言設定: {current_language}\n")
-        f.write(f"難度設定: {current_difficulty}\n")
-        f.write("=" * 50 + "\n\n")
-        
-        for entry in conversation_manager.conversation_history:
-            f.write(f"時間: {entry['timestamp'].strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"場景: {entry['scenario']}\n")
-            f.write(f"用戶: {entry['user']}\n")
-            f.write(f"助教: {entry['assistant']}\n")
-            f.write("-" * 50 + "\n")
-    
-    return f"✅ 對話歷史已導出至: {filename}"
+EXPORT_FORMAT_LABELS = {"JSONL": "jsonl", "Parquet（欄式）": "parquet"}
+
+def export_conversation_history(format_label, include_audio_refs, request: gr.Request):
+    """送出背景匯出工作（資料庫中的完整學習歷程），由計時器查詢進度並提供下載"""
+    try:
+        job_id = conversation_manager.export_history(
+            get_learner_id(request), EXPORT_FORMAT_LABELS[format_label], include_audio_refs=include_audio_refs
+        )
+    except ValueError as e:
+        return f"❌ {e}", None, gr.update(visible=False), gr.Timer(active=False)
+    return "⏳ 匯出中...", job_id, gr.update(value=None, visible=False), gr.Timer(active=True)
+
+def poll_history_export(job_id):
+    """更新匯出進度；完成後顯示下載檔案並停止計時器"""
+    job = conversation_manager.history_exporter.status(job_id) if job_id else None
+    if job is None:
+        return "", None, gr.update(), gr.Timer(active=False)
+    if job["status"] == "failed":
+        return f"❌ 匯出失敗: {job['error']}", None, gr.update(visible=False), gr.Timer(active=False)
+    if job["status"] != "done":
+        return f"⏳ 匯出中... 已處理 {job['rows']} 筆", job_id, gr.update(), gr.Timer(active=True)
+    if job["rows"] == 0:
+        return "❌ 沒有練習紀錄可導出", None, gr.update(visible=False), gr.Timer(active=False)
+    return (f"✅ 已匯出 {job['rows']} 筆練習紀錄 ({job['format']})，檔案保留 {EXPORT_FILE_TTL_MINUTES} 分鐘", None,
+            gr.update(value=job["path"], visible=True), gr.Timer(active=False))
 
 ensure_scenario_images()
 
-with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft()) as demo:
+def print_readiness_notice():
+    """服務啟動後（/api/ready 已可查詢）提示模型仍在背景載入"""
+    if not model_manager.get_readiness()["loaded"]:
+        print("⏳ 模型在背景載入中，介面與健康檢查先行啟動（/api/ready 於Whisper就緒後回傳 200）")
+
+# 錄音以 numpy 陣列直接交給分析流程；Gradio 自己的上傳暫存檔定期清除
+with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft(),
+               delete_cache=(GRADIO_CACHE_SECONDS, GRADIO_CACHE_SECONDS)) as demo:
     history_state = gr.State([])
+    live_state = gr.State(None)
+    free_live_state = gr.State(None)
     current_mode = gr.State("initial")
 
     with gr.Column(elem_classes="main-container fade-in-up"):
@@ -485,45 +777,8 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
             """)
 
         with gr.Column(elem_classes="status-card"):
-            if device_info["use_gpu"]:
-                current_usage = device_info.get('current_memory_usage', 0)
-                status_html = f"""
-                <div style="display: flex; align-items: center; gap: 20px; flex-wrap: wrap;">
-                    <div style="display: flex; align-items: center; gap: 8px;">
-                        <span style="font-size: 1.2rem;">🚀</span>
-                        <strong>GPU加速已啟用</strong>
-                        <span style="color: #666;">- {device_info['gpu_name']} ({device_info['gpu_memory']:.1f}GB)</span>
-                    </div>
-                    <div style="display: flex; align-items: center; gap: 8px;">
-                        <span style="font-size: 1.2rem;">💾</span>
-                        <strong>記憶體使用:</strong>
-                        <span style="color: #4CAF50; font-weight: 600;">{current_usage:.2f}GB / {device_info['memory_limit_gb']}GB</span>
-                    </div>
-                """
-                if device_info["use_audio_llm"]:
-                    status_html += """
-                    <div style="display: flex; align-items: center; gap: 8px;">
-                        <span style="font-size: 1.2rem;">✅</span>
-                        <strong>Audio-LLM已載入</strong>
-                    </div>
-                    """
-                else:
-                    status_html += """
-                    <div style="display: flex; align-items: center; gap: 8px;">
-                        <span style="font-size: 1.2rem;">⚠️</span>
-                        <strong>Audio-LLM未載入</strong>
-                        <span style="color: #666;">(使用簡化分析)</span>
-                    </div>
-                    """
-                status_html += "</div>"
-            else:
-                status_html = """
-                <div style="display: flex; align-items: center; gap: 8px;">
-                    <span style="font-size: 1.2rem;">💻</span>
-                    <strong>使用CPU模式</strong>
-                </div>
-                """
-            gr.HTML(status_html)
+            status_card = gr.HTML(render_status_card())
+            status_timer = gr.Timer(READINESS_POLL_SECONDS)
 
         with gr.Column(elem_classes="initial-settings", visible=True) as initial_settings:
             gr.HTML("<h3 style='text-align: center; margin-bottom: 25px; color: #374151;'>⚙️ 系統設定</h3>")
@@ -624,10 +879,19 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
                     with gr.Column(elem_classes="user-input"):
                         user_audio_input = gr.Audio(
                             label="🎤 錄製您的回應", 
-                            type="filepath", 
+                            type="numpy", 
+                            sources=["microphone"],
+                            elem_classes="gradio-audio"
+                        )
+                        
+                        live_audio_input = gr.Audio(
+                            label="🎙️ 即時模式（邊說邊辨識，說完自動提交）",
+                            type="numpy",
                             sources=["microphone"],
+                            streaming=True,
                             elem_classes="gradio-audio"
                         )
+                        live_endpoint = gr.Textbox(visible=False)
                         
                         user_text = gr.Textbox(
                             label="📝 語音識別結果", 
@@ -644,7 +908,8 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
 
                         with gr.Row():
                             retry_btn = gr.Button("🔄 重新錄製", elem_classes="secondary-btn")
-                            submit_audio_btn = gr.Button("🚀 提交回應", elem_classes="primary-btn")
+                            submit_audio_btn = gr.Button("🚀 提交回應", elem_classes="primary-btn",
+                                                         interactive=model_manager.is_ready())
 
             with gr.Accordion("📝 發音回饋與分析", open=True, elem_classes="advanced-section"):
                 with gr.Column(elem_classes="feedback-panel"):
@@ -704,11 +969,25 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
                     )
 
                 with gr.Accordion("📊 學習歷程", open=False):
+                    learner_key_input = gr.Textbox(
+                        label="🔑 學習紀錄金鑰",
+                        info="自動產生並保存在此瀏覽器；在其他裝置輸入相同金鑰並按 Enter 即可接續學習紀錄。"
+                             "知道金鑰的人都能查看與匯出你的紀錄，請勿分享",
+                        max_lines=1,
+                        show_copy_button=True
+                    )
                     with gr.Row():
                         clear_history_btn = gr.Button("🗑️ 清除歷史", elem_classes="secondary-btn")
                         export_history_btn = gr.Button("📥 導出歷史", elem_classes="secondary-btn")
                     
+                    with gr.Row():
+                        export_format = gr.Radio(list(EXPORT_FORMAT_LABELS), value="JSONL", label="匯出格式")
+                        export_audio_refs = gr.Checkbox(value=False, label="包含錄音檔路徑")
+                    
                     history_status = gr.Textbox(label="操作狀態", interactive=False)
+                    export_file = gr.File(label="下載學習歷程", visible=False)
+                    export_job_state = gr.State(None)
+                    export_timer = gr.Timer(1, active=False)
                     
                     history_gallery = gr.Gallery(
                         label="最近練習的對話", 
@@ -722,6 +1001,8 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
                         datatype=["str", "str", "str", "str", "str"],
                         label="練習記錄"
                     )
+                    
+                    progress_dashboard_display = gr.Markdown("尚無練習紀錄，完成第一次練習後會顯示進度分析")
 
         with gr.Column(visible=False, elem_classes="fade-in-up") as free_dialog_mode:
             gr.HTML("<h2 style='text-align: center; margin-bottom: 30px; color: #374151;'>💭 自由對話</h2>")
@@ -767,10 +1048,18 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
                 with gr.Column(elem_classes="user-input"):
                     free_user_audio_input = gr.Audio(
                         label="🎤 錄製您的回應", 
-                        type="filepath", 
+                        type="numpy", 
                         sources=["microphone"],
                         elem_classes="gradio-audio"
                     )
+                    free_live_audio_input = gr.Audio(
+                        label="🎙️ 即時模式（邊說邊辨識，說完自動提交）",
+                        type="numpy",
+                        sources=["microphone"],
+                        streaming=True,
+                        elem_classes="gradio-audio"
+                    )
+                    free_live_endpoint = gr.Textbox(visible=False)
                     free_user_text = gr.Textbox(
                         label="📝 語音識別結果", 
                         interactive=False,
@@ -786,7 +1075,8 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
 
                     with gr.Row():
                         free_retry_btn = gr.Button("🔄 重新錄製", elem_classes="secondary-btn")
-                        free_submit_audio_btn = gr.Button("🚀 提交回應", elem_classes="primary-btn")
+                        free_submit_audio_btn = gr.Button("🚀 提交回應", elem_classes="primary-btn",
+                                                          interactive=model_manager.is_ready())
 
         with gr.Column(visible=False) as back_btn_group:
             back_btn = gr.Button("← 返回主選單", elem_classes="back-btn")
@@ -807,13 +1097,30 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
                     gr.HTML("<h4 style='margin-bottom: 15px; color: #374151;'>📈 系統統計</h4>")
                     stats_display = gr.JSON(label="系統狀態", elem_classes="stats-panel")
                     stats_refresh_btn = gr.Button("🔄 刷新統計", elem_classes="secondary-btn")
+            
+            with gr.Row():
+                with gr.Column():
+                    gr.HTML("<h4 style='margin-bottom: 15px; color: #374151;'>🔬 效能剖析</h4>")
+                    profile_count = gr.Number(
+                        label="剖析接下來的請求數",
+                        value=DEFAULT_PROFILE_REQUESTS,
+                        minimum=1,
+                        maximum=50,
+                        precision=0
+                    )
+                    profile_status_display = gr.Textbox(
+                        label="剖析狀態",
+                        lines=3,
+                        interactive=False
+                    )
+                    with gr.Row():
+                        profile_start_btn = gr.Button("▶️ 開始剖析", elem_classes="secondary-btn")
+                        profile_stop_btn = gr.Button("⏹️ 停止剖析", elem_classes="secondary-btn")
 
     default_focus_area = gr.Textbox(value="綜合練習", visible=False)
 
-    def update_settings_and_show_status(lang, diff):
-        global current_language, current_difficulty
-        current_language = lang
-        current_difficulty = diff
+    def update_settings_and_show_status(lang, diff, request: gr.Request):
+        get_session(request).update_settings(language=lang, difficulty=diff)
         status_msg = f"✅ 已設定語言: {lang}, 難度: {diff}"
         print(f"設定更新: 語言={lang}, 難度={diff}")
         return status_msg, gr.update(visible=True)
@@ -825,13 +1132,13 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
     )
     
     language.change(
-        fn=lambda lang, diff: update_language_difficulty(lang, diff),
+        fn=update_language_difficulty,
         inputs=[language, difficulty],
         outputs=[]
     )
     
     difficulty.change(
-        fn=lambda lang, diff: update_language_difficulty(lang, diff),
+        fn=update_language_difficulty,
         inputs=[language, difficulty], 
         outputs=[]
     )
@@ -898,16 +1205,20 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
         inputs=[
             user_audio_input, language, difficulty,
             default_focus_area, feedback_detail,
-            pronunciation_focus, accent_preference, track_progress, show_comparison
+            pronunciation_focus, accent_preference, track_progress, show_comparison,
+            history_state
         ],
         outputs=[
             user_text, feedback_text, pronunciation_score,
             fluency_score, assistant_text, history_state, suggested_responses_display
-        ]
+        ],
+        concurrency_limit=AUDIO_CONCURRENCY_LIMIT,
+        concurrency_id="audio_analysis",
+        show_progress="full"
     ).then(
         fn=update_history,
         inputs=[history_state],
-        outputs=[history_gallery, history_info]
+        outputs=[history_gallery, history_info, progress_dashboard_display]
     )
 
     free_submit_audio_btn.click(
@@ -917,7 +1228,83 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
             free_pronunciation_focus, free_accent_preference, 
             free_feedback_detail, free_show_comparison
         ],
-        outputs=[free_user_text, free_assistant_text, free_suggested_responses_display]
+        outputs=[free_user_text, free_assistant_text, free_suggested_responses_display],
+        concurrency_limit=AUDIO_CONCURRENCY_LIMIT,
+        concurrency_id="audio_analysis",
+        show_progress="full"
+    )
+
+    # 即時模式：串流片段即時辨識，語句結束（或停止錄音）時自動提交
+    live_audio_input.start_recording(
+        fn=start_live_recording,
+        outputs=[live_state, user_text]
+    )
+
+    live_audio_input.stream(
+        fn=stream_live_audio,
+        inputs=[live_audio_input, live_state],
+        outputs=[user_text, live_state, live_endpoint],
+        concurrency_limit=UI_CONCURRENCY_LIMIT,
+        concurrency_id="live_transcription",
+        show_progress="hidden"
+    )
+
+    live_audio_input.stop_recording(
+        fn=stop_live_recording,
+        inputs=[live_state],
+        outputs=[live_endpoint]
+    )
+
+    live_endpoint.change(
+        fn=process_live_audio,
+        inputs=[
+            live_state, language, difficulty,
+            default_focus_area, feedback_detail,
+            pronunciation_focus, accent_preference, track_progress, show_comparison,
+            history_state
+        ],
+        outputs=[
+            user_text, feedback_text, pronunciation_score,
+            fluency_score, assistant_text, history_state, suggested_responses_display
+        ],
+        concurrency_limit=AUDIO_CONCURRENCY_LIMIT,
+        concurrency_id="audio_analysis"
+    ).then(
+        fn=update_history,
+        inputs=[history_state],
+        outputs=[history_gallery, history_info, progress_dashboard_display]
+    )
+
+    free_live_audio_input.start_recording(
+        fn=start_live_recording,
+        outputs=[free_live_state, free_user_text]
+    )
+
+    free_live_audio_input.stream(
+        fn=stream_live_audio,
+        inputs=[free_live_audio_input, free_live_state],
+        outputs=[free_user_text, free_live_state, free_live_endpoint],
+        concurrency_limit=UI_CONCURRENCY_LIMIT,
+        concurrency_id="live_transcription",
+        show_progress="hidden"
+    )
+
+    free_live_audio_input.stop_recording(
+        fn=stop_live_recording,
+        inputs=[free_live_state],
+        outputs=[free_live_endpoint]
+    )
+
+    free_live_endpoint.change(
+        fn=process_free_live_audio,
+        inputs=[
+            free_live_state, language, difficulty, custom_scenario,
+            free_pronunciation_focus, free_accent_preference,
+            free_feedback_detail, free_show_comparison
+        ],
+        outputs=[free_user_text, free_assistant_text, free_suggested_responses_display],
+        concurrency_limit=AUDIO_CONCURRENCY_LIMIT,
+        concurrency_id="audio_analysis"
     )
 
     retry_btn.click(
@@ -935,9 +1322,18 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
         outputs=[history_status, history_info]
     )
     
+    export_outputs = [history_status, export_job_state, export_file, export_timer]
     export_history_btn.click(
         fn=export_conversation_history,
-        outputs=[history_status]
+        inputs=[export_format, export_audio_refs],
+        outputs=export_outputs
+    )
+    export_timer.tick(
+        fn=poll_history_export,
+        inputs=[export_job_state],
+        outputs=export_outputs,
+        show_progress="hidden",
+        concurrency_limit=None
     )
     
     memory_refresh_btn.click(
@@ -950,6 +1346,17 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
         outputs=[stats_display]
     )
 
+    profile_start_btn.click(
+        fn=start_request_profiling,
+        inputs=[profile_count],
+        outputs=[profile_status_display]
+    )
+
+    profile_stop_btn.click(
+        fn=stop_request_profiling,
+        outputs=[profile_status_display]
+    )
+
     demo.load(
         fn=get_memory_status,
         outputs=[memory_status_display]
@@ -959,12 +1366,62 @@ with gr.Blocks(css=css_content, title="語言學習助教", theme=gr.themes.Soft
         fn=get_system_stats,
         outputs=[stats_display]
     )
+    
+    readiness_outputs = [
+        status_card, submit_audio_btn, free_submit_audio_btn, live_audio_input, free_live_audio_input, status_timer
+    ]
+    demo.load(
+        fn=refresh_model_readiness,
+        outputs=readiness_outputs,
+        show_progress="hidden"
+    )
+    status_timer.tick(
+        fn=refresh_model_readiness,
+        outputs=readiness_outputs,
+        show_progress="hidden",
+        concurrency_limit=None
+    )
+
+    demo.load(
+        fn=format_profiler_status,
+        outputs=[profile_status_display]
+    )
+
+    # 頁面載入時由 localStorage 讀回學習者代號並連結到這個分頁，再顯示該學習者的進度
+    demo.load(
+        fn=attach_learner,
+        inputs=[learner_key_input],
+        outputs=[learner_key_input, history_status],
+        js=LOAD_LEARNER_JS
+    ).then(
+        fn=update_history,
+        inputs=[history_state],
+        outputs=[history_gallery, history_info, progress_dashboard_display]
+    )
+    learner_key_input.submit(
+        fn=attach_learner,
+        inputs=[learner_key_input],
+        outputs=[learner_key_input, history_status],
+        js=SAVE_LEARNER_JS
+    ).then(
+        fn=update_history,
+        inputs=[history_state],
+        outputs=[history_gallery, history_info, progress_dashboard_display]
+    )
+
+# 錄音分析事件共用 audio_analysis 佇列；等候中的使用者會看到自己在佇列中的位置與預估時間
+demo.queue(
+    default_concurrency_limit=UI_CONCURRENCY_LIMIT,
+    max_size=QUEUE_MAX_SIZE,
+    status_update_rate=1
+)
 
 if __name__ == "__main__":
     print("=== 啟動語言學習助教（完整進階功能整合版）===")
-    print(f"使用設備: {device_info['device']}")
-    print(f"Whisper可用: {device_info['whisper_available']}")
-    print(f"Audio-LLM可用: {device_info['use_audio_llm']}")
+    print(f"使用設備: {model_manager.get_device_info()['device']}")
+    install_signal_handler()
+    # 預先生成需要Audio-LLM，等模型載入完成後才啟動
+    model_manager.when_loaded(conversation_manager.start_pregeneration)
     
     if css_content:
         print("✅ CSS樣式文件載入成功")
@@ -981,14 +1438,34 @@ if __name__ == "__main__":
         "ssl_verify": False
     }
     
-    if device_info["use_gpu"]:
+    if model_manager.use_gpu:
         print("GPU模式已啟用，建議確保有足夠的VRAM")
-        print(f"當前GPU記憶體使用: {device_info.get('current_memory_usage', 0):.2f}GB")
     
-    try:
-        demo.launch(**launch_kwargs)
-    except Exception as e:
-        print(f"啟動失敗: {e}")
-        print("嘗試使用自動端口...")
-        launch_kwargs.pop("server_port")
-        demo.launch(**launch_kwargs)
\ No newline at end of file
+    if SERVE_HTTP_API:
+        import uvicorn
+        from api_server import create_api_app
+        
+        # API 與介面共用同一個對話管理器（模型執行緒池、階段限制與快取）
+        if not os.environ.get("API_AUTH_TOKEN"):
+            print("⚠️  未設定 API_AUTH_TOKEN，/api 端點不需驗證即可呼叫")
+        api = create_api_app(conversation_manager, concurrency_limit=AUDIO_CONCURRENCY_LIMIT, max_queue=QUEUE_MAX_SIZE)
+        server = gr.mount_gradio_app(api, demo, path="/")
+        print(f"🌐 介面: http://{launch_kwargs['server_name']}:{launch_kwargs['server_port']}/")
+        print(f"🔌 API: http://{launch_kwargs['server_name']}:{launch_kwargs['server_port']}/api/analyze（WebSocket: /api/analyze/stream）")
+        print_readiness_notice()
+        uvicorn.run(server, host=launch_kwargs["server_name"], port=launch_kwargs["server_port"])
+    else:
+        from api_server import InferenceService, create_status_router
+        
+        launch_kwargs["prevent_thread_lock"] = True
+        try:
+            demo.launch(**launch_kwargs)
+        except Exception as e:
+            print(f"啟動失敗: {e}")
+            print("嘗試使用自動端口...")
+            launch_kwargs.pop("server_port")
+            demo.launch(**launch_kwargs)
+        # 只啟動介面時也提供健康與就緒檢查；放在 Gradio 自身的路由之前，不會被其 /api/ 路由攔截
+        demo.app.router.routes[:0] = create_status_router(InferenceService(conversation_manager)).routes
+        print_readiness_notice()
+        demo.block_thread()
\ No newline at end of file
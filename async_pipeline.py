@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+async_pipeline.py - asyncio 版本的對話處理流程
+語音辨識、Audio-LLM 與其他可能阻塞的工作（載入模型、查詢資料庫）都在執行緒池中執行，
+事件迴圈只負責協調；等待期間不佔用任何執行緒，單一程序即可同時持有大量進行中的工作階段
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from session_store import DEFAULT_SESSION_ID
+from stage_limiter import DEFAULT_STAGE_CONCURRENCY
+from tracing import get_tracer, carry_context
+
+
+class AsyncStage:
+    """將模型階段的呼叫個別送入該階段的執行緒池，每個呼叫完成時立即回傳
+
+    執行緒數與階段的並行上限一致，同時到達的請求平行執行，不會排在同一個執行緒工作中互相等待；
+    實際的並行數仍由模型的 StageLimiter 控制
+    """
+
+    def __init__(self, name, executor):
+        """
+        Args:
+            name (str): 階段名稱（統計用）
+            executor: 執行呼叫的執行緒池
+        """
+        self.name = name
+        self.executor = executor
+
+        self.submitted = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_active = 0
+
+    async def submit(self, fn, *args, **kwargs):
+        """在執行緒池中執行一個呼叫並等待其結果"""
+        self.submitted += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, carry_context(fn, *args, **kwargs)
+            )
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self.completed += 1
+
+    def get_stats(self):
+        return {
+            "submitted": self.submitted,
+            "active": self.active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_active": self.max_active
+        }
+
+
+def stage_concurrency_limits(conversation_manager):
+    """各模型階段的並行上限：模型已建立時取其限制器，否則依設定（不會為此載入模型）"""
+    model_manager = conversation_manager.audio_processor._model_manager
+    stage_limiters = getattr(model_manager, "stage_limiters", None)
+    if stage_limiters:
+        return {name: limiter.limit for name, limiter in stage_limiters.items()}
+    limits = dict(DEFAULT_STAGE_CONCURRENCY)
+    limits.update(conversation_manager.config["models"].get("stage_concurrency") or {})
+    return limits
+
+
+class AsyncPipeline:
+    """ConversationManager 的非同步處理流程"""
+
+    def __init__(self, conversation_manager, cpu_workers=4):
+        """
+        Args:
+            conversation_manager: 提供模型、工作階段與進度儲存的對話管理器
+            cpu_workers (int): 本地評分、資料庫與其他阻塞工作使用的執行緒數
+        """
+        self.manager = conversation_manager
+        # 執行緒數與模型階段的並行上限一致；由設定取得，建構時不觸發模型載入
+        stage_concurrency = stage_concurrency_limits(conversation_manager)
+        self.asr_executor = ThreadPoolExecutor(max_workers=stage_concurrency["asr"], thread_name_prefix="asr")
+        self.llm_executor = ThreadPoolExecutor(max_workers=stage_concurrency["audio_llm"], thread_name_prefix="audio-llm")
+        self.cpu_executor = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="scoring")
+
+        self.asr_stage = AsyncStage("asr", self.asr_executor)
+        self.llm_stage = AsyncStage("audio_llm", self.llm_executor)
+
+    async def process_user_input(self, audio_path, scenario, conversation_context="",
+                                 difficulty="中級 (TOEIC 605-780分)", pronunciation_focus=None,
+                                 accent_preference="不指定", feedback_detail="詳細回饋", show_comparison=True,
+                                 session_id=DEFAULT_SESSION_ID, track_progress=True, on_event=None, **kwargs):
+        """處理用戶輸入的完整流程（非同步）"""
+        with self.manager.track_request(), \
+                get_tracer().span("process_user_input", session_id=session_id, difficulty=difficulty, mode="async"):
+            capture = self.manager.start_profile_capture(
+                audio_path, scenario, difficulty, feedback_detail, session_id, mode="async"
+            )
+            result = await self._process_user_input(
+                audio_path, scenario, conversation_context, difficulty, pronunciation_focus,
+                accent_preference, feedback_detail, show_comparison, session_id, track_progress,
+                on_event, capture, **kwargs
+            )
+            if capture is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    self.cpu_executor, self.manager.finish_profile_capture, capture, result
+                )
+            return result
+
+    def _profiled(self, capture, stage, fn):
+        """剖析模式下，讓模型執行緒中的呼叫也被 cProfile / torch.profiler 擷取"""
+        if capture is None:
+            return fn
+        return functools.partial(capture.run, stage, fn)
+
+    async def _process_user_input(self, audio_path, scenario, conversation_context, difficulty,
+                                  pronunciation_focus, accent_preference, feedback_detail, show_comparison,
+                                  session_id, track_progress, on_event, capture, **kwargs):
+        manager = self.manager
+        processor = manager.audio_processor
+        result = manager._empty_result()
+        loop = asyncio.get_running_loop()
+
+        try:
+            source = audio_path
+            audio_path = await loop.run_in_executor(
+                self.cpu_executor, carry_context(manager.load_input_audio, source)
+            )
+            if audio_path is None:
+                result["error_message"] = "音頻文件不存在"
+                return result
+
+            transcription = kwargs.pop("transcription", None)
+            transcribe_status = "語音識別失敗，請重新錄製"
+            if transcription is None:
+                transcription, transcribe_status = await self.asr_stage.submit(
+                    self._profiled(capture, "transcribe_speech", processor.transcribe_speech_detailed), audio_path
+                )
+
+            if not transcription:
+                result["error_message"] = transcribe_status
+                return result
+
+            recognized_text = transcription["text"]
+            result["recognized_text"] = recognized_text
+
+            # 閘門判斷可能建立模型管理器並查詢預先生成回合，不在事件迴圈上執行
+            route = await loop.run_in_executor(self.cpu_executor, carry_context(
+                processor.route_analysis, recognized_text, difficulty, transcription, scenario
+            ))
+
+            if on_event is not None:
+                # 串流事件由模型執行緒產生，轉回事件迴圈上處理
+                kwargs["on_event"] = lambda event: loop.call_soon_threadsafe(on_event, event)
+
+            analyze = functools.partial(
+                processor.analyze_pronunciation,
+                audio_path=audio_path,
+                transcribed_text=recognized_text,
+                scenario=scenario,
+                conversation_history=conversation_context,
+                difficulty=difficulty,
+                pronunciation_focus=pronunciation_focus,
+                accent_preference=accent_preference,
+                feedback_detail=feedback_detail,
+                show_comparison=show_comparison,
+                transcription=transcription,
+                route=route,
+                **kwargs
+            )
+
+            analyze = self._profiled(capture, "analyze_pronunciation", analyze)
+            if route["use_llm"]:
+                analysis_result = await self.llm_stage.submit(analyze)
+            else:
+                analysis_result = await loop.run_in_executor(self.cpu_executor, carry_context(analyze))
+
+            # 保存錄音與更新學習進度（第一次可能由資料庫載入學習者的紀錄）同樣移出事件迴圈
+            await loop.run_in_executor(self.cpu_executor, carry_context(
+                self._finish_turn, result, analysis_result, source, audio_path, session_id, scenario,
+                difficulty, pronunciation_focus, accent_preference, feedback_detail, track_progress,
+                kwargs.get("focus_area")
+            ))
+            return result
+
+        except Exception as e:
+            result["error_message"] = f"處理過程出錯: {str(e)}"
+            return result
+
+    def _finish_turn(self, result, analysis_result, source, audio_path, session_id, scenario, difficulty,
+                     pronunciation_focus, accent_preference, feedback_detail, track_progress, focus_area):
+        manager = self.manager
+        manager._complete_turn(
+            result, analysis_result, session_id,
+            manager.retain_recording(source, audio_path, session_id, track_progress),
+            scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail, track_progress,
+            focus_area
+        )
+
+    def get_stats(self):
+        return {
+            "asr": self.asr_stage.get_stats(),
+            "audio_llm": self.llm_stage.get_stats()
+        }
+
+    def shutdown(self, wait=True):
+        for executor in (self.asr_executor, self.llm_executor, self.cpu_executor):
+            executor.shutdown(wait=wait)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+batch_evaluate.py - 離線批次評分工具
+對一個資料夾或清單檔中的錄音執行完整的發音分析流程，結果逐筆寫入 JSONL 或 CSV，中斷後可續跑
+
+範例:
+    python batch_evaluate.py homework/ -o results.jsonl --difficulty "中級 (TOEIC 605-780分)"
+    python batch_evaluate.py --manifest class_a.csv -o results.csv --mode thread --workers 4 --resume
+    python batch_evaluate.py homework/ -o results.jsonl --mode process --workers 2   # 每張GPU一個程序
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".webm")
+DEFAULT_SCENARIO = "日常社交 (Daily Social Conversation)"
+DEFAULT_DIFFICULTY = "中級 (TOEIC 605-780分)"
+
+OUTPUT_FIELDS = [
+    "id", "audio_path", "scenario", "difficulty", "success", "error_message",
+    "recognized_text", "pronunciation_score", "fluency_score", "intelligibility_score",
+    "words_per_minute", "pause_count", "filler_count", "analysis_mode", "gate_reason",
+    "response_text", "pronunciation_analysis", "elapsed_seconds"
+]
+
+
+def discover_jobs(input_dir, settings):
+    """遞迴搜尋資料夾中的錄音檔"""
+    jobs = []
+    for root, _, files in os.walk(input_dir):
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS):
+                path = os.path.join(root, name)
+                job = dict(settings)
+                job["id"] = os.path.relpath(path, input_dir)
+                job["audio_path"] = path
+                jobs.append(job)
+    jobs.sort(key=lambda job: job["id"])
+    return jobs
+
+
+def load_manifest(manifest_path, settings):
+    """讀取清單檔（CSV 或 JSONL），每筆至少需要 audio_path，可覆寫 scenario / difficulty 等設定"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.lower().endswith(".jsonl"):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(manifest_path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    jobs = []
+    for index, row in enumerate(rows):
+        if not row.get("audio_path"):
+            print(f"⚠️  清單第 {index + 1} 筆缺少 audio_path，已略過")
+            continue
+        job = dict(settings)
+        job.update({key: value for key, value in row.items() if value not in (None, "")})
+        if not os.path.isabs(job["audio_path"]):
+            job["audio_path"] = os.path.join(base_dir, job["audio_path"])
+        if isinstance(job.get("pronunciation_focus"), str):
+            job["pronunciation_focus"] = [item for item in job["pronunciation_focus"].split("|") if item]
+        job["id"] = str(row.get("id") or row["audio_path"])
+        jobs.append(job)
+    return jobs
+
+
+class ResultWriter:
+    """逐筆寫入結果並立即 flush，輸出檔本身即為續跑用的檢查點"""
+
+    def __init__(self, output_path, resume=False):
+        self.output_path = output_path
+        self.format = "csv" if output_path.lower().endswith(".csv") else "jsonl"
+        self.completed = self._load_completed() if resume else set()
+
+        directory = os.path.dirname(output_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        append = resume and os.path.exists(output_path) and os.path.getsize(output_path) > 0
+        if append:
+            self._truncate_partial_line()
+        self._file = open(output_path, "a" if append else "w", encoding="utf-8", newline="")
+        if self.format == "csv":
+            self._csv = csv.DictWriter(self._file, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+            if not append:
+                self._csv.writeheader()
+
+    def _truncate_partial_line(self):
+        """移除中斷時留下的不完整最後一行，接續寫入的紀錄才不會接在半行之後"""
+        with open(self.output_path, "rb+") as f:
+            data = f.read()
+            if data.endswith(b"\n"):
+                return
+            f.truncate(data.rfind(b"\n") + 1)
+
+    def _load_completed(self):
+        if not os.path.exists(self.output_path):
+            return set()
+        completed = set()
+        with open(self.output_path, "r", encoding="utf-8", newline="") as f:
+            if self.format == "csv":
+                for row in csv.DictReader(f):
+                    completed.add(row["id"])
+            else:
+                for line in f:
+                    try:
+                        completed.add(json.loads(line)["id"])
+                    except (ValueError, KeyError):
+                        # 中斷時可能留下不完整的最後一行
+                        continue
+        return completed
+
+    def write(self, record):
+        if self.format == "csv":
+            self._csv.writerow(record)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self.completed.add(record["id"])
+
+    def close(self):
+        self._file.close()
+
+
+def _job_kwargs(job, track_progress):
+    return {
+        "audio_path": job["audio_path"],
+        "scenario": job["scenario"],
+        "conversation_context": job.get("conversation_context", ""),
+        "difficulty": job["difficulty"],
+        "pronunciation_focus": job.get("pronunciation_focus") or None,
+        "accent_preference": job["accent_preference"],
+        "feedback_detail": job["feedback_detail"],
+        "show_comparison": True,
+        "session_id": f"batch:{job['id']}",
+        "track_progress": track_progress
+    }
+
+
+def build_record(job, result, elapsed):
+    """將處理結果整理為輸出欄位"""
+    confidence = result.get("confidence") or {}
+    fluency = result.get("fluency_metrics") or {}
+    return {
+        "id": job["id"],
+        "audio_path": job["audio_path"],
+        "scenario": job["scenario"],
+        "difficulty": job["difficulty"],
+        "success": result["success"],
+        "error_message": result.get("error_message", ""),
+        "recognized_text": result.get("recognized_text", ""),
+        "pronunciation_score": result.get("pronunciation_score", 0),
+        "fluency_score": result.get("fluency_score", 0),
+        "intelligibility_score": confidence.get("intelligibility_score"),
+        "words_per_minute": round(fluency["words_per_minute"], 1) if fluency else None,
+        "pause_count": fluency.get("pause_count"),
+        "filler_count": fluency.get("filler_count"),
+        "analysis_mode": result.get("analysis_mode"),
+        "gate_reason": result.get("gate_reason"),
+        "response_text": result.get("response_text", ""),
+        "pronunciation_analysis": result.get("pronunciation_analysis", ""),
+        "elapsed_seconds": round(elapsed, 3)
+    }
+
+
+# 多程序模式下每個工作程序的對話管理器（由 _init_process_worker 建立）
+_worker_manager = None
+
+
+def load_manager():
+    """建立對話管理器並立即載入模型，之後送出的工作不會各自觸發載入"""
+    from processors import get_conversation_manager
+    manager = get_conversation_manager()
+    manager.audio_processor.model_manager
+    return manager
+
+
+def _init_process_worker(device_queue):
+    """工作程序啟動時執行一次：指定使用的GPU並載入模型"""
+    global _worker_manager
+    if device_queue is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = str(device_queue.get())
+    _worker_manager = load_manager()
+
+
+def max_process_workers():
+    """多程序模式的上限：每張GPU一個程序（每個程序各載入一份Whisper與Audio-LLM），沒有GPU時為1"""
+    import torch
+    return max(1, torch.cuda.device_count())
+
+
+def evaluate_job(job, track_progress=False, manager=None):
+    """處理一筆錄音；執行緒模式傳入共用的管理器，多程序模式使用工作程序的管理器"""
+    manager = manager or _worker_manager or load_manager()
+
+    kwargs = _job_kwargs(job, track_progress)
+    start = time.time()
+    result = manager.process_user_input(**kwargs)
+    manager.sessions.remove(kwargs["session_id"])
+    if track_progress:
+        # 多程序模式下工作程序結束時不會等待背景寫入
+        manager.progress_store.flush()
+    return build_record(job, result, time.time() - start)
+
+
+def create_pool(mode, workers):
+    """建立執行緒池或程序池，回傳 (executor, 共用的管理器)
+
+    執行緒模式在送出工作前先建立管理器與模型；多程序模式以 spawn 啟動工作程序，
+    每個程序在 initializer 中載入一次模型，並各自使用一張GPU
+    """
+    if mode != "process":
+        return ThreadPoolExecutor(max_workers=workers), load_manager()
+
+    context = multiprocessing.get_context("spawn")
+    device_queue = None
+    if workers > 1:
+        # 已設定 CUDA_VISIBLE_DEVICES 時在其範圍內分配
+        visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+        devices = visible.split(",") if visible else [str(device) for device in range(workers)]
+        device_queue = context.Queue()
+        for device in devices[:workers]:
+            device_queue.put(device)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                   initializer=_init_process_worker, initargs=(device_queue,))
+    return executor, None
+
+
+def run_pool(jobs, mode, workers, track_progress):
+    executor, manager = create_pool(mode, workers)
+    with executor:
+        futures = {executor.submit(evaluate_job, job, track_progress, manager): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = build_record(job, {"success": False, "error_message": str(e)}, 0.0)
+            yield record
+
+
+async def _run_async(jobs, workers, track_progress, on_record):
+    from processors import get_conversation_manager
+    manager = get_conversation_manager()
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(job):
+        async with semaphore:
+            kwargs = _job_kwargs(job, track_progress)
+            start = time.time()
+            result = await manager.process_user_input_async(**kwargs)
+            manager.sessions.remove(kwargs["session_id"])
+            on_record(build_record(job, result, time.time() - start))
+
+    await asyncio.gather(*(run(job) for job in jobs))
+    if track_progress:
+        manager.progress_store.flush()
+
+
+def print_summary(records, total_elapsed):
+    succeeded = [r for r in records if r["success"]]
+    print("\n" + "=" * 60)
+    print(f"📊 處理完成: {len(records)} 筆，成功 {len(succeeded)} 筆，失敗 {len(records) - len(succeeded)} 筆")
+    if succeeded:
+        avg_pronunciation = sum(r["pronunciation_score"] for r in succeeded) / len(succeeded)
+        avg_fluency = sum(r["fluency_score"] for r in succeeded) / len(succeeded)
+        print(f"🎯 平均發音分數: {avg_pronunciation:.1f}，平均流暢度: {avg_fluency:.1f}")
+    if records:
+        print(f"⏱️  總耗時: {total_elapsed:.1f} 秒（每筆 {total_elapsed / len(records):.2f} 秒）")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批次評分錄音檔")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("input_dir", nargs="?", help="錄音資料夾（遞迴搜尋）")
+    source.add_argument("--manifest", help="CSV 或 JSONL 清單檔，需包含 audio_path 欄位")
+    parser.add_argument("-o", "--output", required=True, help="輸出檔（.jsonl 或 .csv）")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO, help="預設場景")
+    parser.add_argument("--difficulty", default=DEFAULT_DIFFICULTY, help="預設難度")
+    parser.add_argument("--focus", action="append", default=[], help="發音重點，可重複指定")
+    parser.add_argument("--accent", default="不指定", help="口音偏好")
+    parser.add_argument("--feedback-detail", default="詳細回饋", help="回饋級別")
+    parser.add_argument("--mode", choices=("async", "thread", "process"), default="async",
+                        help="async: 非同步流程（預設）；thread: 執行緒池；process: 每個程序各自載入模型")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="同時處理的錄音數（async / thread 預設 4；process 預設 1，上限為GPU數）")
+    parser.add_argument("--resume", action="store_true", help="略過輸出檔中已完成的錄音並接續寫入")
+    parser.add_argument("--track-progress", action="store_true", help="同時寫入學習進度資料庫")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers is None:
+        args.workers = 1 if args.mode == "process" else 4
+    if args.mode == "process" and args.workers > 1 and args.workers > max_process_workers():
+        print(f"❌ process 模式每個程序各自載入模型，--workers 不可超過GPU數 ({max_process_workers()})")
+        return 2
+    settings = {
+        "scenario": args.scenario,
+        "difficulty": args.difficulty,
+        "pronunciation_focus": args.focus,
+        "accent_preference": args.accent,
+        "feedback_detail": args.feedback_detail
+    }
+
+    if args.manifest:
+        jobs = load_manifest(args.manifest, settings)
+    else:
+        jobs = discover_jobs(args.input_dir, settings)
+
+    writer = ResultWriter(args.output, resume=args.resume)
+    pending = [job for job in jobs if job["id"] not in writer.completed]
+    print(f"📁 共 {len(jobs)} 筆錄音，已完成 {len(jobs) - len(pending)} 筆，待處理 {len(pending)} 筆")
+    print(f"⚙️  模式: {args.mode}，並行數: {args.workers}，輸出: {args.output}")
+
+    records = []
+
+    def on_record(record):
+        writer.write(record)
+        records.append(record)
+        status = "✅" if record["success"] else "❌"
+        print(f"{status} [{len(records)}/{len(pending)}] {record['id']} "
+              f"發音 {record['pronunciation_score']} / 流暢度 {record['fluency_score']}")
+
+    start = time.time()
+    try:
+        if pending and args.mode == "async":
+            asyncio.run(_run_async(pending, args.workers, args.track_progress, on_record))
+        elif pending:
+            for record in run_pool(pending, args.mode, args.workers, args.track_progress):
+                on_record(record)
+    except KeyboardInterrupt:
+        print("\n⏸️  已中斷，使用 --resume 可從目前進度繼續")
+    finally:
+        writer.close()
+
+    print_summary(records, time.time() - start)
+    return 0 if all(r["success"] for r in records) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+benchmark.py - 各處理階段延遲基準測試
+以固定的合成錄音驅動 prompt 建構、語音辨識、Audio-LLM 生成、回應解析、聲學特徵擷取、
+簡化分析與完整 process_user_input 流程，回報 p50/p95/p99 延遲與吞吐量，並可與基準結果比較
+
+預設使用替身模型（CPU 即可執行）；--whisper tiny 可改用真實的 Whisper tiny 模型做語音辨識
+
+範例:
+    python benchmark.py -o bench.json
+    python benchmark.py --iterations 50 --baseline bench_baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+from acoustic_scoring import SAMPLE_RATE, load_waveform, extract_acoustic_features
+from response_parser import parse_response
+from progress_store import ProgressStore
+from pregeneration import PregeneratedTurns
+
+BENCH_SCENARIO = "機場對話 (Airport Conversation)"
+BENCH_DIFFICULTY = "中級 (TOEIC 605-780分)"
+BENCH_FOCUS = ["子音發音", "語調"]
+BENCH_ACCENT = "美式英文"
+BENCH_FEEDBACK = "詳細回饋"
+
+# 合成錄音：(名稱, 秒數, 內容)
+SYNTHETIC_RECORDINGS = [
+    ("short", 3, "I would like a window seat please"),
+    ("medium", 6, "Could you tell me where the boarding gate is and how long it takes to walk there"),
+    ("long", 12, "I have two bags to check in and one carry on bag I was wondering if my laptop "
+                 "can stay in my backpack during the security check and whether I need to take out my liquids")
+]
+
+STUB_LLM_RESPONSE = """**PRONUNCIATION ANALYSIS:**
+- Overall pronunciation score: 82/100
+- Your pronunciation is clear overall. The vowel in "seat" was slightly short, and the final consonant in "please" could be stronger.
+- Your intonation rose naturally at the end of the request.
+
+**CONVERSATION RESPONSE:**
+Certainly! Let me check what window seats are available on your flight. Would you prefer a seat near the front of the plane?
+
+**SUGGESTED NEXT RESPONSES:**
+1. Yes, somewhere near the front would be great.
+2. Anywhere is fine, as long as it's a window seat.
+3. Could I also get a seat with extra legroom?"""
+
+
+class StubModelManager:
+    """替身模型管理器：回傳固定的辨識結果與生成內容，只測量模型以外的處理成本"""
+
+    def __init__(self, transcripts, whisper_model=None, stream_chunk_size=8):
+        """
+        Args:
+            transcripts (dict): 音頻路徑 -> (秒數, 文字)
+            whisper_model: 若提供，語音辨識改用此 Whisper 模型
+            stream_chunk_size (int): 串流生成時每段的字元數
+        """
+        self.transcripts = transcripts
+        self.whisper_model = whisper_model
+        self.stream_chunk_size = stream_chunk_size
+        self.use_audio_llm = True
+        self.use_gpu = False
+
+    def transcribe_audio(self, audio_path, language="en", return_details=False):
+        if self.whisper_model is not None:
+            from models import summarize_transcription
+            result = self.whisper_model.transcribe(
+                audio_path, language=language, temperature=0.0, verbose=False,
+                word_timestamps=return_details, fp16=False
+            )
+            return summarize_transcription(result) if return_details else result["text"].strip()
+
+        duration, text = self._lookup(audio_path)
+        if not return_details:
+            return text
+
+        tokens = text.split()
+        step = duration / len(tokens)
+        words = [
+            {"word": f" {token}", "start": i * step, "end": i * step + step * 0.8, "probability": 0.9}
+            for i, token in enumerate(tokens)
+        ]
+        return {
+            "text": text,
+            "language": language,
+            "segments": [{
+                "start": 0.0, "end": duration, "text": text,
+                "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.3
+            }],
+            "words": words
+        }
+
+    def _lookup(self, audio):
+        """流程只解碼一次音頻後傳入波形；以長度對應回合成錄音的文字"""
+        if isinstance(audio, str):
+            return self.transcripts[audio]
+        seconds = len(audio) / SAMPLE_RATE
+        return min(self.transcripts.values(), key=lambda entry: abs(entry[0] - seconds))
+
+    def tokenize_text(self, text):
+        return [len(token) for token in text.split()]
+
+    def generate_audio_response(self, audio_path, prompt, max_tokens=256, prefix_token_ids=None, deterministic=False):
+        return STUB_LLM_RESPONSE
+
+    def generate_text_response(self, prompt, max_tokens=256, deterministic=True):
+        return STUB_LLM_RESPONSE
+
+    def stream_audio_response(self, audio_path, prompt, max_tokens=256, prefix_token_ids=None, deterministic=False):
+        for i in range(0, len(STUB_LLM_RESPONSE), self.stream_chunk_size):
+            yield STUB_LLM_RESPONSE[i:i + self.stream_chunk_size]
+
+
+def write_synthetic_recording(path, duration, text, sr=SAMPLE_RATE, seed=0):
+    """以音高起伏的諧波音節與字間停頓模擬說話聲，寫為 16-bit WAV"""
+    rng = np.random.default_rng(seed)
+    words = text.split()
+    audio = np.zeros(int(duration * sr), dtype=np.float32)
+    slot = len(audio) // len(words)
+
+    for i in range(len(words)):
+        length = int(slot * 0.7)
+        t = np.arange(length) / sr
+        f0 = 120 + 40 * np.sin(2 * np.pi * 0.5 * (i / len(words))) + 10 * rng.standard_normal()
+        syllable = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 5))
+        syllable *= np.hanning(length)
+        audio[i * slot:i * slot + length] += 0.3 * syllable.astype(np.float32)
+
+    audio += 0.003 * rng.standard_normal(len(audio)).astype(np.float32)
+    pcm = (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+    with wave.open(path, "w") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sr)
+        wav_file.writeframes(pcm.tobytes())
+
+
+def summarize(samples, total_seconds=None):
+    """計算延遲百分位數（毫秒）與吞吐量（次/秒）"""
+    values = np.asarray(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    total_seconds = total_seconds if total_seconds is not None else float(np.sum(samples))
+    return {
+        "count": len(values),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "min_ms": round(float(values.min()), 3),
+        "max_ms": round(float(values.max()), 3),
+        "throughput_per_s": round(len(values) / total_seconds, 2) if total_seconds > 0 else None
+    }
+
+
+def measure(fn, inputs, iterations, warmup=2):
+    """對每個輸入輪流呼叫 fn，回傳每次呼叫的耗時（秒）"""
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class Benchmark:
+    """建立替身環境並逐一測量各階段"""
+
+    def __init__(self, iterations=30, concurrency=8, whisper=None, workdir=None):
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.whisper = whisper
+        self.workdir = workdir or tempfile.mkdtemp(prefix="bench_")
+
+        self.recordings = []
+        transcripts = {}
+        for seed, (name, duration, text) in enumerate(SYNTHETIC_RECORDINGS):
+            path = os.path.join(self.workdir, f"{name}.wav")
+            write_synthetic_recording(path, duration, text, seed=seed)
+            self.recordings.append({"name": name, "path": path, "duration": duration, "text": text})
+            transcripts[path] = (duration, text)
+
+        whisper_model = None
+        if whisper:
+            import whisper as whisper_lib
+            whisper_model = whisper_lib.load_model(whisper, device="cpu")
+
+        from processors import ConversationManager
+        self.progress_store = ProgressStore(os.path.join(self.workdir, "progress.db"))
+        self.model_manager = StubModelManager(transcripts, whisper_model)
+        self.manager = ConversationManager(progress_store=self.progress_store, model_manager=self.model_manager)
+        self.processor = self.manager.audio_processor
+        # 各階段測量實際的生成與解析；快取命中另以 analysis_cache_hit 階段測量
+        self.processor.analysis_cache.enabled = False
+        self.processor.pregenerated_turns = PregeneratedTurns(path=None)
+
+    def _analyze_llm(self, recording, streaming):
+        kwargs = {"on_event": lambda event: None} if streaming else {}
+        return self.processor._analyze_with_audio_llm(
+            recording["path"], recording["text"], BENCH_SCENARIO, "", BENCH_DIFFICULTY,
+            BENCH_FOCUS, BENCH_ACCENT, BENCH_FEEDBACK, True, **kwargs
+        )
+
+    def _analyze_cached(self, recording):
+        self.processor.analysis_cache.enabled = True
+        try:
+            return self._analyze_llm(recording, streaming=False)
+        finally:
+            self.processor.analysis_cache.enabled = False
+
+    def _process(self, recording):
+        return self.manager.process_user_input(
+            audio_path=recording["path"],
+            scenario=BENCH_SCENARIO,
+            difficulty=BENCH_DIFFICULTY,
+            pronunciation_focus=BENCH_FOCUS,
+            accent_preference=BENCH_ACCENT,
+            feedback_detail=BENCH_FEEDBACK,
+            session_id=f"bench:{recording['name']}",
+            track_progress=False
+        )
+
+    def _bench_async(self):
+        """同時送出 concurrency × iterations 個請求，測量各請求延遲與整體吞吐量"""
+        async def one(recording):
+            start = time.perf_counter()
+            await self.manager.process_user_input_async(
+                audio_path=recording["path"],
+                scenario=BENCH_SCENARIO,
+                difficulty=BENCH_DIFFICULTY,
+                session_id=f"bench-async:{recording['name']}",
+                track_progress=False
+            )
+            return time.perf_counter() - start
+
+        async def run():
+            jobs = [self.recordings[i % len(self.recordings)] for i in range(self.iterations)]
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def limited(recording):
+                async with semaphore:
+                    return await one(recording)
+
+            start = time.perf_counter()
+            samples = await asyncio.gather(*(limited(job) for job in jobs))
+            return samples, time.perf_counter() - start
+
+        samples, total = asyncio.run(run())
+        return summarize(samples, total)
+
+    def run(self, stages=None):
+        from processors import create_advanced_prompt, prompt_compiler
+
+        waveforms = [load_waveform(r["path"]) for r in self.recordings]
+
+        def prompt_cold(_):
+            prompt_compiler.clear()
+            create_advanced_prompt(BENCH_SCENARIO, BENCH_DIFFICULTY, BENCH_FOCUS, BENCH_ACCENT, BENCH_FEEDBACK, True)
+
+        def prompt_warm(_):
+            create_advanced_prompt(BENCH_SCENARIO, BENCH_DIFFICULTY, BENCH_FOCUS, BENCH_ACCENT, BENCH_FEEDBACK, True)
+
+        stage_functions = {
+            "prompt_build_cold": (prompt_cold, self.recordings),
+            "prompt_build_warm": (prompt_warm, self.recordings),
+            "transcribe": (lambda r: self.processor.transcribe_speech_detailed(r["path"]), self.recordings),
+            "load_waveform": (lambda r: load_waveform(r["path"]), self.recordings),
+            "feature_extraction": (
+                lambda item: extract_acoustic_features(item[0], word_count=len(item[1]["text"].split())),
+                list(zip(waveforms, self.recordings))
+            ),
+            "llm_generate": (lambda r: self._analyze_llm(r, streaming=False), self.recordings),
+            "llm_generate_streaming": (lambda r: self._analyze_llm(r, streaming=True), self.recordings),
+            "analysis_cache_hit": (self._analyze_cached, self.recordings),
+            "parse_response": (lambda _: parse_response(STUB_LLM_RESPONSE), self.recordings),
+            "simple_method": (
+                lambda r: self.processor._analyze_with_simple_method(
+                    r["text"], BENCH_SCENARIO, BENCH_DIFFICULTY, BENCH_FOCUS, BENCH_ACCENT,
+                    BENCH_FEEDBACK, audio_path=r["path"]
+                ),
+                self.recordings
+            ),
+            "process_user_input": (self._process, self.recordings)
+        }
+
+        results = {}
+        for name, (fn, inputs) in stage_functions.items():
+            if stages and name not in stages:
+                continue
+            results[name] = summarize(measure(fn, inputs, self.iterations))
+            print_stage(name, results[name])
+
+        if not stages or "process_user_input_async" in stages:
+            results["process_user_input_async"] = self._bench_async()
+            print_stage("process_user_input_async", results["process_user_input_async"])
+
+        return results
+
+    def close(self):
+        self.progress_store.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def print_stage(name, summary):
+    print(f"  {name:<26} p50 {summary['p50_ms']:>9.3f}ms  p95 {summary['p95_ms']:>9.3f}ms  "
+          f"p99 {summary['p99_ms']:>9.3f}ms  {summary['throughput_per_s']}/s")
+
+
+def compare_with_baseline(results, baseline, threshold=0.2):
+    """比較 p50/p95 與基準結果，回傳超過門檻的退步項目"""
+    regressions = []
+    print("\n📊 與基準比較:")
+    for name, summary in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            print(f"  {name:<26} (基準中沒有此階段)")
+            continue
+        line = f"  {name:<26}"
+        for metric in ("p50_ms", "p95_ms"):
+            if base[metric] <= 0:
+                continue
+            change = summary[metric] / base[metric] - 1
+            line += f"  {metric[:3]} {change:+7.1%}"
+            if change > threshold:
+                regressions.append({"stage": name, "metric": metric, "baseline": base[metric],
+                                    "current": summary[metric], "change": change})
+        print(line)
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="各處理階段延遲基準測試")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="結果輸出 JSON")
+    parser.add_argument("--iterations", type=int, default=30, help="每個階段的測量次數")
+    parser.add_argument("--concurrency", type=int, default=8, help="非同步流程的同時請求數")
+    parser.add_argument("--stage", action="append", help="只測量指定階段，可重複指定")
+    parser.add_argument("--whisper", help="使用指定大小的 Whisper 模型（例如 tiny）取代替身辨識")
+    parser.add_argument("--baseline", help="基準結果 JSON，用於比較退步")
+    parser.add_argument("--threshold", type=float, default=0.2, help="視為退步的增幅（0.2 = 20%%）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print("⏱️  階段延遲基準測試")
+    print(f"  測量次數: {args.iterations}，錄音: {', '.join(name for name, _, _ in SYNTHETIC_RECORDINGS)}")
+    print(f"  語音辨識: {'Whisper ' + args.whisper if args.whisper else '替身模型'}，Audio-LLM: 替身模型")
+
+    benchmark = Benchmark(args.iterations, args.concurrency, args.whisper)
+    try:
+        stages = benchmark.run(args.stage)
+    finally:
+        benchmark.close()
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "whisper": args.whisper,
+            "recordings": [{"name": name, "duration": duration} for name, duration, _ in SYNTHETIC_RECORDINGS]
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__
+        },
+        "stages": stages
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 結果已儲存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 項超過 {args.threshold:.0%} 的退步")
+            return 1
+        print("\n✅ 沒有超過門檻的退步")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+confidence_scoring.py - 以Whisper辨識信心度評估發音可懂度
+將逐字機率與分段 avg_logprob / no_speech_prob / compression_ratio 轉為可懂度分數，並標記可能發音不清的單字
+"""
+
+import math
+import re
+
+from fluency_analysis import FILLER_WORDS
+
+# 各級別的判定門檻：低於 low_confidence_prob 的單字會被標記
+CONFIDENCE_CALIBRATION = {
+    "beginner": {"low_confidence_prob": 0.40, "prob_floor": 0.30, "prob_ceiling": 0.90},
+    "elementary": {"low_confidence_prob": 0.45, "prob_floor": 0.35, "prob_ceiling": 0.92},
+    "intermediate": {"low_confidence_prob": 0.50, "prob_floor": 0.40, "prob_ceiling": 0.94},
+    "upper_intermediate": {"low_confidence_prob": 0.55, "prob_floor": 0.45, "prob_ceiling": 0.95},
+    "advanced": {"low_confidence_prob": 0.60, "prob_floor": 0.50, "prob_ceiling": 0.96}
+}
+
+NO_SPEECH_THRESHOLD = 0.6      # 高於此值的分段可能不是語音
+COMPRESSION_RATIO_LIMIT = 2.4  # 高於此值通常代表重複或幻覺輸出
+MAX_FLAGGED_WORDS = 8
+
+_WORD_CLEAN_RE = re.compile(r"[^a-z']")
+
+
+def _scale(value, floor, ceiling):
+    return max(0.0, min(1.0, (value - floor) / (ceiling - floor)))
+
+
+def score_confidence(transcription, level="intermediate"):
+    """由辨識信心度計算可懂度分數與低信心單字
+
+    Returns:
+        dict: intelligibility_score、mean_word_prob、segment_confidence、low_confidence_words 等；
+              沒有逐字機率時回傳None
+    """
+    calibration = CONFIDENCE_CALIBRATION.get(level, CONFIDENCE_CALIBRATION["intermediate"])
+    words = [w for w in transcription.get("words", []) if w.get("probability") is not None]
+    if not words:
+        return None
+
+    # 逐字機率以發音長度加權，長字的辨識結果較有參考價值
+    weights = [max(w["end"] - w["start"], 0.05) for w in words]
+    mean_word_prob = sum(w["probability"] * weight for w, weight in zip(words, weights)) / sum(weights)
+
+    segments = transcription.get("segments", [])
+    segment_confidence = None
+    no_speech_prob = 0.0
+    repetitive = False
+    if segments and all(seg.get("avg_logprob") is not None for seg in segments):
+        durations = [max(seg["end"] - seg["start"], 0.05) for seg in segments]
+        segment_confidence = sum(
+            math.exp(seg["avg_logprob"]) * duration for seg, duration in zip(segments, durations)
+        ) / sum(durations)
+        no_speech_prob = max(seg.get("no_speech_prob", 0.0) for seg in segments)
+        repetitive = any(seg.get("compression_ratio", 0.0) > COMPRESSION_RATIO_LIMIT for seg in segments)
+
+    word_component = _scale(mean_word_prob, calibration["prob_floor"], calibration["prob_ceiling"])
+    if segment_confidence is not None:
+        segment_component = _scale(segment_confidence, calibration["prob_floor"], calibration["prob_ceiling"])
+        confidence = 0.7 * word_component + 0.3 * segment_component
+    else:
+        confidence = word_component
+
+    score = 45 + 55 * confidence
+    if no_speech_prob > NO_SPEECH_THRESHOLD:
+        score -= 10
+    if repetitive:
+        score -= 10
+
+    low_confidence_words = []
+    for word in words:
+        text = _WORD_CLEAN_RE.sub("", word["word"].lower())
+        if not text or text in FILLER_WORDS:
+            continue
+        if word["probability"] < calibration["low_confidence_prob"]:
+            low_confidence_words.append({
+                "word": word["word"].strip(),
+                "start": word["start"],
+                "end": word["end"],
+                "probability": word["probability"]
+            })
+    low_confidence_words.sort(key=lambda w: w["probability"])
+
+    return {
+        "intelligibility_score": int(round(max(40, min(100, score)))),
+        "mean_word_prob": mean_word_prob,
+        "segment_confidence": segment_confidence,
+        "no_speech_prob": no_speech_prob,
+        "repetitive": repetitive,
+        "low_confidence_words": low_confidence_words[:MAX_FLAGGED_WORDS],
+        "low_confidence_count": len(low_confidence_words)
+    }
+
+
+def format_confidence_feedback(confidence):
+    """生成可懂度回饋文字"""
+    feedback = f"\n🔍 可懂度分析（語音辨識信心度）: {confidence['intelligibility_score']}/100\n"
+    if confidence["low_confidence_words"]:
+        flagged = "、".join(
+            f"{w['word']} ({w['probability']:.0%})" for w in confidence["low_confidence_words"]
+        )
+        feedback += f"- 可能發音不清楚的單字: {flagged}\n"
+    else:
+        feedback += "- 所有單字都能被清楚辨識\n"
+    return feedback
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+fluency_analysis.py - 以Whisper逐字時間戳分析流暢度
+計算語速、字間停頓、猶豫片段與構音速率
+"""
+
+import re
+
+from acoustic_scoring import score_fluency
+
+MIN_PAUSE_SECONDS = 0.25         # 短於此長度的字間空隙不算停頓
+HESITATION_PAUSE_SECONDS = 0.7   # 長於此長度的停頓視為猶豫
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "uhm", "er", "erm", "ah", "eh", "hmm", "mm", "mhm"}
+
+_WORD_CLEAN_RE = re.compile(r"[^a-z']")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+
+
+def _normalize_word(word):
+    return _WORD_CLEAN_RE.sub("", word.lower())
+
+
+def estimate_syllables(word):
+    """以母音群數量估計英文單字的音節數"""
+    word = _normalize_word(word)
+    if not word:
+        return 0
+    count = len(_VOWEL_GROUP_RE.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and count > 1:
+        count -= 1
+    return max(1, count)
+
+
+def analyze_word_timings(words):
+    """由逐字時間戳計算流暢度指標
+
+    Args:
+        words (list): [{"word", "start", "end", "probability"}, ...]，依時間排序
+
+    Returns:
+        dict: 流暢度指標；沒有可用的字時回傳None
+    """
+    words = [w for w in words if _normalize_word(w["word"]) and w["end"] >= w["start"]]
+    if not words:
+        return None
+
+    start = words[0]["start"]
+    end = words[-1]["end"]
+    duration = max(end - start, 1e-3)
+
+    pauses = []
+    hesitations = []
+    for previous, current in zip(words, words[1:]):
+        gap = current["start"] - previous["end"]
+        if gap >= MIN_PAUSE_SECONDS:
+            pauses.append(gap)
+        if gap >= HESITATION_PAUSE_SECONDS:
+            hesitations.append({
+                "type": "pause",
+                "start": previous["end"],
+                "end": current["start"],
+                "after_word": previous["word"].strip()
+            })
+
+    filler_count = 0
+    for word in words:
+        if _normalize_word(word["word"]) in FILLER_WORDS:
+            filler_count += 1
+            hesitations.append({
+                "type": "filler",
+                "start": word["start"],
+                "end": word["end"],
+                "word": word["word"].strip()
+            })
+    hesitations.sort(key=lambda h: h["start"])
+
+    content_words = len(words) - filler_count
+    phonation_time = sum(w["end"] - w["start"] for w in words)
+    syllables = sum(estimate_syllables(w["word"]) for w in words)
+    pause_total = sum(pauses)
+
+    return {
+        "word_count": content_words,
+        "duration": duration,
+        "words_per_minute": content_words / duration * 60,
+        "pause_count": len(pauses),
+        "pause_ratio": pause_total / duration,
+        "mean_pause": pause_total / len(pauses) if pauses else 0.0,
+        "max_pause": max(pauses) if pauses else 0.0,
+        "filler_count": filler_count,
+        "hesitation_count": len(hesitations),
+        "hesitations": hesitations,
+        "articulation_rate": syllables / max(phonation_time, 1e-3)
+    }
+
+
+def score_fluency_from_timings(metrics, level="intermediate"):
+    """依級別基準計算流暢度分數，與聲學評分使用相同的校準表"""
+    score = score_fluency({
+        "active_duration": metrics["duration"],
+        "speech_rate_wpm": metrics["words_per_minute"],
+        "pause_count": metrics["pause_count"],
+        "pause_ratio": metrics["pause_ratio"],
+        "mean_pause": metrics["mean_pause"]
+    }, level)
+    score -= min(10, 3 * metrics["filler_count"])
+    return int(max(40, min(100, score)))
+
+
+def format_fluency_feedback(metrics):
+    """生成流暢度回饋文字"""
+    feedback = "\n⏱️ 流暢度分析：\n"
+    feedback += f"- 語速: {metrics['words_per_minute']:.0f} 字/分鐘\n"
+    feedback += f"- 構音速率: {metrics['articulation_rate']:.1f} 音節/秒\n"
+    feedback += f"- 字間停頓: 平均 {metrics['mean_pause']:.2f} 秒，最長 {metrics['max_pause']:.2f} 秒\n"
+
+    if metrics["hesitations"]:
+        feedback += f"- 猶豫片段: {metrics['hesitation_count']} 處\n"
+        for hesitation in metrics["hesitations"][:3]:
+            if hesitation["type"] == "filler":
+                feedback += f"  • {hesitation['start']:.1f}秒 填充詞「{hesitation['word']}」\n"
+            else:
+                feedback += (f"  • {hesitation['start']:.1f}秒 在「{hesitation['after_word']}」之後"
+                             f"停頓 {hesitation['end'] - hesitation['start']:.1f} 秒\n")
+    else:
+        feedback += "- 猶豫片段: 無，說話連貫\n"
+
+    return feedback
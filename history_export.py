@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+history_export.py - 學習歷程匯出
+由學習進度資料庫分批讀取學習者的完整紀錄（分數、練習設定、可選的錄音路徑），
+在背景執行緒逐批寫成 JSONL 或 Parquet（欄式格式，每批一個 row group），
+介面只負責送出工作與查詢進度，匯出再大也不會佔用介面的工作執行緒或一次載入記憶體；
+匯出檔在完成一段時間後（file_ttl_seconds）自動刪除，不與錄音共用容量清理
+"""
+
+import os
+import json
+import time
+import uuid
+import datetime
+import importlib.util
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_EXPORT_DIR = "exports"
+EXPORT_FORMATS = ("jsonl", "parquet")
+
+# 匯出欄位（依序）；audio_ref 只在要求時輸出
+EXPORT_FIELDS = (
+    "id", "session_id", "timestamp", "time", "scenario", "difficulty", "level", "recognized_text",
+    "response_text", "pronunciation_score", "fluency_score", "analysis_mode", "settings"
+)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+def available_formats():
+    """目前環境可用的匯出格式（Parquet 需要 pyarrow）"""
+    if importlib.util.find_spec("pyarrow") is None:
+        return ("jsonl",)
+    return EXPORT_FORMATS
+
+
+def export_row(record, include_audio_refs=False):
+    """將資料庫紀錄轉為匯出列（加上可讀的時間）"""
+    time_text = datetime.datetime.fromtimestamp(record["timestamp"]).isoformat(timespec="seconds")
+    row = {field: time_text if field == "time" else record.get(field) for field in EXPORT_FIELDS}
+    if include_audio_refs:
+        row["audio_ref"] = record.get("audio_ref")
+    return row
+
+
+def iter_chunks(records, chunk_size):
+    """將紀錄切成固定大小的批次"""
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def write_jsonl(path, chunks):
+    """逐批寫入 JSONL（每行一筆紀錄），回傳筆數"""
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in chunk))
+            rows += len(chunk)
+    return rows
+
+
+def write_parquet(path, chunks, include_audio_refs=False):
+    """逐批寫入 Parquet，每批一個 row group；練習設定以 JSON 字串保存，回傳筆數"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fields = [
+        ("id", pa.int64()), ("session_id", pa.string()), ("timestamp", pa.float64()), ("time", pa.string()),
+        ("scenario", pa.string()), ("difficulty", pa.string()), ("level", pa.string()),
+        ("recognized_text", pa.string()), ("response_text", pa.string()),
+        ("pronunciation_score", pa.int32()), ("fluency_score", pa.int32()),
+        ("analysis_mode", pa.string()), ("settings", pa.string())
+    ]
+    if include_audio_refs:
+        fields.append(("audio_ref", pa.string()))
+    schema = pa.schema(fields)
+
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            columns = {name: [row.get(name) for row in chunk] for name, _ in fields}
+            columns["settings"] = [json.dumps(value or {}, ensure_ascii=False) for value in columns["settings"]]
+            writer.write_table(pa.table(columns, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+class HistoryExporter:
+    """在背景執行緒執行匯出工作；工作狀態保存在記憶體中供介面查詢"""
+
+    def __init__(self, progress_store, output_dir=DEFAULT_EXPORT_DIR, chunk_size=500, max_workers=1, max_jobs=256,
+                 file_ttl_seconds=3600, cleanup_interval=60):
+        """
+        Args:
+            progress_store: 學習進度資料庫（ProgressStore）
+            output_dir (str): 匯出檔案的資料夾
+            chunk_size (int): 每次讀取與寫入的筆數
+            max_workers (int): 同時執行的匯出工作數
+            max_jobs (int): 保留狀態的工作數上限，超過時移除最舊的已結束工作
+            file_ttl_seconds (float): 匯出檔在工作完成後保留的秒數，None 表示不刪除
+            cleanup_interval (float): 兩次清理之間的最短間隔（秒）
+        """
+        self.progress_store = progress_store
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.max_jobs = max_jobs
+        self.file_ttl_seconds = file_ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history-export")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.exported_rows = 0
+        self.expired_files = 0
+
+        os.makedirs(output_dir, exist_ok=True)
+        # 先前執行留下的匯出檔依修改時間（寫入完成的時間）一併清理
+        self.cleanup()
+
+    def start(self, session_id, export_format="jsonl", include_audio_refs=False):
+        """送出匯出工作並立即回傳工作ID；格式不支援時拋出 ValueError"""
+        if export_format not in available_formats():
+            raise ValueError(f"不支援的匯出格式: {export_format}，可用: {', '.join(available_formats())}")
+
+        job_id = uuid.uuid4().hex[:12]
+        prefix = "".join(c for c in (session_id or "anonymous")[:12] if c.isalnum() or c in "-_")
+        filename = f"history_{prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{job_id[:4]}.{export_format}"
+        job = {
+            "job_id": job_id,
+            "session_id": session_id,
+            "format": export_format,
+            "include_audio_refs": include_audio_refs,
+            "status": JOB_QUEUED,
+            "rows": 0,
+            "path": os.path.join(self.output_dir, filename),
+            "error": None,
+            "created_at": time.time(),
+            "finished_at": None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job)
+        if time.time() - self._last_cleanup >= self.cleanup_interval:
+            self.cleanup()
+        return job_id
+
+    def cleanup(self, now=None):
+        """刪除完成超過 file_ttl_seconds 的匯出檔，回傳刪除的檔案數
+
+        有工作紀錄的檔案以工作完成時間判斷，其他檔案（先前執行或已移除的工作）以修改時間判斷
+        """
+        if self.file_ttl_seconds is None:
+            return 0
+        now = time.time() if now is None else now
+        deadline = now - self.file_ttl_seconds
+        with self._lock:
+            self._last_cleanup = now
+            finished_at = {job["path"]: job["finished_at"] for job in self._jobs.values()}
+
+        expired = []
+        for entry in os.scandir(self.output_dir):
+            if not entry.is_file():
+                continue
+            path = entry.path
+            if path in finished_at or path.endswith(".part") and path[:-len(".part")] in finished_at:
+                # 進行中的工作（尚未完成）不刪除
+                completed = finished_at.get(path)
+                if completed is None or completed > deadline:
+                    continue
+            else:
+                try:
+                    if entry.stat().st_mtime > deadline:
+                        continue
+                except OSError:
+                    continue
+            try:
+                os.remove(path)
+                expired.append(path)
+            except OSError as e:
+                print(f"⚠️  刪除過期匯出檔失敗 {path}: {e}")
+
+        if expired:
+            with self._lock:
+                for job_id in [job_id for job_id, job in self._jobs.items() if job["path"] in expired]:
+                    del self._jobs[job_id]
+                self.expired_files += len(expired)
+        return len(expired)
+
+    def _prune(self):
+        """移除最舊的已結束工作（需持有鎖）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (JOB_DONE, JOB_FAILED)]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[job_id]
+
+    def _rows(self, job):
+        """分批讀取紀錄並轉為匯出列，同時更新工作的進度"""
+        records = self.progress_store.iter_records(session_id=job["session_id"], batch_size=self.chunk_size)
+        for chunk in iter_chunks(records, self.chunk_size):
+            yield [export_row(record, job["include_audio_refs"]) for record in chunk]
+            job["rows"] += len(chunk)
+
+    def _run(self, job):
+        job["status"] = JOB_RUNNING
+        temp_path = job["path"] + ".part"
+        try:
+            # 先寫入背景寫入器中尚未落盤的紀錄，匯出才包含剛完成的回合
+            self.progress_store.flush()
+            if job["format"] == "parquet":
+                rows = write_parquet(temp_path, self._rows(job), job["include_audio_refs"])
+            else:
+                rows = write_jsonl(temp_path, self._rows(job))
+            os.replace(temp_path, job["path"])
+            job["rows"] = rows
+            job["status"] = JOB_DONE
+            self.completed += 1
+            self.exported_rows += rows
+        except Exception as e:
+            print(f"⚠️  匯出學習歷程失敗 {job['path']}: {e}")
+            job["status"] = JOB_FAILED
+            job["error"] = str(e)
+            self.failed += 1
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        finally:
+            job["finished_at"] = time.time()
+
+    def status(self, job_id):
+        """工作狀態（複本）；未知的工作回傳None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id, timeout=None, poll_interval=0.1):
+        """等待工作結束並回傳狀態（測試與命令列使用）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if job is None or job["status"] in (JOB_DONE, JOB_FAILED):
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            time.sleep(poll_interval)
+
+    def get_stats(self):
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job["status"] in (JOB_QUEUED, JOB_RUNNING))
+        return {
+            "active": active,
+            "completed": self.completed,
+            "failed": self.failed,
+            "exported_rows": self.exported_rows,
+            "expired_files": self.expired_files,
+            "formats": list(available_formats())
+        }
+
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+lazy_import.py - 延遲匯入大型相依套件
+torch / whisper / transformers 匯入一次就要數秒；以代理物件取代模組層級的匯入，
+第一次實際使用時才載入，讓只需要評分、儲存或工具函式的程式可以快速匯入
+"""
+
+import importlib
+import threading
+
+_import_lock = threading.Lock()
+
+
+class LazyModule:
+    """第一次存取屬性時才匯入的模組代理"""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+
+def lazy_import(name):
+    """回傳模組代理；例如 torch = lazy_import("torch")"""
+    return LazyModule(name)
+
+
+def is_loaded(module):
+    """代理的模組是否已實際匯入（一般模組一律視為已匯入）"""
+    if isinstance(module, LazyModule):
+        return module.__dict__["_module"] is not None
+    return True
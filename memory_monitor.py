@@ -4,7 +4,6 @@ memory_monitor.py - 記憶體監控模組
 監控GPU記憶體使用量，超過限制時自動暫停Code
 """
 
-import torch
 import psutil
 import threading
 import time
@@ -13,12 +12,77 @@ import signal
 import gc
 import warnings
 
+from lazy_import import lazy_import
+
+torch = lazy_import("torch")
+
+def normalize_gpu_limits(gpu_limit_gb, gpu_count):
+    """將GPU記憶體限制統一為 {裝置編號: GB} 格式
+    
+    gpu_limit_gb 可為單一數值（套用到所有GPU）、列表（依序對應各GPU）
+    或字典（鍵可為 0、"0"、"cuda:0"、"GPU_0"）。未列出的GPU不分配預算。
+    """
+    if gpu_limit_gb is None:
+        return {}
+    
+    if isinstance(gpu_limit_gb, (int, float)):
+        return {i: float(gpu_limit_gb) for i in range(gpu_count)}
+    
+    if isinstance(gpu_limit_gb, (list, tuple)):
+        return {i: float(limit) for i, limit in enumerate(gpu_limit_gb)
+                if i < gpu_count and limit is not None}
+    
+    limits = {}
+    for key, limit in gpu_limit_gb.items():
+        index = int(str(key).replace("cuda:", "").replace("GPU_", ""))
+        if index < gpu_count and limit is not None:
+            limits[index] = float(limit)
+    return limits
+
+def plan_model_placement(model_size_gb, gpu_budgets_gb, cpu_offload_gb=0, reserve_gb=2, min_gpu_share_gb=1):
+    """根據各裝置預算規劃模型放置方式
+    
+    Args:
+        model_size_gb (float): 模型權重大小（float16，GB）
+        gpu_budgets_gb (dict): {裝置編號: 可用預算GB}，已扣除目前使用量
+        cpu_offload_gb (float): 允許卸載到CPU的記憶體（GB）
+        reserve_gb (float): 每張GPU保留給推論（activation/KV cache）的空間
+        min_gpu_share_gb (float): 低於此值的GPU不參與放置
+    
+    Returns:
+        dict: strategy ("gpu"/"offload"/"cpu")、dtype、device_map、max_memory
+    """
+    gpu_shares = {}
+    for index, budget in sorted(gpu_budgets_gb.items()):
+        share = budget - reserve_gb
+        if share >= min_gpu_share_gb:
+            gpu_shares[index] = share
+    
+    gpu_capacity = sum(gpu_shares.values())
+    plan = {
+        "model_size_gb": model_size_gb,
+        "gpu_capacity_gb": gpu_capacity,
+        "cpu_offload_gb": cpu_offload_gb
+    }
+    
+    if gpu_shares and gpu_capacity >= model_size_gb:
+        max_memory = {index: f"{share:.2f}GiB" for index, share in gpu_shares.items()}
+        plan.update({"strategy": "gpu", "dtype": "float16", "device_map": "auto", "max_memory": max_memory})
+    elif gpu_shares and gpu_capacity + cpu_offload_gb >= model_size_gb:
+        max_memory = {index: f"{share:.2f}GiB" for index, share in gpu_shares.items()}
+        max_memory["cpu"] = f"{cpu_offload_gb:.2f}GiB"
+        plan.update({"strategy": "offload", "dtype": "float16", "device_map": "auto", "max_memory": max_memory})
+    else:
+        plan.update({"strategy": "cpu", "dtype": "float32", "device_map": "cpu", "max_memory": None})
+    
+    return plan
+
 class MemoryMonitor:
     
     def __init__(self, gpu_limit_gb=20, cpu_limit_gb=32, check_interval=5):
         """        
         Args:
-            gpu_limit_gb (int): GPU記憶體限制（GB）
+            gpu_limit_gb (int | list | dict): GPU記憶體限制（GB），可針對每張GPU個別設定
             cpu_limit_gb (int): CPU記憶體限制（GB）
             check_interval (int): 檢查間隔（秒）
         """
@@ -28,15 +92,22 @@ class MemoryMonitor:
         self.monitoring = False
         self.monitor_thread = None
         self.emergency_cleanup_triggered = False
+        self.gpu_limits = {}
         
         # 檢查CUDA可用性
         self.cuda_available = torch.cuda.is_available()
         if self.cuda_available:
             self.gpu_count = torch.cuda.device_count()
-            print(f"🖥️  檢測到 {self.gpu_count} 個GPU，記憶體限制: {gpu_limit_gb}GB")
+            self.gpu_limits = normalize_gpu_limits(gpu_limit_gb, self.gpu_count)
+            limits_text = ", ".join(f"GPU_{i}: {limit}GB" for i, limit in self.gpu_limits.items())
+            print(f"🖥️  檢測到 {self.gpu_count} 個GPU，記憶體限制: {limits_text}")
         else:
             print("⚠️  未檢測到CUDA，僅監控CPU記憶體")
     
+    def get_gpu_limit(self, device_index):
+        """獲取指定GPU的記憶體限制（GB），未設定預算時回傳None"""
+        return self.gpu_limits.get(device_index)
+    
     def get_gpu_memory_usage(self):
         if not self.cuda_available:
             return {}
@@ -50,6 +121,8 @@ class MemoryMonitor:
                 memory_total = torch.cuda.get_device_properties(i).total_memory / 1024**3  # GB
                 
                 gpu_memory[f"GPU_{i}"] = {
+                    "index": i,
+                    "limit": self.get_gpu_limit(i),
                     "allocated": memory_allocated,
                     "reserved": memory_reserved,
                     "total": memory_total,
@@ -60,6 +133,23 @@ class MemoryMonitor:
         
         return gpu_memory
     
+    def get_placement_budgets(self):
+        """計算每張GPU在限制內尚可使用的記憶體（GB）"""
+        budgets = {}
+        for gpu_id, info in self.get_gpu_memory_usage().items():
+            limit = info["limit"]
+            if limit is None:
+                continue
+            budgets[info["index"]] = max(0.0, min(limit, info["total"]) - info["reserved"])
+        return budgets
+    
+    def _over_limit_devices(self):
+        over_limit = []
+        for gpu_id, info in self.get_gpu_memory_usage().items():
+            if info["limit"] is not None and info["reserved"] > info["limit"]:
+                over_limit.append((gpu_id, info))
+        return over_limit
+    
     def get_cpu_memory_usage(self):
         try:
             # 獲取系統記憶體信息
@@ -90,8 +180,9 @@ class MemoryMonitor:
             if self.cuda_available:
                 print("🧹 清理GPU記憶體...")
                 for i in range(self.gpu_count):
-                    torch.cuda.empty_cache()
-                    torch.cuda.synchronize()
+                    with torch.cuda.device(i):
+                        torch.cuda.synchronize()
+                        torch.cuda.empty_cache()
             
             # 強制垃圾收集
             print("🧹 執行垃圾收集...")
@@ -101,11 +192,9 @@ class MemoryMonitor:
             time.sleep(2)
             
             # 再次檢查記憶體使用
-            gpu_memory = self.get_gpu_memory_usage()
-            for gpu_id, info in gpu_memory.items():
-                if info["reserved"] > self.gpu_limit_gb:
-                    print(f"⚠️  {gpu_id} 記憶體仍超過限制: {info['reserved']:.2f}GB")
-                    return False
+            for gpu_id, info in self._over_limit_devices():
+                print(f"⚠️  {gpu_id} 記憶體仍超過限制: {info['reserved']:.2f}GB > {info['limit']}GB")
+                return False
             
             print("✅ 緊急清理完成")
             self.emergency_cleanup_triggered = False
@@ -139,12 +228,10 @@ class MemoryMonitor:
     
     def check_memory_usage(self):
         if self.cuda_available:
-            gpu_memory = self.get_gpu_memory_usage()
-            for gpu_id, info in gpu_memory.items():
-                if info["reserved"] > self.gpu_limit_gb:
-                    reason = f"{gpu_id} 記憶體使用: {info['reserved']:.2f}GB > {self.gpu_limit_gb}GB"
-                    self.force_kill_program(reason)
-                    return False
+            for gpu_id, info in self._over_limit_devices():
+                reason = f"{gpu_id} 記憶體使用: {info['reserved']:.2f}GB > {info['limit']}GB"
+                self.force_kill_program(reason)
+                return False
         
         cpu_memory = self.get_cpu_memory_usage()
         if cpu_memory and cpu_memory.get("process_usage", 0) > self.cpu_limit_gb:
@@ -160,8 +247,9 @@ class MemoryMonitor:
         if self.cuda_available:
             gpu_memory = self.get_gpu_memory_usage()
             for gpu_id, info in gpu_memory.items():
-                status = "🔴" if info["reserved"] > self.gpu_limit_gb * 0.8 else "🟢"
-                print(f"{status} {gpu_id}: {info['reserved']:.2f}GB / {info['total']:.2f}GB ({info['usage_percent']:.1f}%)")
+                limit = info["limit"] if info["limit"] is not None else info["total"]
+                status = "🔴" if info["reserved"] > limit * 0.8 else "🟢"
+                print(f"{status} {gpu_id}: {info['reserved']:.2f}GB / {info['total']:.2f}GB ({info['usage_percent']:.1f}%) 限制: {limit}GB")
         
         cpu_memory = self.get_cpu_memory_usage()
         if cpu_memory:
@@ -172,7 +260,8 @@ class MemoryMonitor:
         print(f"{'='*30}")
     
     def monitor_loop(self):
-        print(f"🔍 記憶體監控已啟動 (GPU限制: {self.gpu_limit_gb}GB, 檢查間隔: {self.check_interval}秒)")
+        limits_text = ", ".join(f"GPU_{i}: {limit}GB" for i, limit in self.gpu_limits.items()) or "N/A"
+        print(f"🔍 記憶體監控已啟動 (GPU限制: {limits_text}, 檢查間隔: {self.check_interval}秒)")
         
         while self.monitoring:
             try:
@@ -214,6 +303,7 @@ class MemoryMonitor:
             "cpu_memory": self.get_cpu_memory_usage(),
             "limits": {
                 "gpu_limit_gb": self.gpu_limit_gb,
+                "gpu_limits_gb": {f"GPU_{i}": limit for i, limit in self.gpu_limits.items()},
                 "cpu_limit_gb": self.cpu_limit_gb
             },
             "monitoring": self.monitoring
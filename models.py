@@ -2,19 +2,49 @@
 """
 models.py - 模型管理中心
 負責所有AI模型的載入、配置和管理
+torch / whisper / transformers / accelerate 延遲到建立 ModelManager 時才匯入，匯入本模組不會初始化CUDA或載入模型
 """
 
-import torch
-import whisper
-from transformers import Qwen2AudioForConditionalGeneration, AutoProcessor
 import gc
+import time
+import threading
 import warnings
-from memory_monitor import start_memory_monitoring, get_memory_monitor
+from memory_monitor import start_memory_monitoring, get_memory_monitor, normalize_gpu_limits, plan_model_placement
+from tracing import get_tracer, traced, carry_context
+from stage_limiter import create_stage_limiters, stage_limited
+from acoustic_scoring import SAMPLE_RATE, load_audio
+from lazy_import import lazy_import
+from shared_instances import SharedInstances
+
+torch = lazy_import("torch")
+whisper = lazy_import("whisper")
+transformers = lazy_import("transformers")
+accelerate = lazy_import("accelerate")
 warnings.filterwarnings("ignore")
 
+QWEN_AUDIO_MODEL_ID = "Qwen/Qwen2-Audio-7B-Instruct"
+QWEN_AUDIO_FP16_SIZE_GB = 15.6   # 約8.4B參數的float16權重；無法由模型設定估算時使用
+INFERENCE_RESERVE_GB = 2         # 每張GPU保留給activation/KV cache的空間（預設值）
+MODEL_READY_TIMEOUT = 600        # 背景載入時，請求等待Whisper載入完成的最長秒數
+
 class ModelManager:    
-    def __init__(self, gpu_memory_limit=20):
+    def __init__(self, gpu_memory_limit=20, cpu_offload_gb=0, stage_concurrency=None, load_in_background=False,
+                 qwen_audio_size_gb=None, inference_reserve_gb=INFERENCE_RESERVE_GB):
+        """
+        Args:
+            gpu_memory_limit (int | list | dict): GPU記憶體限制（GB），可針對每張GPU個別設定
+            cpu_offload_gb (int): Qwen2-Audio允許卸載到CPU的記憶體（GB），0表示不卸載
+            qwen_audio_size_gb (float): Qwen2-Audio float16權重大小（GB），None表示由模型設定估算
+            inference_reserve_gb (float): 每張GPU保留給activation/KV cache的空間（GB）
+            stage_concurrency (dict): 各模型階段（asr / audio_llm）同時執行的呼叫上限
+            load_in_background (bool): 在背景執行緒載入模型，建構後立即返回（以 get_readiness 查詢進度）
+        """
         self.gpu_memory_limit = gpu_memory_limit
+        self.gpu_memory_limits = {}
+        self.cpu_offload_gb = cpu_offload_gb
+        self.qwen_audio_size_gb = qwen_audio_size_gb
+        self.inference_reserve_gb = inference_reserve_gb
+        self.placement_plan = None
         self.device = None
         self.use_gpu = False
         self.whisper_model = None
@@ -22,11 +52,24 @@ class ModelManager:
         self.audio_llm_processor = None
         self.use_audio_llm = False
         self.memory_monitor = None
+        self.stage_limiters = create_stage_limiters(stage_concurrency)
+        
+        self.loading_status = {"whisper": "pending", "audio_llm": "pending"}
+        self.loading_started_at = None
+        self.loading_finished_at = None
+        self.load_error = None
+        self._whisper_ready = threading.Event()
+        self._loaded = threading.Event()
+        self._loaded_callbacks = []
+        self._callbacks_lock = threading.Lock()
         
         # 初始化
         self._setup_gpu()
         self._start_memory_monitoring()
-        self._load_models()
+        if load_in_background:
+            threading.Thread(target=self._load_models_in_background, name="model-loader", daemon=True).start()
+        else:
+            self._load_models()
     
     def _start_memory_monitoring(self):
         print(f"🔍 啟動記憶體監控 (限制: {self.gpu_memory_limit}GB)")
@@ -51,6 +94,10 @@ class ModelManager:
             self.use_gpu = True
             print(f"使用設備: {self.device}")
             
+            self.gpu_memory_limits = normalize_gpu_limits(self.gpu_memory_limit, gpu_count)
+            for i, limit in self.gpu_memory_limits.items():
+                print(f"GPU {i} 記憶體預算: {limit}GB")
+            
             torch.cuda.empty_cache()
             gc.collect()
         else:
@@ -58,21 +105,24 @@ class ModelManager:
             self.device = torch.device("cpu")
             self.use_gpu = False
     
+    @traced("_memory_check_and_cleanup")
     def _memory_check_and_cleanup(self, operation_name=""):
+        get_tracer().set_attribute("operation", operation_name)
         if not self.use_gpu:
             return True
             
         try:
-            current_memory = torch.cuda.memory_reserved(0) / 1024**3
-            if current_memory > self.gpu_memory_limit * 0.9:  # 90%警告
-                print(f"⚠️  {operation_name} - 記憶體使用接近限制: {current_memory:.2f}GB")
-                self.clear_gpu_memory()
-                
-                # 再次檢查
-                current_memory = torch.cuda.memory_reserved(0) / 1024**3
-                if current_memory > self.gpu_memory_limit:
-                    print(f"🚨 記憶體仍超過限制: {current_memory:.2f}GB > {self.gpu_memory_limit}GB")
-                    return False
+            for i, limit in self.gpu_memory_limits.items():
+                current_memory = torch.cuda.memory_reserved(i) / 1024**3
+                if current_memory > limit * 0.9:  # 90%警告
+                    print(f"⚠️  {operation_name} - GPU {i} 記憶體使用接近限制: {current_memory:.2f}GB")
+                    self.clear_gpu_memory()
+                    
+                    # 再次檢查
+                    current_memory = torch.cuda.memory_reserved(i) / 1024**3
+                    if current_memory > limit:
+                        print(f"🚨 GPU {i} 記憶體仍超過限制: {current_memory:.2f}GB > {limit}GB")
+                        return False
             
             return True
         except Exception as e:
@@ -120,32 +170,24 @@ class ModelManager:
             return False
             
         try:
-            if self.use_gpu:
-                gpu_memory = torch.cuda.get_device_properties(0).total_memory / 1024**3
-                current_memory = torch.cuda.memory_reserved(0) / 1024**3
-                available_memory = gpu_memory - current_memory
-                
-                print(f"GPU記憶體: 總計{gpu_memory:.1f}GB, 已用{current_memory:.1f}GB, 可用{available_memory:.1f}GB")
-                
-                if available_memory < 6:
-                    print("可用記憶體不足6GB，使用CPU模式")
-                    torch_dtype = torch.float32
-                    device_map = "cpu"
-                elif available_memory < 10:
-                    print("可用記憶體有限，使用float16和量化")
-                    torch_dtype = torch.float16
-                    device_map = {"": 0}
-                else:
-                    torch_dtype = torch.float16
-                    device_map = "auto"
+            self.placement_plan = self._plan_qwen_audio_placement()
+            plan = self.placement_plan
+            torch_dtype = getattr(torch, plan["dtype"])
+            device_map = plan["device_map"]
+            max_memory = plan["max_memory"]
+            
+            if plan["strategy"] == "gpu":
+                print(f"依預算放置於GPU: {max_memory}")
+            elif plan["strategy"] == "offload":
+                print(f"GPU預算不足以容納完整模型，部分卸載至CPU: {max_memory}")
             else:
-                torch_dtype = torch.float32
-                device_map = "cpu"
+                print("GPU預算不足，使用CPU模式")
 
-            self.audio_llm_model = Qwen2AudioForConditionalGeneration.from_pretrained(
-                "Qwen/Qwen2-Audio-7B-Instruct",
+            self.audio_llm_model = transformers.Qwen2AudioForConditionalGeneration.from_pretrained(
+                QWEN_AUDIO_MODEL_ID,
                 torch_dtype=torch_dtype,
                 device_map=device_map,
+                max_memory=max_memory,
                 trust_remote_code=True,
                 low_cpu_mem_usage=True
             )
@@ -159,8 +201,8 @@ class ModelManager:
                 self.use_audio_llm = False
                 return False
 
-            self.audio_llm_processor = AutoProcessor.from_pretrained(
-                "Qwen/Qwen2-Audio-7B-Instruct",
+            self.audio_llm_processor = transformers.AutoProcessor.from_pretrained(
+                QWEN_AUDIO_MODEL_ID,
                 trust_remote_code=True
             )
 
@@ -173,15 +215,15 @@ class ModelManager:
             torch.cuda.empty_cache()
             gc.collect()
             try:
-                self.audio_llm_model = Qwen2AudioForConditionalGeneration.from_pretrained(
-                    "Qwen/Qwen2-Audio-7B-Instruct",
+                self.audio_llm_model = transformers.Qwen2AudioForConditionalGeneration.from_pretrained(
+                    QWEN_AUDIO_MODEL_ID,
                     torch_dtype=torch.float32,
                     device_map="cpu",
                     trust_remote_code=True,
                     low_cpu_mem_usage=True
                 )
-                self.audio_llm_processor = AutoProcessor.from_pretrained(
-                    "Qwen/Qwen2-Audio-7B-Instruct",
+                self.audio_llm_processor = transformers.AutoProcessor.from_pretrained(
+                    QWEN_AUDIO_MODEL_ID,
                     trust_remote_code=True
                 )
                 print("Qwen2-Audio模型已載入至CPU")
@@ -198,22 +240,115 @@ class ModelManager:
             self.use_audio_llm = False
             return False
     
-    def _load_models(self):
-        """載入所有模型"""
-        print("=== 開始載入模型 ===")
-        
-        whisper_success = self._load_whisper_model()
-        if not whisper_success:
-            raise Exception("Whisper模型載入失敗，無法繼續")
+    def _plan_qwen_audio_placement(self):
+        """依各GPU預算與CPU卸載額度，在載入前規劃Qwen2-Audio的放置方式"""
+        gpu_budgets = {}
+        if self.use_gpu and self.memory_monitor:
+            gpu_budgets = self.memory_monitor.get_placement_budgets()
+            for i, budget in gpu_budgets.items():
+                print(f"GPU {i}: 預算內可用{budget:.1f}GB")
         
-        qwen_success = self._load_qwen_audio_model()
+        model_size_gb = self.qwen_audio_size_gb
+        if model_size_gb is None:
+            model_size_gb = self._estimate_qwen_audio_size_gb()
         
-        self._memory_check_and_cleanup("所有模型載入後")
+        return plan_model_placement(
+            model_size_gb,
+            gpu_budgets,
+            cpu_offload_gb=self.cpu_offload_gb,
+            reserve_gb=self.inference_reserve_gb
+        )
+    
+    def _estimate_qwen_audio_size_gb(self):
+        """由模型設定建立空權重模型，計算float16權重大小（GB）；只下載設定檔，不配置記憶體"""
+        try:
+            config = transformers.AutoConfig.from_pretrained(QWEN_AUDIO_MODEL_ID, trust_remote_code=True)
+            with accelerate.init_empty_weights():
+                model = transformers.Qwen2AudioForConditionalGeneration._from_config(config, torch_dtype=torch.float16)
+            total_bytes, _ = accelerate.utils.calculate_maximum_sizes(model)
+            size_gb = total_bytes / 1024 ** 3
+            print(f"Qwen2-Audio權重大小（由模型設定估算）: {size_gb:.1f}GB")
+            return size_gb
+        except Exception as e:
+            print(f"⚠️  無法由模型設定估算Qwen2-Audio大小，使用預設值 {QWEN_AUDIO_FP16_SIZE_GB}GB: {e}")
+            return QWEN_AUDIO_FP16_SIZE_GB
+    
+    def _load_models(self):
+        """載入所有模型（Whisper載入後即可開始語音識別，之後才載入Qwen2-Audio）"""
+        print("=== 開始載入模型 ===")
+        self.loading_started_at = time.time()
         
-        print("=== 模型載入完成 ===")
-        print(f"Whisper: {'✓' if whisper_success else '✗'}")
-        print(f"Qwen2-Audio: {'✓' if qwen_success else '✗'}")
-        print(f"記憶體監控: {'✓' if self.memory_monitor else '✗'}")
+        try:
+            self.loading_status["whisper"] = "loading"
+            whisper_success = self._load_whisper_model()
+            self.loading_status["whisper"] = "ready" if whisper_success else "failed"
+            if not whisper_success:
+                self.loading_status["audio_llm"] = "skipped"
+                raise Exception("Whisper模型載入失敗，無法繼續")
+            self._whisper_ready.set()
+            
+            self.loading_status["audio_llm"] = "loading"
+            qwen_success = self._load_qwen_audio_model()
+            self.loading_status["audio_llm"] = "ready" if qwen_success else "failed"
+            
+            self._memory_check_and_cleanup("所有模型載入後")
+            
+            print("=== 模型載入完成 ===")
+            print(f"Whisper: {'✓' if whisper_success else '✗'}")
+            print(f"Qwen2-Audio: {'✓' if qwen_success else '✗'}")
+            print(f"記憶體監控: {'✓' if self.memory_monitor else '✗'}")
+        finally:
+            self.loading_finished_at = time.time()
+            # 載入失敗時也要喚醒等待中的請求，讓它們回報錯誤而不是一直等待
+            self._whisper_ready.set()
+            self._loaded.set()
+            self._run_loaded_callbacks()
+    
+    def _load_models_in_background(self):
+        try:
+            self._load_models()
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"❌ 背景模型載入失敗: {e}")
+    
+    def _run_loaded_callbacks(self):
+        with self._callbacks_lock:
+            callbacks, self._loaded_callbacks = self._loaded_callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  模型載入完成後的工作執行失敗: {e}")
+    
+    def when_loaded(self, callback):
+        """模型載入完成（成功或失敗）後執行 callback；已完成時立即執行"""
+        with self._callbacks_lock:
+            if not self._loaded.is_set():
+                self._loaded_callbacks.append(callback)
+                return
+        callback()
+    
+    def is_ready(self):
+        """語音識別是否可用（Audio-LLM 尚未載入時以簡化分析回應）"""
+        return self.loading_status["whisper"] == "ready"
+    
+    def wait_until_ready(self, timeout=MODEL_READY_TIMEOUT):
+        """等待Whisper載入完成；回傳是否可用"""
+        self._whisper_ready.wait(timeout)
+        return self.is_ready()
+    
+    def get_readiness(self):
+        """模型載入進度，供健康檢查與介面狀態使用"""
+        finished = sum(status in ("ready", "failed", "skipped") for status in self.loading_status.values())
+        end = self.loading_finished_at or time.time()
+        return {
+            "ready": self.is_ready(),
+            "loaded": self._loaded.is_set(),
+            "models": dict(self.loading_status),
+            "progress": finished / len(self.loading_status),
+            "elapsed_seconds": round(end - self.loading_started_at, 1) if self.loading_started_at else 0.0,
+            "error": self.load_error
+        }
     
     def get_device_info(self):
         """獲取設備信息"""
@@ -223,7 +358,9 @@ class ModelManager:
             "use_audio_llm": self.use_audio_llm,
             "whisper_available": self.whisper_model is not None,
             "qwen_available": self.audio_llm_model is not None,
-            "memory_limit_gb": self.gpu_memory_limit
+            "memory_limit_gb": self.gpu_memory_limits.get(0, self.gpu_memory_limit),
+            "memory_limits_gb": dict(self.gpu_memory_limits),
+            "placement_strategy": self.placement_plan["strategy"] if self.placement_plan else None
         }
         
         if self.use_gpu:
@@ -233,47 +370,110 @@ class ModelManager:
         
         return info
     
+    @traced("clear_gpu_memory")
     def clear_gpu_memory(self):
         """清理GPU記憶體"""
         if self.use_gpu:
-            torch.cuda.empty_cache()
             gc.collect()
-            print(f"🧹 GPU記憶體已清理，當前使用: {torch.cuda.memory_reserved(0) / 1024**3:.2f}GB")
+            usage = []
+            for i in range(torch.cuda.device_count()):
+                with torch.cuda.device(i):
+                    torch.cuda.empty_cache()
+                usage.append(f"GPU {i} {torch.cuda.memory_reserved(i) / 1024**3:.2f}GB")
+            print(f"🧹 GPU記憶體已清理，當前使用: {', '.join(usage)}")
     
-    def transcribe_audio(self, audio_path, language="en"):
-        """使用Whisper進行語音識別"""
-        if self.whisper_model is None:
+    @stage_limited("asr")
+    def transcribe_audio(self, audio_path, language="en", return_details=False):
+        """使用Whisper進行語音識別（audio_path 可為檔案路徑或 16kHz 波形）
+        
+        return_details=True 時回傳包含逐字時間戳與分段資訊的字典，否則只回傳文字。
+        """
+        # 背景載入中時先排隊等待Whisper就緒
+        if self.whisper_model is None and not self.wait_until_ready():
             raise Exception("Whisper模型未載入")
         
         if not self._memory_check_and_cleanup("語音識別前"):
             raise Exception("記憶體不足，無法進行語音識別")
         
         try:
+            transcribe_kwargs = {
+                "language": language,
+                "temperature": 0.0,
+                "verbose": False,
+                "word_timestamps": return_details
+            }
             if self.use_gpu:
-                result = self.whisper_model.transcribe(
-                    audio_path, 
-                    language=language, 
-                    temperature=0.0, 
-                    verbose=False,
-                    fp16=True
-                )
-            else:
-                result = self.whisper_model.transcribe(
-                    audio_path, 
-                    language=language, 
-                    temperature=0.0, 
-                    verbose=False
-                )
+                transcribe_kwargs["fp16"] = True
+            
+            with get_tracer().span("whisper.transcribe", word_timestamps=return_details) as span:
+                audio = audio_path if isinstance(audio_path, str) else load_audio(audio_path)
+                result = self.whisper_model.transcribe(audio, **transcribe_kwargs)
+                span.set_attribute("segments", len(result.get("segments", [])))
             
             self._memory_check_and_cleanup("語音識別後")
             
+            if return_details:
+                return summarize_transcription(result)
             return result["text"].strip()
         except Exception as e:
             print(f"語音識別錯誤: {e}")
             return None
     
-    def generate_audio_response(self, audio_path, prompt, max_tokens=256):
-        """使用Qwen2-Audio生成回應"""
+    def tokenize_text(self, text):
+        """將純文字 tokenize 為 token IDs（不加入特殊 token），供 prompt 快取使用"""
+        if self.audio_llm_processor is None:
+            return None
+        return self.audio_llm_processor.tokenizer(text, add_special_tokens=False)["input_ids"]
+    
+    @traced("prepare_audio_inputs")
+    def _prepare_audio_inputs(self, audio_path, prompt, prefix_token_ids=None):
+        """載入音頻並建立Qwen2-Audio的模型輸入（已載入的波形直接使用，不重新讀檔）"""
+        audio_data, sr = load_audio(audio_path), SAMPLE_RATE
+        
+        max_length = 30 * sr
+        if len(audio_data) > max_length:
+            audio_data = audio_data[:max_length]
+        
+        inputs = self.audio_llm_processor(
+            text=prompt,
+            audio=audio_data,
+            sampling_rate=sr,
+            return_tensors="pt",
+            padding=True
+        )
+
+        if prefix_token_ids is not None:
+            prefix_ids = torch.tensor([prefix_token_ids], dtype=inputs["input_ids"].dtype)
+            inputs["input_ids"] = torch.cat([prefix_ids, inputs["input_ids"]], dim=1)
+            inputs["attention_mask"] = torch.cat(
+                [torch.ones_like(prefix_ids), inputs["attention_mask"]], dim=1
+            )
+
+        if self.use_gpu:
+            inputs = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v 
+                     for k, v in inputs.items()}
+        
+        return inputs
+    
+    def _generation_kwargs(self, max_tokens, deterministic=False):
+        kwargs = {
+            "max_new_tokens": max_tokens,
+            "pad_token_id": self.audio_llm_processor.tokenizer.eos_token_id
+        }
+        if deterministic:
+            # greedy 解碼：相同輸入得到相同輸出，結果可安全地快取重用
+            kwargs["do_sample"] = False
+        else:
+            kwargs.update({"temperature": 0.7, "do_sample": True, "top_p": 0.95})
+        return kwargs
+    
+    @stage_limited("audio_llm")
+    def generate_audio_response(self, audio_path, prompt, max_tokens=256, prefix_token_ids=None, deterministic=False):
+        """使用Qwen2-Audio生成回應
+        
+        若提供 prefix_token_ids，prompt 僅為其後的文字部分，前綴 token 直接接在輸入前方。
+        deterministic 為 True 時使用 greedy 解碼。
+        """
         if not self.use_audio_llm:
             return None
         
@@ -282,38 +482,20 @@ class ModelManager:
             return None
         
         try:
-            import librosa
-            audio_data, sr = librosa.load(audio_path, sr=16000)
-            
-            max_length = 30 * sr
-            if len(audio_data) > max_length:
-                audio_data = audio_data[:max_length]
-            
             # 處理輸入
             with torch.no_grad():
-                inputs = self.audio_llm_processor(
-                    text=prompt,
-                    audio=audio_data,
-                    sampling_rate=sr,
-                    return_tensors="pt",
-                    padding=True
-                )
-
-                if self.use_gpu:
-                    inputs = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v 
-                             for k, v in inputs.items()}
+                inputs = self._prepare_audio_inputs(audio_path, prompt, prefix_token_ids)
 
                 if not self._memory_check_and_cleanup("Audio-LLM生成中"):
                     return None
 
-                generate_ids = self.audio_llm_model.generate(
-                    **inputs,
-                    max_new_tokens=max_tokens,
-                    temperature=0.7,
-                    do_sample=True,
-                    top_p=0.95,
-                    pad_token_id=self.audio_llm_processor.tokenizer.eos_token_id
-                )
+                with get_tracer().span("generate", input_tokens=inputs["input_ids"].size(1),
+                                       max_new_tokens=max_tokens) as span:
+                    generate_ids = self.audio_llm_model.generate(
+                        **inputs,
+                        **self._generation_kwargs(max_tokens, deterministic)
+                    )
+                    span.set_attribute("new_tokens", generate_ids.size(1) - inputs["input_ids"].size(1))
 
                 generated_ids = generate_ids[:, inputs['input_ids'].size(1):]
                 response = self.audio_llm_processor.decode(generated_ids[0], skip_special_tokens=True)
@@ -332,6 +514,107 @@ class ModelManager:
             self.clear_gpu_memory()
             return None
     
+    @stage_limited("audio_llm")
+    def generate_text_response(self, prompt, max_tokens=256, deterministic=True):
+        """不含音頻的文字生成（背景預先生成對話回合使用）"""
+        if not self.use_audio_llm:
+            return None
+        
+        if not self._memory_check_and_cleanup("文字生成前"):
+            return None
+        
+        try:
+            with torch.no_grad():
+                inputs = self.audio_llm_processor(text=prompt, return_tensors="pt", padding=True)
+                if self.use_gpu:
+                    inputs = {k: v.to(self.device) if isinstance(v, torch.Tensor) else v 
+                             for k, v in inputs.items()}
+                
+                with get_tracer().span("generate", input_tokens=inputs["input_ids"].size(1),
+                                       max_new_tokens=max_tokens, text_only=True):
+                    generate_ids = self.audio_llm_model.generate(
+                        **inputs,
+                        **self._generation_kwargs(max_tokens, deterministic)
+                    )
+                
+                generated_ids = generate_ids[:, inputs['input_ids'].size(1):]
+                response = self.audio_llm_processor.decode(generated_ids[0], skip_special_tokens=True)
+                
+                del inputs, generate_ids, generated_ids
+                self.clear_gpu_memory()
+                
+                return response
+        
+        except torch.cuda.OutOfMemoryError:
+            print("🚨 GPU記憶體不足，文字生成失敗")
+            self.clear_gpu_memory()
+            return None
+        except Exception as e:
+            print(f"文字生成錯誤: {e}")
+            self.clear_gpu_memory()
+            return None
+    
+    @stage_limited("audio_llm")
+    def stream_audio_response(self, audio_path, prompt, max_tokens=256, prefix_token_ids=None, deterministic=False):
+        """使用Qwen2-Audio串流生成回應，逐段產出解碼後的文字"""
+        if not self.use_audio_llm:
+            return
+        
+        if not self._memory_check_and_cleanup("Audio-LLM生成前"):
+            print("記憶體不足，跳過Audio-LLM生成")
+            return
+        
+        generation_error = []
+        
+        def run_generation(inputs, streamer):
+            try:
+                with torch.no_grad(), get_tracer().span(
+                    "generate", input_tokens=inputs["input_ids"].size(1), max_new_tokens=max_tokens, streaming=True
+                ):
+                    self.audio_llm_model.generate(
+                        **inputs,
+                        **self._generation_kwargs(max_tokens, deterministic),
+                        streamer=streamer
+                    )
+            except Exception as e:
+                generation_error.append(e)
+                streamer.end()
+        
+        try:
+            with torch.no_grad():
+                inputs = self._prepare_audio_inputs(audio_path, prompt, prefix_token_ids)
+            
+            if not self._memory_check_and_cleanup("Audio-LLM生成中"):
+                return
+            
+            streamer = transformers.TextIteratorStreamer(
+                self.audio_llm_processor.tokenizer,
+                skip_prompt=True,
+                skip_special_tokens=True
+            )
+            generation_thread = threading.Thread(
+                target=carry_context(run_generation, inputs, streamer), daemon=True
+            )
+            generation_thread.start()
+            
+            for chunk in streamer:
+                yield chunk
+            
+            generation_thread.join()
+            if generation_error:
+                raise generation_error[0]
+        
+        except torch.cuda.OutOfMemoryError:
+            print("🚨 GPU記憶體不足，Audio-LLM生成失敗")
+        except Exception as e:
+            print(f"Audio-LLM生成錯誤: {e}")
+        finally:
+            self.clear_gpu_memory()
+    
+    def get_stage_stats(self):
+        """各模型階段的並行與排隊統計"""
+        return {name: limiter.get_stats() for name, limiter in self.stage_limiters.items()}
+    
     def get_memory_status(self):
         if self.memory_monitor:
             return self.memory_monitor.get_current_status()
@@ -345,16 +628,44 @@ class ModelManager:
         except:
             pass
 
-model_manager = None
+def summarize_transcription(result):
+    """整理Whisper輸出，保留分段與逐字時間資訊"""
+    segments = []
+    words = []
+    for segment in result.get("segments", []):
+        segments.append({
+            "start": segment["start"],
+            "end": segment["end"],
+            "text": segment["text"].strip(),
+            "avg_logprob": segment.get("avg_logprob"),
+            "no_speech_prob": segment.get("no_speech_prob"),
+            "compression_ratio": segment.get("compression_ratio")
+        })
+        for word in segment.get("words", []):
+            words.append({
+                "word": word["word"],
+                "start": word["start"],
+                "end": word["end"],
+                "probability": word.get("probability")
+            })
+    
+    return {
+        "text": result["text"].strip(),
+        "language": result.get("language"),
+        "segments": segments,
+        "words": words
+    }
+
+# 每個程序只載入一份模型；並行的第一次呼叫不會重複載入，設定不同時拋出 ValueError
+_model_managers = SharedInstances(ModelManager)
 
-def get_model_manager(gpu_memory_limit=20):
-    global model_manager
-    if model_manager is None:
-        model_manager = ModelManager(gpu_memory_limit)
-    return model_manager
+def get_model_manager(**settings):
+    """獲取模型管理器實例（gpu_memory_limit / cpu_offload_gb / stage_concurrency / load_in_background /
+    qwen_audio_size_gb / inference_reserve_gb）"""
+    return _model_managers.get(**settings)
 
-def initialize_models(gpu_memory_limit=20):
-    return get_model_manager(gpu_memory_limit)
+def initialize_models(gpu_memory_limit=20, cpu_offload_gb=0):
+    return get_model_manager(gpu_memory_limit=gpu_memory_limit, cpu_offload_gb=cpu_offload_gb)
 
 if __name__ == "__main__":
     print("測試模型管理器...")
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+pregeneration.py - 預設場景助教回合的背景預先生成
+學習者在預設場景中多半會說出範例對話或畫面上的建議回覆；GPU閒置時以低優先權
+預先生成這些句子之後的助教回應與建議回覆，辨識文字相符時即可直接使用，不需在請求中等待生成
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+
+from analysis_cache import normalize_transcript
+from shared_instances import SharedInstances
+from response_parser import parse_response
+from scenario_catalog import get_scenario_index
+
+ANALYSIS_MODE_PREGENERATED = "pregenerated"
+DEFAULT_PREGENERATED_PATH = os.path.join("pregenerated", "turns.json")
+
+# 預先生成使用的設定；助教回應與建議回覆不受發音重點與口音偏好影響
+PREGENERATION_SETTINGS = {
+    "pronunciation_focus": None,
+    "accent_preference": "不指定",
+    "feedback_detail": "基本回饋"
+}
+
+
+def prompt_fingerprint(compiled):
+    """已編譯 prompt 的指紋；場景資料或 prompt 模板變更後，舊的預先生成結果自動失效"""
+    fingerprint = compiled.get("fingerprint")
+    if fingerprint is None:
+        fingerprint = hashlib.sha1(compiled["system_prompt"].encode("utf-8")).hexdigest()[:16]
+        compiled["fingerprint"] = fingerprint
+    return fingerprint
+
+
+def build_turn_prompt(compiled, utterance, level):
+    """沒有錄音時的對話回合 prompt（沿用同一份 system prompt 與回應格式）"""
+    return f"""{compiled["chat_prefix"]}
+<|im_end|>
+<|im_start|>user
+The student said: "{utterance}"
+
+No recording is available for this turn, so keep the pronunciation section brief. Continue the conversation in character and suggest next responses according to the specified format, considering their {level} proficiency level.
+<|im_end|>
+<|im_start|>assistant
+"""
+
+
+class PregeneratedTurns:
+    """預先生成的助教回合，以 (場景, 難度, 正規化後的句子) 查詢並保存到 JSON 檔"""
+
+    def __init__(self, path=DEFAULT_PREGENERATED_PATH):
+        self.path = path
+        self._turns = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def make_key(scenario, difficulty, utterance):
+        return f"{scenario}|{difficulty}|{normalize_transcript(utterance)}"
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._turns = json.load(f)
+            print(f"📦 已載入 {len(self._turns)} 個預先生成的對話回合")
+        except (OSError, ValueError) as e:
+            print(f"⚠️  讀取預先生成回合失敗: {e}")
+
+    def lookup(self, scenario, difficulty, utterance, fingerprint, record_stats=True):
+        """回傳相符的回合，prompt 已變更或不存在時回傳None"""
+        key = self.make_key(scenario, difficulty, utterance)
+        with self._lock:
+            turn = self._turns.get(key)
+            if turn is None or turn["fingerprint"] != fingerprint:
+                turn = None
+            if record_stats:
+                if turn is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return turn
+
+    def put(self, scenario, difficulty, utterance, fingerprint, response_text, suggested_responses):
+        with self._lock:
+            self._turns[self.make_key(scenario, difficulty, utterance)] = {
+                "scenario": scenario,
+                "difficulty": difficulty,
+                "utterance": utterance,
+                "fingerprint": fingerprint,
+                "response_text": response_text,
+                "suggested_responses": list(suggested_responses),
+                "generated_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._dirty = True
+
+    def save(self):
+        """寫回 JSON 檔（先寫暫存檔再取代，避免中斷時留下不完整的檔案）"""
+        with self._lock:
+            if not self._dirty or not self.path:
+                return False
+            snapshot = dict(self._turns)
+            self._dirty = False
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+        return True
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._turns),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+
+class Pregenerator:
+    """背景預先生成工作 - 只在沒有進行中的請求且閒置一段時間後才使用模型"""
+
+    def __init__(self, conversation_manager, idle_seconds=5.0, max_depth=2, max_turns_per_level=30,
+                 save_every=10, max_tokens=256):
+        """
+        Args:
+            conversation_manager: 提供模型、prompt 與請求活動狀態的對話管理器
+            idle_seconds (float): 最後一個請求結束後需閒置多久才開始生成
+            max_depth (int): 沿著建議回覆往下預先生成的回合數
+            max_turns_per_level (int): 每個場景、每個難度最多預先生成的回合數
+            save_every (int): 每生成幾個回合寫回一次檔案
+            max_tokens (int): 單一回合的生成長度上限
+        """
+        self.manager = conversation_manager
+        self.turns = conversation_manager.audio_processor.pregenerated_turns
+        self.idle_seconds = idle_seconds
+        self.max_depth = max_depth
+        self.max_turns_per_level = max_turns_per_level
+        self.save_every = save_every
+        self.max_tokens = max_tokens
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.catalog_version = None
+        self.status = "idle"
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        if not self.manager.audio_processor.model_manager.use_audio_llm:
+            print("⚠️  Audio-LLM 未載入，不執行預先生成")
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pregeneration", daemon=True)
+        self._thread.start()
+        print(f"🌙 背景預先生成已啟動（閒置 {self.idle_seconds:.0f} 秒後執行）")
+        return True
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.turns.save()
+
+    def _lower_priority(self):
+        # Linux 上可個別調整執行緒的排程優先權；其他平台略過
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+    def _wait_until_idle(self):
+        """等到沒有進行中的請求且已閒置 idle_seconds；收到停止訊號時回傳 False"""
+        while not self._stop.is_set():
+            if self.manager.is_idle(self.idle_seconds):
+                return True
+            self.status = "waiting"
+            self._stop.wait(0.5)
+        return False
+
+    def _seed_utterances(self, index, scenario, level):
+        """學習者最可能說的句子：範例對話中的學習者台詞與該級別的建議回覆"""
+        seeds = []
+        preset = index.presets.get(scenario)
+        if preset is not None:
+            seeds.append(preset["sample_dialog"]["user"])
+        seeds.extend(index.suggestions(scenario, level))
+        return seeds
+
+    def _run(self):
+        self._lower_priority()
+        while not self._stop.is_set():
+            index = get_scenario_index()
+            self.catalog_version = index.version
+            self._run_catalog(index)
+            self.turns.save()
+            self.status = "done"
+            # 全部完成後只需在場景資料變更時再執行一次
+            while not self._stop.wait(5.0):
+                if get_scenario_index().version != self.catalog_version:
+                    break
+
+    def _run_catalog(self, index):
+        from processors import DIFFICULTY_CONFIGS, prompt_compiler
+
+        for scenario in index.presets:
+            for difficulty, difficulty_config in DIFFICULTY_CONFIGS.items():
+                compiled = prompt_compiler.compile(
+                    scenario, difficulty, PREGENERATION_SETTINGS["pronunciation_focus"],
+                    PREGENERATION_SETTINGS["accent_preference"], PREGENERATION_SETTINGS["feedback_detail"]
+                )
+                fingerprint = prompt_fingerprint(compiled)
+                level = difficulty_config["level"]
+
+                queue = deque((utterance, 0) for utterance in self._seed_utterances(index, scenario, level))
+                seen = set()
+                count = 0
+                while queue and count < self.max_turns_per_level:
+                    utterance, depth = queue.popleft()
+                    key = normalize_transcript(utterance)
+                    if not key or key in seen:
+                        continue
+                    seen.add(key)
+                    count += 1
+
+                    turn = self.turns.lookup(scenario, difficulty, utterance, fingerprint, record_stats=False)
+                    if turn is None:
+                        if not self._wait_until_idle():
+                            return
+                        turn = self._generate_turn(compiled, fingerprint, scenario, difficulty, level, utterance)
+                    else:
+                        self.skipped += 1
+
+                    if turn is not None and depth + 1 < self.max_depth:
+                        queue.extend((reply, depth + 1) for reply in turn["suggested_responses"])
+
+    def _generate_turn(self, compiled, fingerprint, scenario, difficulty, level, utterance):
+        self.status = f"generating: {scenario} / {difficulty}"
+        response = self.manager.audio_processor.model_manager.generate_text_response(
+            build_turn_prompt(compiled, utterance, level), max_tokens=self.max_tokens, deterministic=True
+        )
+        if not response:
+            self.failed += 1
+            return None
+
+        parser = parse_response(response)
+        if not parser.response_text.strip():
+            self.failed += 1
+            return None
+
+        self.turns.put(scenario, difficulty, utterance, fingerprint,
+                       parser.response_text.strip(), parser.suggestions)
+        self.generated += 1
+        if self.generated % self.save_every == 0:
+            self.turns.save()
+        return self.turns.lookup(scenario, difficulty, utterance, fingerprint, record_stats=False)
+
+    def get_stats(self):
+        stats = self.turns.get_stats()
+        stats.update({
+            "status": self.status,
+            "generated": self.generated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "running": self._thread is not None and self._thread.is_alive()
+        })
+        return stats
+
+
+_pregenerated_turns = SharedInstances(PregeneratedTurns)
+
+
+def get_pregenerated_turns(path=DEFAULT_PREGENERATED_PATH):
+    """獲取預先生成回合的儲存區實例（同一檔案共用一個實例）"""
+    return _pregenerated_turns.get(os.path.abspath(path), path=path)
@@ -4,11 +4,30 @@ processors.py - 音頻處理和分析核心
 負責音頻處理、語音識別、發音分析等功能
 """
 
-import os
+import time
 import random
-import re
-import datetime
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
 from models import get_model_manager
+from response_parser import StreamingResponseParser, parse_response
+from acoustic_scoring import (SAMPLE_RATE, load_audio, has_audio, audio_nbytes, extract_acoustic_features,
+                              score_pronunciation, score_fluency)
+from fluency_analysis import analyze_word_timings, score_fluency_from_timings, format_fluency_feedback
+from confidence_scoring import score_confidence, format_confidence_feedback
+from analysis_gate import AnalysisGate, GATE_LLM, GATE_LOCAL
+from analysis_cache import AnalysisCache, ANALYSIS_MODE_CACHED
+from pregeneration import (ANALYSIS_MODE_PREGENERATED, PREGENERATION_SETTINGS, DEFAULT_PREGENERATED_PATH,
+                           Pregenerator, get_pregenerated_turns, prompt_fingerprint)
+from session_store import SessionStore, DEFAULT_SESSION_ID, learner_id_from_key
+from progress_store import DEFAULT_DB_PATH, get_progress_store
+from history_export import DEFAULT_EXPORT_DIR, HistoryExporter
+from progress_analytics import ProgressAnalytics
+from recording_store import DEFAULT_RECORDING_DIR, get_recording_store
+from tracing import get_tracer, traced
+from profiling import get_request_profiler
+from scenario_catalog import get_scenario_index
+from shared_instances import SharedInstances
 
 DIFFICULTY_CONFIGS = {
     "初學者 (TOEIC 250-400分)": {
@@ -63,16 +82,100 @@ DIFFICULTY_CONFIGS = {
     }
 }
 
+PROMPT_CONTEXT_MARKER = "CONVERSATION CONTEXT: "
+SYSTEM_PROMPT_HEADER = "<|im_start|>system\n"
+
+class PromptCompiler:
+    """System prompt 編譯快取 - 依設定組合記憶已渲染的 prompt 與其 token IDs（LRU淘汰）
+    
+    快取鍵包含場景目錄版本，場景資料重新載入後會自動使用新的 prompt
+    """
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail, catalog_version=0):
+        focus = tuple(sorted(set(pronunciation_focus))) if pronunciation_focus else ()
+        return (catalog_version, scenario, difficulty, focus, accent_preference, feedback_detail)
+    
+    def compile(self, scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail):
+        """取得設定對應的已編譯 prompt（不含對話上下文）"""
+        scenario_index = get_scenario_index()
+        key = self.make_key(
+            scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail, scenario_index.version
+        )
+        
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        
+        system_prompt = _render_system_prompt(
+            scenario_index, scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail
+        )
+        entry = {
+            "key": key,
+            "system_prompt": system_prompt,
+            "chat_prefix": SYSTEM_PROMPT_HEADER + system_prompt,
+            "prefix_token_ids": None
+        }
+        
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        
+        return entry
+    
+    def get_prefix_token_ids(self, entry, tokenize_fn):
+        """取得 chat prefix 的 token IDs，第一次使用時才進行 tokenize"""
+        if entry["prefix_token_ids"] is None:
+            token_ids = tokenize_fn(entry["chat_prefix"])
+            if token_ids is not None:
+                entry["prefix_token_ids"] = tuple(token_ids)
+        return entry["prefix_token_ids"]
+    
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+prompt_compiler = PromptCompiler()
+
 def create_advanced_prompt(scenario, difficulty, pronunciation_focus, accent_preference, 
                           feedback_detail, show_comparison, conversation_history=""):
     """創建整合進階功能的完整 prompt"""
+    compiled = prompt_compiler.compile(
+        scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail
+    )
+    return compiled["system_prompt"] + PROMPT_CONTEXT_MARKER + conversation_history
+
+def _render_system_prompt(scenario_index, scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail):
+    """渲染 system prompt（對話上下文之前的部分）"""
     
     difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
     level = difficulty_config["level"]
     criteria = difficulty_config["evaluation_criteria"]
     encouragement = difficulty_config["encouragement_level"]
-    vocab_level = difficulty_config["vocabulary_level"]
-    sentence_complexity = difficulty_config["sentence_complexity"]
     
     pronunciation_instructions = ""
     if pronunciation_focus:
@@ -143,51 +246,7 @@ FEEDBACK LEVEL: Expert Analysis (In-depth)
 - Offer advanced practice techniques and exercises
 """
 
-    scenario_base_prompts = {
-        "機場對話 (Airport Conversation)": f"""You are an airport staff member helping a traveler at {level} English level (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Airport staff assisting with check-in, security, customs, or boarding procedures.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "餐廳點餐 (Restaurant Ordering)": f"""You are a restaurant server taking orders from a {level} English learner (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Friendly restaurant server helping with menu selection, taking orders, and providing dining assistance.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "求職面試 (Job Interview)": f"""You are a professional interviewer speaking with a {level} English candidate (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Professional interviewer conducting a job interview, asking relevant questions and providing follow-ups.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "日常社交 (Daily Social Conversation)": f"""You are a friendly conversation partner with a {level} English speaker (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Casual friend or acquaintance engaging in everyday social conversation.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "醫療諮詢 (Medical Consultation)": f"""You are a healthcare professional speaking with a {level} English patient (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Doctor, nurse, or medical staff conducting consultation and providing medical guidance.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "學術討論 (Academic Discussion)": f"""You are an academic professional (professor/researcher) with a {level} English student (TOEIC {difficulty_config['toeic_range']}). 
-
-ROLE & SCENARIO: Academic setting with professor or researcher engaging in educational discussion.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners.""",
-
-        "自由對話": f"""You are a helpful language learning assistant engaging with a {level} English learner (TOEIC {difficulty_config['toeic_range']}).
-
-ROLE & SCENARIO: Adaptive conversation partner for the user's specified scenario or topic.
-
-LANGUAGE LEVEL: Use {vocab_level} vocabulary and {sentence_complexity} sentence structures appropriate for {level} learners."""
-    }
-
-    base_prompt = scenario_base_prompts.get(scenario, scenario_base_prompts["日常社交 (Daily Social Conversation)"])
+    base_prompt = scenario_index.role_prompt(scenario, difficulty_config)
 
     system_prompt = f"""{base_prompt}
 
@@ -221,7 +280,7 @@ Provide 2-3 suggested responses the student could use to continue this conversat
 
 Each suggestion should be appropriate for the {level} level and include brief explanations of when to use each option.
 
-CONVERSATION CONTEXT: {conversation_history}"""
+"""
 
     return system_prompt
 
@@ -231,139 +290,288 @@ def get_scenario_responses(scenario, difficulty="中級 (TOEIC 605-780分)"):
     difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
     level = difficulty_config["level"]
     
-    responses_by_level = {
-        "beginner": {
-            "機場對話 (Airport Conversation)": [
-                "Hello! Passport, please?",
-                "Where are you going today?", 
-                "How long will you stay?",
-                "Any bags to check?",
-                "Gate 12. Have a nice flight!",
-                "Thank you. Next, please!"
-            ],
-            "餐廳點餐 (Restaurant Ordering)": [
-                "Hi! Table for how many?",
-                "Here's the menu. Take your time.",
-                "Ready to order?",
-                "What would you like to drink?",
-                "Great choice! Anything else?",
-                "Your meal will be ready soon."
-            ],
-            "求職面試 (Job Interview)": [
-                "Nice to meet you. Please sit down.",
-                "Tell me about yourself.",
-                "Why do you want this job?",
-                "What are your strengths?",
-                "Do you have questions for us?",
-                "Thank you for coming today."
-            ],
-            "日常社交 (Daily Social Conversation)": [
-                "Hi! How are you today?",
-                "Nice weather, isn't it?",
-                "What do you do for work?",
-                "Do you live around here?",
-                "Have a great day!",
-                "See you later!"
-            ]
-        },
-        "intermediate": {
-            "機場對話 (Airport Conversation)": [
-                "Good morning! May I see your passport and ticket?",
-                "What's the purpose of your visit to our country?",
-                "How long are you planning to stay?",
-                "Do you have anything to declare?",
-                "Please proceed to gate 15. Boarding starts at 3 PM.",
-                "Have a pleasant journey!"
-            ],
-            "餐廳點餐 (Restaurant Ordering)": [
-                "Welcome! Do you have a reservation?",
-                "Would you prefer a table by the window?",
-                "Can I get you started with something to drink?",
-                "Our special today is grilled salmon with vegetables.",
-                "How would you like your steak cooked?",
-                "Would you care for dessert or coffee?"
-            ]
-        },
-        "advanced": {
-            "機場對話 (Airport Conversation)": [
-                "Good afternoon. I'll need to verify your travel documents.",
-                "Could you clarify the nature of your business visit?",
-                "I notice your return flight is quite far out. Any particular reason for the extended stay?",
-                "For customs purposes, are you carrying any items that exceed the duty-free allowance?",
-                "Your gate assignment is B7, and I'd recommend arriving 30 minutes before boarding.",
-                "I hope you have a productive and enjoyable trip."
-            ]
-        }
+    return list(get_scenario_index().responses(scenario, level))
+
+# 對話流程的預設設定；建立 ConversationManager(config=...) 時只需提供要覆寫的部分
+DEFAULT_PIPELINE_CONFIG = {
+    "models": {
+        "gpu_memory_limit": 20,
+        "cpu_offload_gb": 0,
+        "qwen_audio_size_gb": None,       # None 表示由模型設定估算
+        "inference_reserve_gb": 2,
+        "stage_concurrency": None,
+        "load_in_background": False
+    },
+    "sessions": {
+        "max_history": 10,
+        "ttl_seconds": 3600,
+        "max_sessions": 1000,
+        "max_learner_links": 100000
+    },
+    "analysis_cache": {
+        "enabled": True,
+        "max_entries": 2048,
+        "ttl_seconds": 6 * 3600,
+        "deterministic": True
+    },
+    "pregenerated_turns": {
+        "path": DEFAULT_PREGENERATED_PATH
+    },
+    "progress": {
+        "db_path": DEFAULT_DB_PATH
+    },
+    "analytics": {
+        "window": 10,
+        "ema_alpha": 0.2,
+        "max_learners": 10000
+    },
+    "recordings": {
+        "directory": DEFAULT_RECORDING_DIR,
+        "max_bytes": 2 * 1024 ** 3,
+        "max_age_days": 14,
+        "sweep_dirs": ()
+    },
+    "exports": {
+        "output_dir": DEFAULT_EXPORT_DIR,
+        "chunk_size": 500,
+        "file_ttl_seconds": 3600
     }
-    
-    level_responses = responses_by_level.get(level, responses_by_level["intermediate"])
-    scenario_responses = level_responses.get(scenario, level_responses.get("日常社交 (Daily Social Conversation)", ["Hello!", "How can I help you?"]))
-    
-    return scenario_responses
+}
+
+def merge_pipeline_config(config=None):
+    """以預設設定補齊使用者設定（逐區段合併）"""
+    merged = {section: dict(values) for section, values in DEFAULT_PIPELINE_CONFIG.items()}
+    for section, values in (config or {}).items():
+        if section not in merged:
+            raise KeyError(f"未知的設定區段: {section}")
+        merged[section].update(values)
+    return merged
 
 class AudioProcessor:
-    """音頻處理類（改進版）"""
+    """音頻處理類（改進版）
+    
+    模型管理器與預先生成回合在第一次使用時才建立，只用到評分或提示詞的程式不會載入模型
+    """
+    
+    def __init__(self, model_manager=None, analysis_cache=None, pregenerated_turns=None, config=None):
+        self.config = merge_pipeline_config(config)
+        self._model_manager = model_manager
+        self._pregenerated_turns = pregenerated_turns
+        self._component_lock = threading.Lock()
+        self._pregeneration_fingerprints = {}
+        self.analysis_gate = AnalysisGate()
+        self.analysis_cache = analysis_cache or AnalysisCache(**self.config["analysis_cache"])
     
-    def __init__(self):
-        self.model_manager = get_model_manager()
+    @property
+    def model_manager(self):
+        if self._model_manager is None:
+            with self._component_lock:
+                if self._model_manager is None:
+                    self._model_manager = get_model_manager(**self.config["models"])
+        return self._model_manager
+    
+    @model_manager.setter
+    def model_manager(self, model_manager):
+        self._model_manager = model_manager
+    
+    @property
+    def pregenerated_turns(self):
+        if self._pregenerated_turns is None:
+            with self._component_lock:
+                if self._pregenerated_turns is None:
+                    self._pregenerated_turns = get_pregenerated_turns(**self.config["pregenerated_turns"])
+        return self._pregenerated_turns
+    
+    @pregenerated_turns.setter
+    def pregenerated_turns(self, pregenerated_turns):
+        self._pregenerated_turns = pregenerated_turns
     
     def transcribe_speech(self, audio_path):
         """語音識別"""
-        if not audio_path or not os.path.exists(audio_path):
+        transcription, status = self.transcribe_speech_detailed(audio_path)
+        if not transcription:
+            return None, status
+        return transcription["text"], status
+    
+    @traced("transcribe_speech")
+    def transcribe_speech_detailed(self, audio_path):
+        """語音識別 - 同時回傳逐字時間戳與分段資訊"""
+        if not has_audio(audio_path):
             return None, "音頻文件不存在"
         
         try:
-            recognized_text = self.model_manager.transcribe_audio(audio_path)
+            transcription = self.model_manager.transcribe_audio(audio_path, return_details=True)
             
-            if not recognized_text or len(recognized_text.strip()) < 2:
+            if not transcription or len(transcription["text"].strip()) < 2:
                 return None, "語音識別失敗，請重新錄製"
             
-            return recognized_text, "識別成功"
+            get_tracer().set_attribute("words", len(transcription["words"]))
+            return transcription, "識別成功"
             
         except Exception as e:
             return None, f"語音識別錯誤: {str(e)}"
     
+    @traced("analyze_pronunciation")
     def analyze_pronunciation(self, audio_path, transcribed_text, scenario, conversation_history="", 
                             difficulty="中級 (TOEIC 605-780分)", pronunciation_focus=None, 
                             accent_preference="不指定", feedback_detail="詳細回饋", 
-                            show_comparison=True, **kwargs):
-        """發音分析 - 完整整合進階功能"""
+                            show_comparison=True, transcription=None, route=None, **kwargs):
+        """發音分析 - 完整整合進階功能
+        
+        route 為 route_analysis() 的結果；未提供時在此計算
+        """
+        difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
+        if route is None:
+            route = self.route_analysis(transcribed_text, difficulty, transcription, scenario)
+        confidence = route["confidence"]
+        gate_reason = route["gate_reason"]
+        
         try:
-            analysis_result = self._analyze_with_audio_llm(
-                audio_path, transcribed_text, scenario, conversation_history, 
-                difficulty, pronunciation_focus, accent_preference, 
-                feedback_detail, show_comparison, **kwargs
-            )
+            analysis_result = None
+            if route.get("pregenerated"):
+                analysis_result = self._analyze_with_stored_turn(
+                    route["pregenerated"], ANALYSIS_MODE_PREGENERATED, transcribed_text, scenario, difficulty,
+                    pronunciation_focus, accent_preference, feedback_detail, audio_path=audio_path,
+                    confidence=confidence
+                )
+            elif route["use_llm"]:
+                analysis_result = self._analyze_with_audio_llm(
+                    audio_path, transcribed_text, scenario, conversation_history, 
+                    difficulty, pronunciation_focus, accent_preference, 
+                    feedback_detail, show_comparison, confidence=confidence, **kwargs
+                )
             
             if analysis_result:
-                return analysis_result
+                analysis_result.setdefault("analysis_mode", GATE_LLM)
             else:
-                return self._analyze_with_simple_method(
+                analysis_result = self._analyze_with_simple_method(
                     transcribed_text, scenario, difficulty, pronunciation_focus, 
-                    accent_preference, feedback_detail
+                    accent_preference, feedback_detail, audio_path=audio_path, confidence=confidence
                 )
+                analysis_result["analysis_mode"] = GATE_LOCAL
+            analysis_result["gate_reason"] = gate_reason
                 
         except Exception as e:
             print(f"發音分析錯誤: {e}")
-            return self._analyze_with_simple_method(
+            analysis_result = self._analyze_with_simple_method(
                 transcribed_text, scenario, difficulty, pronunciation_focus, 
-                accent_preference, feedback_detail
+                accent_preference, feedback_detail, audio_path=audio_path, confidence=confidence
+            )
+            analysis_result["analysis_mode"] = GATE_LOCAL
+            analysis_result["gate_reason"] = "error"
+        
+        tracer = get_tracer()
+        tracer.set_attribute("analysis_mode", analysis_result["analysis_mode"])
+        tracer.set_attribute("gate_reason", analysis_result["gate_reason"])
+        return self._apply_transcription_signals(
+            analysis_result, transcription, confidence, difficulty_config, feedback_detail
+        )
+    
+    def route_analysis(self, transcribed_text, difficulty, transcription=None, scenario=None):
+        """依辨識結果決定分析路徑（Audio-LLM 或本地評分），不執行任何模型
+        
+        閘門選擇本地評分（或Audio-LLM不可用）且句子已有預先生成的回合時，改用預先生成的回應；
+        閘門選擇Audio-LLM時不查詢，高級別與需要詳細分析的回合仍由Audio-LLM分析
+        """
+        difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
+        confidence = score_confidence(transcription, difficulty_config["level"]) if transcription else None
+        
+        use_llm, gate_reason = False, "llm_unavailable"
+        if self.model_manager.use_audio_llm:
+            use_llm, gate_reason = self.analysis_gate.decide(
+                confidence,
+                self._utterance_duration(transcription),
+                len(transcribed_text.split()),
+                difficulty_config["level"],
+                has_preset_responses=scenario is None or get_scenario_index().has_responses(
+                    scenario, difficulty_config["level"]
+                )
             )
+        
+        pregenerated = None
+        if scenario and not use_llm:
+            pregenerated = self.find_pregenerated_turn(transcribed_text, scenario, difficulty)
+        
+        return {"use_llm": use_llm, "gate_reason": gate_reason, "confidence": confidence,
+                "pregenerated": pregenerated}
+    
+    def pregeneration_fingerprint(self, scenario, difficulty):
+        """預先生成設定下的 prompt 指紋；每個場景版本與難度只編譯一次，不影響 prompt 快取的統計"""
+        key = (scenario, difficulty, get_scenario_index().signature)
+        fingerprint = self._pregeneration_fingerprints.get(key)
+        if fingerprint is None:
+            compiled = prompt_compiler.compile(
+                scenario, difficulty, PREGENERATION_SETTINGS["pronunciation_focus"],
+                PREGENERATION_SETTINGS["accent_preference"], PREGENERATION_SETTINGS["feedback_detail"]
+            )
+            fingerprint = prompt_fingerprint(compiled)
+            self._pregeneration_fingerprints[key] = fingerprint
+        return fingerprint
+    
+    def find_pregenerated_turn(self, transcribed_text, scenario, difficulty):
+        """查詢背景預先生成的助教回合"""
+        fingerprint = self.pregeneration_fingerprint(scenario, difficulty)
+        return self.pregenerated_turns.lookup(scenario, difficulty, transcribed_text, fingerprint)
+    
+    def _utterance_duration(self, transcription):
+        if not transcription or not transcription.get("segments"):
+            return None
+        return transcription["segments"][-1]["end"]
+    
+    def _apply_transcription_signals(self, analysis_result, transcription, confidence, 
+                                     difficulty_config, feedback_detail):
+        """加入由語音辨識結果推得的流暢度與可懂度資訊"""
+        if confidence:
+            analysis_result["confidence"] = confidence
+            if feedback_detail != "基本回饋":
+                analysis_result["pronunciation_analysis"] += format_confidence_feedback(confidence)
+        
+        if not transcription or not transcription.get("words"):
+            return analysis_result
+        
+        fluency_metrics = analyze_word_timings(transcription["words"])
+        if not fluency_metrics:
+            return analysis_result
+        
+        analysis_result["fluency_score"] = score_fluency_from_timings(fluency_metrics, difficulty_config["level"])
+        analysis_result["fluency_metrics"] = fluency_metrics
+        
+        if feedback_detail != "基本回饋":
+            analysis_result["pronunciation_analysis"] += format_fluency_feedback(fluency_metrics)
+        
+        return analysis_result
     
     def _analyze_with_audio_llm(self, audio_path, transcribed_text, scenario, conversation_history, 
                                difficulty, pronunciation_focus, accent_preference, feedback_detail, 
-                               show_comparison, **kwargs):
-        """使用Audio-LLM進行詳細分析 - 整合所有進階功能"""
+                               show_comparison, confidence=None, **kwargs):
+        """使用Audio-LLM進行詳細分析 - 整合所有進階功能
+        
+        相同的辨識文字、設定與對話上下文直接使用快取的助教回應與建議回覆，發音分數與分析
+        由目前的錄音以本地聲學評分計算；會寫入快取的生成改用確定性解碼
+        """
         try:
-            system_prompt = create_advanced_prompt(
-                scenario, difficulty, pronunciation_focus, accent_preference,
-                feedback_detail, show_comparison, conversation_history
+            compiled = prompt_compiler.compile(
+                scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail
+            )
+            
+            cache = self.analysis_cache
+            cache_key = cache.make_key(
+                transcribed_text, scenario, difficulty, pronunciation_focus, accent_preference,
+                feedback_detail, catalog_version=compiled["key"][0], conversation_history=conversation_history
             )
+            cached = cache.get(cache_key)
+            get_tracer().set_attribute("analysis_cache", "hit" if cached else "miss")
+            if cached:
+                return self._analyze_with_stored_turn(
+                    cached, ANALYSIS_MODE_CACHED, transcribed_text, scenario, difficulty, pronunciation_focus,
+                    accent_preference, feedback_detail, audio_path=audio_path, confidence=confidence
+                )
+            deterministic = cache.enabled and cache.deterministic and cache_key is not None
             
             difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
             
-            full_prompt = f"""<|im_start|>system
-{system_prompt}
+            # 只有對話上下文與使用者輸入需要每次 tokenize，system prompt 的 token IDs 已快取
+            prompt_suffix = f"""{PROMPT_CONTEXT_MARKER}{conversation_history}
 <|im_end|>
 <|im_start|>user
 <|AUDIO|>
@@ -374,33 +582,76 @@ Please analyze their pronunciation and provide your response according to the sp
 <|im_start|>assistant
 """
             
-            response = self.model_manager.generate_audio_response(audio_path, full_prompt)
+            prefix_token_ids = prompt_compiler.get_prefix_token_ids(compiled, self.model_manager.tokenize_text)
+            if prefix_token_ids is None:
+                prompt_suffix = compiled["chat_prefix"] + prompt_suffix
             
-            if response:
-                return self._parse_llm_response(response, transcribed_text, scenario, difficulty)
+            on_event = kwargs.get("on_event")
+            if on_event is not None:
+                analysis_result = self._stream_llm_analysis(
+                    audio_path, prompt_suffix, prefix_token_ids, on_event,
+                    transcribed_text, scenario, difficulty, deterministic
+                )
             else:
-                return None
+                response = self.model_manager.generate_audio_response(
+                    audio_path, prompt_suffix, prefix_token_ids=prefix_token_ids, deterministic=deterministic
+                )
+                if not response:
+                    return None
+                analysis_result = self._parse_llm_response(response, transcribed_text, scenario, difficulty)
+            
+            if deterministic:
+                cache.put(cache_key, analysis_result)
+            return analysis_result
                 
         except Exception as e:
             print(f"Audio-LLM分析失敗: {e}")
             return None
     
+    def _stream_llm_analysis(self, audio_path, prompt, prefix_token_ids, on_event,
+                             transcribed_text, scenario, difficulty, deterministic=False):
+        """串流生成並增量解析，每個解析事件即時交給 on_event"""
+        parser = StreamingResponseParser()
+        received_text = False
+        
+        for chunk in self.model_manager.stream_audio_response(
+            audio_path, prompt, prefix_token_ids=prefix_token_ids, deterministic=deterministic
+        ):
+            received_text = received_text or bool(chunk.strip())
+            for event in parser.feed(chunk):
+                on_event(event)
+        
+        for event in parser.finish():
+            on_event(event)
+        
+        if not received_text:
+            return None
+        return self._build_llm_result(parser, transcribed_text, scenario, difficulty)
+    
     def _analyze_with_simple_method(self, transcribed_text, scenario, difficulty, 
                                    pronunciation_focus=None, accent_preference="不指定", 
-                                   feedback_detail="詳細回饋"):
+                                   feedback_detail="詳細回饋", audio_path=None, confidence=None):
         """簡化分析模式 - 也整合進階功能設定"""
         
         difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
+        acoustic_features = self._extract_acoustic_features(audio_path, transcribed_text)
         
-        pronunciation_score = self._calculate_pronunciation_score(transcribed_text)
-        fluency_score = self._calculate_fluency_score(transcribed_text)
+        pronunciation_score = self._calculate_pronunciation_score(
+            transcribed_text, acoustic_features, difficulty_config["level"]
+        )
+        if confidence:
+            # 辨識信心度是較客觀的可懂度指標，與聲學/文字估計加權合併
+            pronunciation_score = round(0.6 * confidence["intelligibility_score"] + 0.4 * pronunciation_score)
+        fluency_score = self._calculate_fluency_score(
+            transcribed_text, acoustic_features, difficulty_config["level"]
+        )
         
         pronunciation_score += difficulty_config["score_adjustment"]
         pronunciation_score = max(40, min(100, pronunciation_score))
         
         pronunciation_analysis = self._generate_advanced_analysis(
             transcribed_text, pronunciation_score, difficulty_config, 
-            pronunciation_focus, accent_preference, feedback_detail
+            pronunciation_focus, accent_preference, feedback_detail, acoustic_features
         )
         
         responses = get_scenario_responses(scenario, difficulty)
@@ -413,11 +664,41 @@ Please analyze their pronunciation and provide your response according to the sp
             "response_text": response_text,
             "suggested_responses": suggested_responses,
             "pronunciation_score": pronunciation_score,
-            "fluency_score": fluency_score
+            "fluency_score": fluency_score,
+            "acoustic_features": acoustic_features
         }
     
+    def _analyze_with_stored_turn(self, turn, analysis_mode, transcribed_text, scenario, difficulty,
+                                  pronunciation_focus, accent_preference, feedback_detail,
+                                  audio_path=None, confidence=None):
+        """本地聲學評分（目前的錄音）+ 預先生成或快取的助教回應與建議回覆"""
+        analysis_result = self._analyze_with_simple_method(
+            transcribed_text, scenario, difficulty, pronunciation_focus,
+            accent_preference, feedback_detail, audio_path=audio_path, confidence=confidence
+        )
+        analysis_result["response_text"] = turn["response_text"]
+        if turn.get("suggested_responses"):
+            analysis_result["suggested_responses"] = list(turn["suggested_responses"])
+        analysis_result["analysis_mode"] = analysis_mode
+        return analysis_result
+    
+    def _extract_acoustic_features(self, audio_path, transcribed_text):
+        """從錄音波形擷取聲學特徵，無法讀取音頻時回傳None"""
+        if not has_audio(audio_path):
+            return None
+        
+        try:
+            tracer = get_tracer()
+            with tracer.span("load_waveform"):
+                waveform = load_audio(audio_path)
+            with tracer.span("feature_extraction", audio_seconds=len(waveform) / SAMPLE_RATE):
+                return extract_acoustic_features(waveform, word_count=len(transcribed_text.split()))
+        except Exception as e:
+            print(f"聲學特徵擷取失敗: {e}")
+            return None
+    
     def _generate_advanced_analysis(self, text, score, difficulty_config, pronunciation_focus, 
-                                   accent_preference, feedback_detail):
+                                   accent_preference, feedback_detail, acoustic_features=None):
         """根據進階設定生成分析內容"""
         
         level = difficulty_config["level"]
@@ -439,6 +720,13 @@ Please analyze their pronunciation and provide your response according to the sp
         else:
             analysis += self._get_expert_feedback(text, score, level, pronunciation_focus, accent_preference)
         
+        if acoustic_features and feedback_detail != "基本回饋":
+            analysis += "\n🔊 聲學分析：\n"
+            analysis += f"- 語速: {acoustic_features['speech_rate_wpm']:.0f} 字/分鐘\n"
+            analysis += f"- 停頓: {acoustic_features['pause_count']} 次（佔 {acoustic_features['pause_ratio']:.0%}）\n"
+            analysis += f"- 音高變化: {acoustic_features['pitch_range_st']:.1f} 半音\n"
+            analysis += f"- 音量起伏: {acoustic_features['energy_std_db']:.1f} dB\n"
+        
         if pronunciation_focus:
             analysis += "\n\n🎯 重點改進建議：\n"
             focus_tips = {
@@ -504,55 +792,14 @@ Please analyze their pronunciation and provide your response according to the sp
         """生成建議回覆句子"""
         level = difficulty_config["level"]
         
-        suggestions = {
-            "機場對話 (Airport Conversation)": {
-                "beginner": [
-                    "Thank you. Here is my passport.",
-                    "I am here for vacation.",
-                    "I will stay for one week."
-                ],
-                "intermediate": [
-                    "Thank you. Here are my travel documents.",
-                    "I'm visiting for tourism purposes.",
-                    "I plan to stay for about ten days."
-                ],
-                "advanced": [
-                    "Certainly. Here are my passport and boarding pass.",
-                    "I'm here on a business trip with some leisure time.",
-                    "I'll be staying for approximately two weeks for both business and tourism."
-                ]
-            },
-            "餐廳點餐 (Restaurant Ordering)": {
-                "beginner": [
-                    "I want a burger, please.",
-                    "Can I have water?",
-                    "How much is it?"
-                ],
-                "intermediate": [
-                    "I'd like to order the grilled chicken, please.",
-                    "Could I have a glass of water with that?",
-                    "What's the total cost?"
-                ],
-                "advanced": [
-                    "I'd be interested in trying your signature dish.",
-                    "Could you recommend a wine pairing with that?",
-                    "I'd like to split the bill, if that's possible."
-                ]
-            }
-        }
-        
-        scenario_suggestions = suggestions.get(scenario, {})
-        level_suggestions = scenario_suggestions.get(level, [
-            "That sounds good.",
-            "I understand. Thank you.",
-            "Could you please explain more?"
-        ])
-        
-        return level_suggestions
+        return list(get_scenario_index().suggestions(scenario, level))
     
-    def _calculate_pronunciation_score(self, text):
-        """計算發音分數"""
-        base_score = 70
+    def _calculate_pronunciation_score(self, text, acoustic_features=None, level="intermediate"):
+        """計算發音分數 - 有錄音時使用聲學特徵，否則依文字估計"""
+        if acoustic_features:
+            return score_pronunciation(acoustic_features, level)
+        
+        base_score = 72
         
         word_count = len(text.split())
         length_bonus = min(15, word_count * 2)
@@ -563,14 +810,15 @@ Please analyze their pronunciation and provide your response according to the sp
         if '?' in text:
             grammar_bonus += 5
         
-        random_factor = random.randint(-5, 10)
-        
-        final_score = base_score + length_bonus + grammar_bonus + random_factor
+        final_score = base_score + length_bonus + grammar_bonus
         return max(60, min(95, final_score))
     
-    def _calculate_fluency_score(self, text):
-        """計算流暢度分數"""
-        base_score = 75
+    def _calculate_fluency_score(self, text, acoustic_features=None, level="intermediate"):
+        """計算流暢度分數 - 有錄音時使用聲學特徵，否則依文字估計"""
+        if acoustic_features:
+            return score_fluency(acoustic_features, level)
+        
+        base_score = 77
         
         sentence_count = text.count('.') + text.count('?') + text.count('!')
         if sentence_count == 0:
@@ -585,60 +833,26 @@ Please analyze their pronunciation and provide your response according to the sp
         else:
             structure_bonus = 0
         
-        random_factor = random.randint(-8, 12)
-        
-        final_score = base_score + structure_bonus + random_factor
+        final_score = base_score + structure_bonus
         return max(65, min(90, final_score))
     
+    @traced("_parse_llm_response")
     def _parse_llm_response(self, response, transcribed_text, scenario, difficulty):
         """解析LLM回應 - 提取建議回覆"""
-        lines = response.split('\n')
-        
+        return self._build_llm_result(parse_response(response), transcribed_text, scenario, difficulty)
+    
+    def _build_llm_result(self, parser, transcribed_text, scenario, difficulty):
+        """由解析器狀態組成分析結果，缺少的段落以備用內容補齊"""
         difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
         
         base_score = 85 + difficulty_config["score_adjustment"]
         pronunciation_score = max(40, min(100, base_score))
+        if parser.pronunciation_score is not None:
+            pronunciation_score = parser.pronunciation_score
         fluency_score = 80
-        pronunciation_analysis = ""
-        response_text = ""
-        suggested_responses = []
-        
-        current_section = ""
-        
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            if "**PRONUNCIATION ANALYSIS:**" in line or "PRONUNCIATION ANALYSIS:" in line:
-                current_section = "analysis"
-                continue
-            elif "**CONVERSATION RESPONSE:**" in line or "CONVERSATION RESPONSE:" in line:
-                current_section = "response"
-                continue
-            elif "**SUGGESTED NEXT RESPONSES:**" in line or "SUGGESTED NEXT RESPONSES:" in line:
-                current_section = "suggestions"
-                continue
-            
-            if current_section == "analysis":
-                if "score:" in line.lower() and any(char.isdigit() for char in line):
-                    numbers = re.findall(r'\d+', line)
-                    if numbers:
-                        score = int(numbers[0])
-                        if 0 <= score <= 100:
-                            pronunciation_score = score
-                pronunciation_analysis += line + "\n"
-            
-            elif current_section == "response":
-                if not line.startswith("**") and not line.startswith("SUGGESTED"):
-                    response_text += line + " "
-            
-            elif current_section == "suggestions":
-                if line.startswith(("1.", "2.", "3.", "-", "•")):
-                    suggestion = re.sub(r'^[123\-•]\s*', '', line)
-                    suggestion = re.sub(r'\[.*?\]', '', suggestion).strip()
-                    if suggestion:
-                        suggested_responses.append(suggestion)
+        pronunciation_analysis = parser.pronunciation_analysis
+        response_text = parser.response_text
+        suggested_responses = list(parser.suggestions)
         
         if not suggested_responses:
             suggested_responses = self._generate_suggested_responses(scenario, difficulty_config, transcribed_text)
@@ -658,33 +872,159 @@ Please analyze their pronunciation and provide your response according to the sp
             "fluency_score": fluency_score
         }
 
-class ConversationManager:    
-    def __init__(self):
-        self.audio_processor = AudioProcessor()
-        self.conversation_history = []
+class ConversationManager:
+    """對話流程的進入點
+    
+    建構時只建立工作階段狀態；模型、學習進度與錄音保存區都在第一次使用時依 config 建立，
+    例如 ConversationManager(config={"models": {"load_in_background": True}, "progress": {"db_path": "eval/progress.db"}})
+    
+    模型管理器每個程序只有一份，學習進度資料庫、錄音保存區與預先生成回合依路徑共用，
+    進度分析與歷程匯出屬於各管理器；與已建立的共用元件設定不同時拋出 ValueError
+    """
+    
+    def __init__(self, max_history=None, session_ttl=None, max_sessions=None, progress_store=None,
+                 model_manager=None, recording_store=None, config=None):
+        """
+        Args:
+            max_history / session_ttl / max_sessions: 覆寫 config["sessions"] 的對應設定
+            progress_store / model_manager / recording_store: 直接提供已建立的元件（測試或共用時）
+            config (dict): 覆寫 DEFAULT_PIPELINE_CONFIG 的設定
+        """
+        self.config = merge_pipeline_config(config)
+        session_config = self.config["sessions"]
+        self.audio_processor = AudioProcessor(model_manager, config=self.config)
+        self.sessions = SessionStore(
+            max_history=max_history or session_config["max_history"],
+            ttl_seconds=session_ttl or session_config["ttl_seconds"],
+            max_sessions=max_sessions or session_config["max_sessions"]
+        )
+        self._progress_store = progress_store
+        self._recording_store = recording_store
+        self._analytics = None
+        self._history_exporter = None
+        self._component_lock = threading.RLock()
+        self._async_pipeline = None
+        self.pregenerator = None
+        
+        # 工作階段 -> 學習者代號；獨立於工作階段的閒置淘汰，分頁閒置後回來仍記到同一位學習者
+        self._learner_ids = OrderedDict()
+        self.max_learner_links = session_config["max_learner_links"]
+        
+        self._activity_lock = threading.Lock()
+        self.active_requests = 0
+        self.last_request_at = 0.0
+    
+    @property
+    def progress_store(self):
+        if self._progress_store is None:
+            with self._component_lock:
+                if self._progress_store is None:
+                    self._progress_store = get_progress_store(**self.config["progress"])
+        return self._progress_store
+    
+    @progress_store.setter
+    def progress_store(self, progress_store):
+        self._progress_store = progress_store
+    
+    @property
+    def analytics(self):
+        """學習進度分析（過去的紀錄從 progress_store 載入）"""
+        if self._analytics is None:
+            with self._component_lock:
+                if self._analytics is None:
+                    self._analytics = ProgressAnalytics(self.progress_store, **self.config["analytics"])
+        return self._analytics
+    
+    @analytics.setter
+    def analytics(self, analytics):
+        self._analytics = analytics
+    
+    @property
+    def history_exporter(self):
+        """學習歷程匯出（由 progress_store 分批讀取，在背景執行緒寫檔）"""
+        if self._history_exporter is None:
+            with self._component_lock:
+                if self._history_exporter is None:
+                    self._history_exporter = HistoryExporter(self.progress_store, **self.config["exports"])
+        return self._history_exporter
+    
+    @property
+    def recording_store(self):
+        if self._recording_store is None:
+            with self._component_lock:
+                if self._recording_store is None:
+                    self._recording_store = get_recording_store(**self.config["recordings"])
+        return self._recording_store
+    
+    @recording_store.setter
+    def recording_store(self, recording_store):
+        self._recording_store = recording_store
+    
+    @contextmanager
+    def track_request(self):
+        """標記進行中的請求，背景預先生成只在沒有請求時使用模型"""
+        with self._activity_lock:
+            self.active_requests += 1
+        try:
+            yield
+        finally:
+            with self._activity_lock:
+                self.active_requests -= 1
+                self.last_request_at = time.monotonic()
+    
+    def is_idle(self, idle_seconds=0.0):
+        return self.active_requests == 0 and time.monotonic() - self.last_request_at >= idle_seconds
+    
+    def start_pregeneration(self, **kwargs):
+        """啟動背景預先生成（參數見 Pregenerator）"""
+        if self.pregenerator is None:
+            self.pregenerator = Pregenerator(self, **kwargs)
+        return self.pregenerator.start()
     
     def process_user_input(self, audio_path, scenario, conversation_context="", difficulty="中級 (TOEIC 605-780分)", 
                           pronunciation_focus=None, accent_preference="不指定", feedback_detail="詳細回饋", 
-                          show_comparison=True, **kwargs):
-        """處理用戶輸入的完整流程 - 整合所有進階功能"""
-        result = {
-            "recognized_text": "",
-            "pronunciation_analysis": "",
-            "response_text": "",
-            "suggested_responses": [],
-            "pronunciation_score": 0,
-            "fluency_score": 0,
-            "success": False,
-            "error_message": ""
-        }
+                          show_comparison=True, session_id=DEFAULT_SESSION_ID, track_progress=True, **kwargs):
+        """處理用戶輸入的完整流程 - 整合所有進階功能
+        
+        audio_path 可為檔案路徑、Gradio 的 (取樣率, 樣本) 或 16kHz 波形；只在開頭解碼一次，
+        之後的語音識別、聲學特徵與 Audio-LLM 都使用同一份波形
+        kwargs 可包含 transcription（已完成的詳細辨識結果），此時略過語音識別
+        """
+        args = (audio_path, scenario, conversation_context, difficulty, pronunciation_focus,
+                accent_preference, feedback_detail, show_comparison, session_id, track_progress)
+        
+        with self.track_request(), get_tracer().span("process_user_input", session_id=session_id, difficulty=difficulty):
+            capture = self.start_profile_capture(audio_path, scenario, difficulty, feedback_detail, session_id)
+            if capture is None:
+                return self._process_user_input(*args, **kwargs)
+            
+            result = capture.run("process_user_input", self._process_user_input, *args, **kwargs)
+            self.finish_profile_capture(capture, result)
+            return result
+    
+    def _process_user_input(self, audio_path, scenario, conversation_context, difficulty, pronunciation_focus,
+                            accent_preference, feedback_detail, show_comparison, session_id, track_progress,
+                            **kwargs):
+        result = self._empty_result()
         
         try:
-            recognized_text, transcribe_status = self.audio_processor.transcribe_speech(audio_path)
+            source = audio_path
+            audio_path = self.load_input_audio(source)
+            if audio_path is None:
+                result["error_message"] = "音頻文件不存在"
+                return result
+            
+            # 串流辨識已完成時直接使用其結果（見 streaming_asr.py）
+            transcription = kwargs.pop("transcription", None)
+            transcribe_status = "語音識別失敗，請重新錄製"
+            if transcription is None:
+                transcription, transcribe_status = self.audio_processor.transcribe_speech_detailed(audio_path)
             
-            if not recognized_text:
+            if not transcription:
                 result["error_message"] = transcribe_status
                 return result
             
+            recognized_text = transcription["text"]
             result["recognized_text"] = recognized_text
             
             analysis_result = self.audio_processor.analyze_pronunciation(
@@ -697,39 +1037,164 @@ class ConversationManager:
                 accent_preference=accent_preference,
                 feedback_detail=feedback_detail,
                 show_comparison=show_comparison,
+                transcription=transcription,
                 **kwargs
             )
             
-            result.update(analysis_result)
-            result["success"] = True
-            
-            self._update_conversation_history(scenario, recognized_text, result["response_text"])
-            
+            self._complete_turn(
+                result, analysis_result, session_id, self.retain_recording(source, audio_path, session_id, track_progress),
+                scenario, difficulty, pronunciation_focus, accent_preference, feedback_detail, track_progress,
+                kwargs.get("focus_area")
+            )
             return result
             
         except Exception as e:
             result["error_message"] = f"處理過程出錯: {str(e)}"
             return result
     
-    def _update_conversation_history(self, scenario, user_text, assistant_text):
-        entry = {
-            "timestamp": datetime.datetime.now(),
-            "scenario": scenario,
-            "user": user_text,
-            "assistant": assistant_text
+    @traced("load_audio")
+    def load_input_audio(self, audio):
+        """將輸入音頻解碼為 16kHz 波形（整個請求只解碼這一次），無法使用時回傳None"""
+        if not has_audio(audio):
+            return None
+        waveform = load_audio(audio)
+        get_tracer().set_attribute("audio_seconds", round(len(waveform) / SAMPLE_RATE, 3))
+        return waveform
+    
+    def retain_recording(self, source, waveform, session_id, track_progress=True):
+        """學習進度所引用的錄音：檔案輸入沿用原路徑，記憶體中的錄音交給錄音保存區背景寫入"""
+        if not track_progress:
+            return None
+        if isinstance(source, str):
+            return source
+        return self.recording_store.save(waveform, session_id)
+    
+    async def process_user_input_async(self, audio_path, scenario, **kwargs):
+        """process_user_input 的 asyncio 版本，模型呼叫在各階段的執行緒池中個別執行
+        
+        參數與 process_user_input 相同；on_event 會在事件迴圈上被呼叫
+        """
+        if self._async_pipeline is None:
+            from async_pipeline import AsyncPipeline
+            self._async_pipeline = AsyncPipeline(self)
+        return await self._async_pipeline.process_user_input(audio_path, scenario, **kwargs)
+    
+    def start_profile_capture(self, audio_path, scenario, difficulty, feedback_detail, session_id, mode="sync"):
+        """若操作人員啟動了效能剖析，為這個請求建立剖析紀錄"""
+        return get_request_profiler().acquire(
+            mode=mode,
+            session_id=session_id,
+            scenario=scenario,
+            difficulty=difficulty,
+            feedback_detail=feedback_detail,
+            audio_path=audio_path if isinstance(audio_path, str) else None,
+            audio_bytes=audio_nbytes(audio_path)
+        )
+    
+    def finish_profile_capture(self, capture, result):
+        model_manager = self.audio_processor.model_manager
+        memory_status = model_manager.get_memory_status() if hasattr(model_manager, "get_memory_status") else None
+        get_request_profiler().finish(
+            capture,
+            result,
+            audio_seconds=(result.get("fluency_metrics") or {}).get("duration"),
+            memory_status=memory_status
+        )
+    
+    def _empty_result(self):
+        return {
+            "recognized_text": "",
+            "pronunciation_analysis": "",
+            "response_text": "",
+            "suggested_responses": [],
+            "pronunciation_score": 0,
+            "fluency_score": 0,
+            "success": False,
+            "error_message": ""
         }
+    
+    def _complete_turn(self, result, analysis_result, session_id, audio_ref, scenario, difficulty,
+                       pronunciation_focus, accent_preference, feedback_detail, track_progress, focus_area):
+        """合併分析結果，更新工作階段歷史並記錄學習進度"""
+        result.update(analysis_result)
+        result["success"] = True
         
-        self.conversation_history.append(entry)
+        self.sessions.get(session_id).add_entry(scenario, result["recognized_text"], result["response_text"])
         
-        if len(self.conversation_history) > 10:
-            self.conversation_history = self.conversation_history[-10:]
+        if track_progress:
+            self._record_progress(
+                self.get_learner_id(session_id), audio_ref, scenario, difficulty, result,
+                pronunciation_focus, accent_preference, feedback_detail, focus_area
+            )
+    
+    def _record_progress(self, learner_id, audio_ref, scenario, difficulty, result,
+                         pronunciation_focus, accent_preference, feedback_detail, focus_area):
+        """更新學習進度分析，並將練習結果排入學習進度儲存區（背景寫入；session_id 欄位存放學習者代號）"""
+        difficulty_config = DIFFICULTY_CONFIGS.get(difficulty, DIFFICULTY_CONFIGS["中級 (TOEIC 605-780分)"])
+        # 先更新分析再排入寫入：第一次載入學習者的過去紀錄時，這個回合還不在資料庫中
+        self.analytics.record(
+            learner_id, scenario, result.get("pronunciation_score", 0), result.get("fluency_score", 0)
+        )
+        self.progress_store.record(
+            learner_id,
+            scenario,
+            difficulty,
+            result,
+            level=difficulty_config["level"],
+            settings={
+                "pronunciation_focus": pronunciation_focus or [],
+                "accent_preference": accent_preference,
+                "feedback_detail": feedback_detail,
+                "focus_area": focus_area
+            },
+            audio_ref=audio_ref
+        )
+    
+    def attach_learner(self, session_id, learner_key):
+        """以學習紀錄金鑰將工作階段連結到持久的學習者代號，回傳代號；金鑰不合法時拋出 ValueError
+        
+        金鑰由瀏覽器產生並保存，是存取學習紀錄的唯一憑證；伺服器只保存由金鑰雜湊得到的代號
+        """
+        learner_id = learner_id_from_key(learner_key)
+        with self._activity_lock:
+            self._learner_ids[session_id] = learner_id
+            self._learner_ids.move_to_end(session_id)
+            while len(self._learner_ids) > self.max_learner_links:
+                self._learner_ids.popitem(last=False)
+        return learner_id
+    
+    def get_learner_id(self, session_id=DEFAULT_SESSION_ID):
+        """工作階段的學習者代號；尚未連結時以工作階段ID代替"""
+        with self._activity_lock:
+            return self._learner_ids.get(session_id, session_id)
+    
+    def get_progress_dashboard(self, learner_id=DEFAULT_SESSION_ID):
+        """學習者的進度儀表板（累計統計，不需查詢資料庫）"""
+        return self.analytics.get_dashboard(learner_id)
+    
+    def export_history(self, learner_id=DEFAULT_SESSION_ID, export_format="jsonl", include_audio_refs=False):
+        """送出學習歷程匯出工作，回傳工作ID（以 history_exporter.status 查詢進度與檔案路徑）"""
+        return self.history_exporter.start(learner_id, export_format, include_audio_refs)
+    
+    def get_progress_trend(self, group_by="scenario", bucket="day", session_id=None):
+        """學習進度趨勢（依場景或難度的平均分數）"""
+        return self.progress_store.score_trend(group_by=group_by, bucket=bucket, session_id=session_id)
+    
+    def get_session(self, session_id=DEFAULT_SESSION_ID):
+        """獲取工作階段狀態"""
+        return self.sessions.get(session_id)
+    
+    def get_history(self, session_id=DEFAULT_SESSION_ID):
+        """獲取工作階段的對話歷史"""
+        return self.sessions.get(session_id).get_history()
     
-    def get_conversation_context(self, max_entries=3):
+    def get_conversation_context(self, max_entries=3, session_id=DEFAULT_SESSION_ID):
         """獲取對話上下文"""
-        if not self.conversation_history:
+        history = self.get_history(session_id)
+        if not history:
             return ""
         
-        recent_history = self.conversation_history[-max_entries:]
+        recent_history = history[-max_entries:]
         context_lines = []
         
         for entry in recent_history:
@@ -738,15 +1203,17 @@ class ConversationManager:
         
         return "\n".join(context_lines)
     
-    def clear_history(self):
+    def clear_history(self, session_id=DEFAULT_SESSION_ID):
         """清除對話歷史"""
-        self.conversation_history = []
+        self.sessions.get(session_id).clear_history()
 
-conversation_manager = ConversationManager()
+_conversation_managers = SharedInstances(ConversationManager)
 
-def get_conversation_manager():
-    """獲取對話管理器實例"""
-    return conversation_manager
+def get_conversation_manager(config=None):
+    """獲取程序共用的對話管理器（首次呼叫時依 config 建立；之後傳入不同的 config 會拋出 ValueError）"""
+    if config is None:
+        return _conversation_managers.get()
+    return _conversation_managers.get(config=config)
 
 if __name__ == "__main__":
     print("測試音頻處理器...")
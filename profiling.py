@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+profiling.py - 線上請求效能剖析
+由操作人員（系統監控頁面或 SIGUSR1 訊號）啟動後，對接下來 N 個 process_user_input 請求
+擷取 cProfile 與 torch.profiler 結果，連同請求資訊寫入磁碟，不需重新啟動服務
+"""
+
+import os
+import io
+import json
+import time
+import pstats
+import signal
+import cProfile
+import threading
+
+DEFAULT_PROFILE_DIR = "profiles"
+DEFAULT_PROFILE_REQUESTS = 5
+TOP_FUNCTIONS = 40
+
+# cProfile 與 torch.profiler 同一時間只能有一個在執行
+_profiler_slot = threading.Lock()
+
+
+def _start_torch_profiler():
+    try:
+        import torch
+        from torch.profiler import profile, ProfilerActivity
+    except ImportError:
+        return None
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    profiler = profile(activities=activities, record_shapes=True, with_stack=False)
+    profiler.__enter__()
+    return profiler
+
+
+class ProfileCapture:
+    """單一請求的剖析結果；各階段可在不同執行緒中執行"""
+
+    def __init__(self, output_dir, request_id, metadata, use_torch=True):
+        self.output_dir = output_dir
+        self.request_id = request_id
+        self.metadata = dict(metadata)
+        self.use_torch = use_torch
+        self.started_at = time.time()
+        self.stages = []
+        self._cprofiles = []
+        self._torch_profiles = []
+        self._lock = threading.Lock()
+
+    def run(self, stage, fn, *args, **kwargs):
+        """在目前的執行緒中剖析一次呼叫"""
+        if not _profiler_slot.acquire(blocking=False):
+            # 其他請求正在剖析，這個階段只記錄耗時
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._add_stage(stage, time.perf_counter() - start, profiled=False)
+
+        torch_profiler = None
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            torch_profiler = _start_torch_profiler() if self.use_torch else None
+            profile.enable()
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            if torch_profiler is not None:
+                torch_profiler.__exit__(None, None, None)
+            _profiler_slot.release()
+
+            with self._lock:
+                self._cprofiles.append(profile)
+                if torch_profiler is not None:
+                    self._torch_profiles.append((stage, torch_profiler))
+            self._add_stage(stage, elapsed, profiled=True)
+
+    def _add_stage(self, stage, elapsed, profiled):
+        with self._lock:
+            self.stages.append({
+                "stage": stage,
+                "elapsed_seconds": round(elapsed, 4),
+                "profiled": profiled,
+                "thread": threading.current_thread().name
+            })
+
+    def finish(self, result=None, **extra):
+        """寫出 cProfile、torch.profiler 結果與請求資訊，回傳輸出資料夾"""
+        directory = os.path.join(self.output_dir, self.request_id)
+        os.makedirs(directory, exist_ok=True)
+
+        metadata = dict(self.metadata)
+        metadata.update(extra)
+        metadata.update({
+            "request_id": self.request_id,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "total_seconds": round(time.time() - self.started_at, 4),
+            "stages": self.stages
+        })
+        if result is not None:
+            metadata.update({
+                "success": result.get("success"),
+                "error_message": result.get("error_message"),
+                "analysis_mode": result.get("analysis_mode"),
+                "gate_reason": result.get("gate_reason"),
+                "recognized_words": len(result.get("recognized_text", "").split())
+            })
+
+        with self._lock:
+            cprofiles = list(self._cprofiles)
+            torch_profiles = list(self._torch_profiles)
+
+        if cprofiles:
+            report = io.StringIO()
+            stats = pstats.Stats(*cprofiles, stream=report)
+            stats.dump_stats(os.path.join(directory, "cprofile.prof"))
+            stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(directory, "cprofile.txt"), "w", encoding="utf-8") as f:
+                f.write(report.getvalue())
+
+        for stage, torch_profiler in torch_profiles:
+            try:
+                torch_profiler.export_chrome_trace(os.path.join(directory, f"torch_{stage}.json"))
+                table = torch_profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=TOP_FUNCTIONS)
+                with open(os.path.join(directory, f"torch_{stage}_ops.txt"), "w", encoding="utf-8") as f:
+                    f.write(table)
+            except Exception as e:
+                metadata.setdefault("torch_profiler_errors", []).append(f"{stage}: {e}")
+
+        with open(os.path.join(directory, "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+
+        print(f"🔬 已寫入效能剖析: {directory}")
+        return directory
+
+
+class RequestProfiler:
+    """控制哪些請求需要剖析：arm(n) 之後的 n 個請求"""
+
+    def __init__(self, output_dir=DEFAULT_PROFILE_DIR, use_torch=True):
+        self.output_dir = output_dir
+        self.use_torch = use_torch
+        self.remaining = 0
+        self.captured = 0
+        self.last_output = None
+        self._lock = threading.Lock()
+
+    def arm(self, count=DEFAULT_PROFILE_REQUESTS):
+        """剖析接下來的 count 個請求"""
+        with self._lock:
+            self.remaining = max(0, int(count))
+        print(f"🔬 效能剖析已啟動，將擷取接下來 {self.remaining} 個請求")
+        return self.remaining
+
+    def disarm(self):
+        with self._lock:
+            self.remaining = 0
+
+    def acquire(self, **metadata):
+        """若仍有剖析名額則回傳 ProfileCapture，否則回傳None"""
+        if not self.remaining:
+            return None
+        with self._lock:
+            if not self.remaining:
+                return None
+            self.remaining -= 1
+            self.captured += 1
+            request_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.captured:04d}"
+        return ProfileCapture(self.output_dir, request_id, metadata, self.use_torch)
+
+    def finish(self, capture, result=None, **extra):
+        self.last_output = capture.finish(result, **extra)
+        return self.last_output
+
+    def get_status(self):
+        return {
+            "remaining": self.remaining,
+            "captured": self.captured,
+            "last_output": self.last_output,
+            "output_dir": self.output_dir
+        }
+
+
+request_profiler = RequestProfiler()
+
+
+def get_request_profiler():
+    """獲取請求剖析器實例"""
+    return request_profiler
+
+
+def install_signal_handler(count=None, signum=None):
+    """收到訊號（預設 SIGUSR1）時剖析接下來的 count 個請求；只能在主執行緒呼叫"""
+    signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        print("⚠️  此平台不支援 SIGUSR1，請由系統監控頁面啟動效能剖析")
+        return False
+
+    if count is None:
+        count = int(os.environ.get("PROFILE_REQUESTS", DEFAULT_PROFILE_REQUESTS))
+
+    def arm_from_signal(*_):
+        # 訊號處理器可能打斷持有鎖的主執行緒，因此直接設定名額而不取鎖
+        request_profiler.remaining = count
+
+    signal.signal(signum, arm_from_signal)
+    print(f"🔬 傳送 SIGUSR1 (kill -USR1 {os.getpid()}) 可剖析接下來 {count} 個請求")
+    return True
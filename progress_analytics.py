@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+progress_analytics.py - 學習進度分析
+每位學習者的分數序列保存在可倍增容量的 numpy 陣列中，每個回合以 O(1) 更新累計統計
+（移動平均、指數平均、各場景平均、進步斜率），儀表板更新不需重新掃描歷史紀錄；
+學習者第一次出現時才從學習進度資料庫分批載入過去的紀錄；載入在全域鎖之外進行，
+同一學習者的其他呼叫等待載入完成，其他學習者不受影響
+"""
+
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+METRICS = ("pronunciation", "fluency")
+
+
+def _slope(n, first_index, sum_y, sum_iy):
+    """以累計和計算連續索引 first_index..first_index+n-1 上的最小平方斜率（每回合分數變化）"""
+    if n < 2:
+        return np.zeros_like(sum_y)
+    last_index = first_index + n - 1
+    sum_x = (first_index + last_index) * n / 2
+    sum_xx = (last_index * (last_index + 1) * (2 * last_index + 1)
+              - (first_index - 1) * first_index * (2 * first_index - 1)) / 6
+    denominator = n * sum_xx - sum_x * sum_x
+    return (n * sum_iy - sum_x * sum_y) / denominator
+
+
+class ScoreSeries:
+    """單一學習者的分數序列（發音、流暢度兩欄）與累計統計"""
+
+    def __init__(self, window=10, ema_alpha=0.2, initial_capacity=32):
+        """
+        Args:
+            window (int): 移動平均與近期斜率的回合數
+            ema_alpha (float): 指數移動平均的權重
+            initial_capacity (int): 陣列初始容量，用完時倍增
+        """
+        self.window = window
+        self.ema_alpha = ema_alpha
+        self.count = 0
+        self.timestamps = np.empty(initial_capacity, dtype=np.float64)
+        self.scores = np.empty((initial_capacity, len(METRICS)), dtype=np.float32)
+        self.scenario_ids = np.empty(initial_capacity, dtype=np.int16)
+
+        self._sum = np.zeros(len(METRICS))
+        self._sum_iy = np.zeros(len(METRICS))
+        self._window_sum = np.zeros(len(METRICS))
+        self._window_sum_iy = np.zeros(len(METRICS))
+        self.ema = np.zeros(len(METRICS))
+        self.best = np.zeros(len(METRICS))
+
+    def _grow(self):
+        capacity = len(self.timestamps) * 2
+        for name in ("timestamps", "scores", "scenario_ids"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def append(self, timestamp, scores, scenario_id):
+        if self.count == len(self.timestamps):
+            self._grow()
+
+        index = self.count
+        values = np.asarray(scores, dtype=np.float64)
+        self.timestamps[index] = timestamp
+        self.scores[index] = values
+        self.scenario_ids[index] = scenario_id
+        self.count += 1
+
+        self._sum += values
+        self._sum_iy += index * values
+        self._window_sum += values
+        self._window_sum_iy += index * values
+        if self.count > self.window:
+            dropped_index = index - self.window
+            dropped = self.scores[dropped_index].astype(np.float64)
+            self._window_sum -= dropped
+            self._window_sum_iy -= dropped_index * dropped
+
+        self.ema = values if index == 0 else self.ema + self.ema_alpha * (values - self.ema)
+        self.best = np.maximum(self.best, values)
+
+    def summary(self):
+        """各指標的累計統計（與回合數無關的固定成本）"""
+        if self.count == 0:
+            return {}
+        window_count = min(self.count, self.window)
+        mean = self._sum / self.count
+        moving_average = self._window_sum / window_count
+        slope = _slope(self.count, 0, self._sum, self._sum_iy)
+        recent_slope = _slope(window_count, self.count - window_count, self._window_sum, self._window_sum_iy)
+        last = self.scores[self.count - 1]
+        return {
+            metric: {
+                "mean": round(float(mean[i]), 1),
+                "moving_average": round(float(moving_average[i]), 1),
+                "ema": round(float(self.ema[i]), 1),
+                "slope": round(float(slope[i]), 2),
+                "recent_slope": round(float(recent_slope[i]), 2),
+                "best": int(self.best[i]),
+                "last": int(last[i])
+            }
+            for i, metric in enumerate(METRICS)
+        }
+
+    def nbytes(self):
+        return self.timestamps.nbytes + self.scores.nbytes + self.scenario_ids.nbytes
+
+
+class LearnerProgress:
+    """單一學習者的分數序列與各場景累計"""
+
+    def __init__(self, window=10, ema_alpha=0.2):
+        self.series = ScoreSeries(window, ema_alpha)
+        self.scenario_totals = {}     # 場景編號 -> [次數, 發音總分, 流暢度總分]
+
+    def add(self, timestamp, scenario_id, pronunciation_score, fluency_score):
+        self.series.append(timestamp, (pronunciation_score, fluency_score), scenario_id)
+        totals = self.scenario_totals.setdefault(scenario_id, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += pronunciation_score
+        totals[2] += fluency_score
+
+
+class ProgressAnalytics:
+    """所有學習者的進度分析；以 OrderedDict 保留最近使用的學習者，被淘汰者下次使用時重新載入"""
+
+    def __init__(self, progress_store=None, window=10, ema_alpha=0.2, max_learners=10000):
+        """
+        Args:
+            progress_store: 用來載入學習者過去紀錄的 ProgressStore（None 表示不載入）
+            window (int): 移動平均與近期斜率的回合數
+            ema_alpha (float): 指數移動平均的權重
+            max_learners (int): 記憶體中保留的學習者上限
+        """
+        self.progress_store = progress_store
+        self.window = window
+        self.ema_alpha = ema_alpha
+        self.max_learners = max_learners
+
+        self._learners = OrderedDict()
+        self._loading = {}            # 學習者 -> 載入完成的 Event（載入中的佔位）
+        self._scenario_ids = {}
+        self._scenario_names = []
+        self._lock = threading.Lock()
+        self._scenario_lock = threading.Lock()
+        self.loaded_records = 0
+        self.evictions = 0
+
+    def _scenario_id(self, scenario):
+        with self._scenario_lock:
+            scenario_id = self._scenario_ids.get(scenario)
+            if scenario_id is None:
+                scenario_id = len(self._scenario_names)
+                self._scenario_ids[scenario] = scenario_id
+                self._scenario_names.append(scenario)
+            return scenario_id
+
+    def _load(self, learner_id):
+        """從學習進度資料庫載入學習者過去的紀錄（不持有全域鎖）"""
+        learner = LearnerProgress(self.window, self.ema_alpha)
+        loaded = 0
+        if self.progress_store is not None:
+            # 先寫入背景寫入器中尚未落盤的紀錄：被淘汰後重新載入時才包含剛完成的回合
+            self.progress_store.flush()
+            for record in self.progress_store.iter_records(session_id=learner_id):
+                learner.add(
+                    record["timestamp"], self._scenario_id(record["scenario"]),
+                    record["pronunciation_score"] or 0, record["fluency_score"] or 0
+                )
+                loaded += 1
+        return learner, loaded
+
+    def _ensure_loaded(self, learner_id):
+        """確保學習者在記憶體中（不持有鎖時呼叫）；同一學習者同時只載入一次"""
+        while True:
+            with self._lock:
+                if learner_id in self._learners:
+                    return
+                loading = self._loading.get(learner_id)
+                if loading is None:
+                    loading = self._loading[learner_id] = threading.Event()
+                    break
+            loading.wait()
+
+        learner = None
+        try:
+            learner, loaded = self._load(learner_id)
+        finally:
+            with self._lock:
+                del self._loading[learner_id]
+                if learner is not None:
+                    self._learners[learner_id] = learner
+                    self.loaded_records += loaded
+                    while len(self._learners) > self.max_learners:
+                        self._learners.popitem(last=False)
+                        self.evictions += 1
+            loading.set()
+
+    def _with_learner(self, learner_id, fn):
+        """在持有鎖的情況下以學習者呼叫 fn；需要時先在鎖外載入"""
+        while True:
+            self._ensure_loaded(learner_id)
+            with self._lock:
+                learner = self._learners.get(learner_id)
+                # 載入後到取得鎖之間可能已被淘汰，此時重新載入
+                if learner is not None:
+                    self._learners.move_to_end(learner_id)
+                    return fn(learner)
+
+    def record(self, learner_id, scenario, pronunciation_score, fluency_score, timestamp=None):
+        """加入一個回合的分數並更新累計統計
+
+        需在將同一回合寫入學習進度資料庫之前呼叫，第一次載入學習者時才不會重複計入
+        """
+        scenario_id = self._scenario_id(scenario)
+        self._with_learner(
+            learner_id,
+            lambda learner: learner.add(timestamp or time.time(), scenario_id, pronunciation_score, fluency_score)
+        )
+
+    def get_dashboard(self, learner_id):
+        """學習者的儀表板資料：整體統計、移動平均、進步斜率與各場景平均"""
+        return self._with_learner(learner_id, self._dashboard)
+
+    def _dashboard(self, learner):
+        series = learner.series
+        if series.count == 0:
+            return {"turns": 0}
+
+        dashboard = {
+            "turns": series.count,
+            "first_practice": float(series.timestamps[0]),
+            "last_practice": float(series.timestamps[series.count - 1]),
+            "window": min(series.count, self.window)
+        }
+        dashboard.update(series.summary())
+        dashboard["scenarios"] = {
+            self._scenario_names[scenario_id]: {
+                "count": count,
+                "avg_pronunciation": round(pronunciation_total / count, 1),
+                "avg_fluency": round(fluency_total / count, 1)
+            }
+            for scenario_id, (count, pronunciation_total, fluency_total) in learner.scenario_totals.items()
+        }
+        return dashboard
+
+    def get_recent(self, learner_id, limit=20):
+        """最近的回合（新到舊），直接由陣列尾端切片"""
+        return self._with_learner(learner_id, lambda learner: self._recent(learner, limit))
+
+    def _recent(self, learner, limit):
+        series = learner.series
+        start = max(0, series.count - limit)
+        return [
+            {
+                "timestamp": float(series.timestamps[i]),
+                "scenario": self._scenario_names[series.scenario_ids[i]],
+                "pronunciation_score": int(series.scores[i, 0]),
+                "fluency_score": int(series.scores[i, 1])
+            }
+            for i in range(series.count - 1, start - 1, -1)
+        ]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "learners": len(self._learners),
+                "turns": sum(learner.series.count for learner in self._learners.values()),
+                "memory_kb": sum(learner.series.nbytes() for learner in self._learners.values()) / 1024,
+                "loaded_records": self.loaded_records,
+                "evictions": self.evictions
+            }
+
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+progress_store.py - 學習進度儲存
+以 SQLite (WAL 模式) 永久保存每次練習的結果，寫入由背景執行緒批次處理，請求流程不需等待磁碟
+"""
+
+import os
+import json
+import time
+import queue
+import sqlite3
+import threading
+
+from shared_instances import SharedInstances
+
+DEFAULT_DB_PATH = os.path.join("progress", "learning_progress.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS practice_records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    scenario TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    level TEXT,
+    recognized_text TEXT,
+    response_text TEXT,
+    pronunciation_score INTEGER,
+    fluency_score INTEGER,
+    analysis_mode TEXT,
+    settings_json TEXT,
+    audio_ref TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_session ON practice_records (session_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_scenario ON practice_records (scenario, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_difficulty ON practice_records (difficulty, timestamp);
+CREATE INDEX IF NOT EXISTS idx_records_timestamp ON practice_records (timestamp);
+"""
+
+_INSERT_SQL = """
+INSERT INTO practice_records (
+    session_id, timestamp, scenario, difficulty, level, recognized_text, response_text,
+    pronunciation_score, fluency_score, analysis_mode, settings_json, audio_ref
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_COLUMNS = (
+    "id", "session_id", "timestamp", "scenario", "difficulty", "level", "recognized_text",
+    "response_text", "pronunciation_score", "fluency_score", "analysis_mode", "settings_json", "audio_ref"
+)
+
+# 趨勢查詢可用的分組欄位與時間區間
+TREND_GROUPS = ("scenario", "difficulty", "level", "session_id")
+TREND_BUCKETS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%Y-W%W",
+    "month": "%Y-%m"
+}
+
+_STOP = object()
+
+
+class ProgressStore:
+    """練習紀錄儲存區 - 批次非同步寫入，讀取使用獨立連線"""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, batch_size=64, flush_interval=1.0, max_pending=10000):
+        """
+        Args:
+            db_path (str): SQLite 資料庫路徑
+            batch_size (int): 單一交易最多寫入的筆數
+            flush_interval (float): 佇列有資料時，最長等待多久就寫入（秒）
+            max_pending (int): 等待寫入的上限，超過時丟棄新紀錄以保護請求流程
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._read_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # flush 只等待呼叫當下已排入的紀錄，持續有新紀錄時也不會一直等待
+        self._flushed = threading.Condition(self._stats_lock)
+        self.enqueued = 0
+        self.processed = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+
+        writer_conn = self._connect()
+        writer_conn.executescript(_SCHEMA)
+        writer_conn.commit()
+        self._read_conn = self._connect()
+
+        self._writer = threading.Thread(
+            target=self._writer_loop, args=(writer_conn,), name="progress-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, session_id, scenario, difficulty, result, level=None, settings=None, audio_ref=None):
+        """將一次練習結果排入寫入佇列，不會阻塞呼叫端
+
+        Returns:
+            bool: 是否成功排入佇列
+        """
+        row = (
+            session_id,
+            time.time(),
+            scenario,
+            difficulty,
+            level,
+            result.get("recognized_text", ""),
+            result.get("response_text", ""),
+            int(result.get("pronunciation_score", 0)),
+            int(result.get("fluency_score", 0)),
+            result.get("analysis_mode"),
+            json.dumps(settings or {}, ensure_ascii=False),
+            audio_ref
+        )
+        try:
+            self._queue.put_nowait(row)
+            with self._stats_lock:
+                self.enqueued += 1
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+
+    def _writer_loop(self, conn):
+        running = True
+        while running:
+            item = self._queue.get()
+            batch = []
+            done = 1
+            if item is _STOP:
+                running = False
+            else:
+                batch.append(item)
+
+            # 收集同一批次的後續紀錄，最多等待 flush_interval
+            deadline = time.time() + self.flush_interval
+            while running and len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                done += 1
+                if item is _STOP:
+                    running = False
+                else:
+                    batch.append(item)
+
+            if batch:
+                try:
+                    with conn:
+                        conn.executemany(_INSERT_SQL, batch)
+                    with self._stats_lock:
+                        self.written += len(batch)
+                        self.batches += 1
+                except sqlite3.Error as e:
+                    print(f"⚠️  學習進度寫入失敗: {e}")
+                    with self._stats_lock:
+                        self.write_errors += len(batch)
+
+            with self._flushed:
+                self.processed += len(batch)
+                self._flushed.notify_all()
+            for _ in range(done):
+                self._queue.task_done()
+
+        conn.close()
+
+    def flush(self):
+        """等待呼叫前已排入的紀錄全部寫入（之後才排入的紀錄不等待）"""
+        with self._flushed:
+            target = self.enqueued
+            while self.processed < target and self._writer.is_alive():
+                self._flushed.wait(0.5)
+
+    def close(self):
+        """寫入剩餘紀錄並停止背景執行緒"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return self._read_conn.execute(sql, params).fetchall()
+
+    def get_recent(self, session_id=None, limit=20):
+        """取得最近的練習紀錄（新到舊）"""
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM practice_records"
+        params = []
+        if session_id is not None:
+            sql += " WHERE session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+        params.append(limit)
+
+        records = []
+        for row in self._query(sql, params):
+            record = dict(zip(_COLUMNS, row))
+            record["settings"] = json.loads(record.pop("settings_json") or "{}")
+            records.append(record)
+        return records
+
+    def iter_records(self, session_id=None, batch_size=500, since_id=0):
+        """依寫入順序逐批讀取紀錄（以 id 分頁，不會一次載入全部，也不會長時間佔用讀取連線）"""
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM practice_records WHERE id > ?"
+        if session_id is not None:
+            sql += " AND session_id = ?"
+        sql += " ORDER BY id LIMIT ?"
+
+        last_id = since_id
+        while True:
+            params = [last_id] + ([session_id] if session_id is not None else []) + [batch_size]
+            rows = self._query(sql, params)
+            for row in rows:
+                record = dict(zip(_COLUMNS, row))
+                record["settings"] = json.loads(record.pop("settings_json") or "{}")
+                yield record
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def score_trend(self, group_by="scenario", bucket="day", session_id=None, since=None):
+        """依分組欄位與時間區間計算平均分數趨勢
+
+        Args:
+            group_by (str): scenario / difficulty / level / session_id
+            bucket (str): hour / day / week / month
+            session_id (str): 只統計指定工作階段
+            since (float): 只統計此時間戳之後的紀錄
+
+        Returns:
+            list: [{"group", "period", "count", "avg_pronunciation", "avg_fluency", "best_pronunciation"}, ...]
+        """
+        if group_by not in TREND_GROUPS:
+            raise ValueError(f"不支援的分組欄位: {group_by}")
+        if bucket not in TREND_BUCKETS:
+            raise ValueError(f"不支援的時間區間: {bucket}")
+
+        conditions = []
+        params = [TREND_BUCKETS[bucket]]
+        if session_id is not None:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self._query(f"""
+            SELECT {group_by}, strftime(?, timestamp, 'unixepoch', 'localtime') AS period,
+                   COUNT(*), AVG(pronunciation_score), AVG(fluency_score), MAX(pronunciation_score)
+            FROM practice_records {where}
+            GROUP BY {group_by}, period
+            ORDER BY {group_by}, period
+        """, params)
+
+        return [
+            {
+                "group": group,
+                "period": period,
+                "count": count,
+                "avg_pronunciation": round(avg_pronunciation, 1),
+                "avg_fluency": round(avg_fluency, 1),
+                "best_pronunciation": best
+            }
+            for group, period, count, avg_pronunciation, avg_fluency, best in rows
+        ]
+
+    def get_summary(self, session_id=None):
+        """整體練習統計"""
+        where, params = ("WHERE session_id = ?", (session_id,)) if session_id is not None else ("", ())
+        count, avg_pronunciation, avg_fluency, first, last = self._query(f"""
+            SELECT COUNT(*), AVG(pronunciation_score), AVG(fluency_score), MIN(timestamp), MAX(timestamp)
+            FROM practice_records {where}
+        """, params)[0]
+        return {
+            "count": count,
+            "avg_pronunciation": round(avg_pronunciation, 1) if count else 0.0,
+            "avg_fluency": round(avg_fluency, 1) if count else 0.0,
+            "first_practice": first,
+            "last_practice": last
+        }
+
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                "db_path": self.db_path,
+                "pending": self._queue.qsize(),
+                "written": self.written,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "write_errors": self.write_errors
+            }
+
+
+_progress_stores = SharedInstances(ProgressStore)
+
+
+def get_progress_store(db_path=DEFAULT_DB_PATH, **kwargs):
+    """獲取學習進度儲存區實例（同一資料庫檔案共用一個背景寫入器）"""
+    return _progress_stores.get(os.path.abspath(db_path), db_path=db_path, **kwargs)
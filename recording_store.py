@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+recording_store.py - 錄音保存與清理
+需要保留的錄音排入背景執行緒寫檔，請求處理中不做檔案 I/O；
+同一執行緒定期依保存天數與總容量刪除舊檔（含暫存資料夾），磁碟用量有上限
+"""
+
+import os
+import time
+import queue
+import wave
+import threading
+import numpy as np
+
+from acoustic_scoring import SAMPLE_RATE
+from shared_instances import SharedInstances
+
+DEFAULT_RECORDING_DIR = "user_recordings"
+
+
+def directory_usage(directories):
+    """回傳資料夾內所有檔案 [(修改時間, 大小, 路徑), ...]，依時間由舊到新排序"""
+    files = []
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+    return files
+
+
+class RecordingStore:
+    """保留練習錄音（背景寫入 16-bit WAV），並依容量與天數自動清理"""
+
+    def __init__(self, directory=DEFAULT_RECORDING_DIR, max_bytes=2 * 1024 ** 3, max_age_days=14,
+                 sweep_dirs=(), sweep_interval=600, max_pending=256, enabled=True):
+        """
+        Args:
+            directory (str): 錄音保存資料夾
+            max_bytes (int): 所有受管理資料夾的總容量上限，超過時由最舊的檔案開始刪除
+            max_age_days (float): 檔案保存天數
+            sweep_dirs (tuple): 一併清理的其他資料夾（例如暫存音檔）
+            sweep_interval (float): 清理間隔（秒）
+            max_pending (int): 等待寫入的錄音上限，超過時不保存新的錄音
+            enabled (bool): 關閉時不保存錄音（仍會清理）
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_days * 86400
+        self.sweep_dirs = tuple(sweep_dirs)
+        self.sweep_interval = sweep_interval
+        self.enabled = enabled
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._counter = 0
+        self.saved = 0
+        self.dropped = 0
+        self.deleted = 0
+        self.deleted_bytes = 0
+        self.managed_bytes = 0
+        self.last_sweep = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="recording-store", daemon=True)
+        self._thread.start()
+
+    def save(self, waveform, session_id=None, sr=SAMPLE_RATE):
+        """排入背景保存，立即回傳之後的檔案路徑；未保存時回傳None"""
+        if not self.enabled or waveform is None or len(waveform) == 0:
+            return None
+
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        prefix = "".join(c for c in (session_id or "anonymous")[:12] if c.isalnum() or c in "-_")
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d_%H%M%S')}_{prefix}_{counter:05d}.wav")
+
+        try:
+            self._queue.put_nowait((path, waveform, sr))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def _write(self, path, waveform, sr):
+        pcm = (np.clip(np.asarray(waveform, dtype=np.float32), -1, 1) * 32767).astype(np.int16)
+        with wave.open(path, "w") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sr)
+            wav_file.writeframes(pcm.tobytes())
+
+    def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            timeout = max(0.0, next_sweep - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is None:
+                self.sweep()
+                next_sweep = time.monotonic() + self.sweep_interval
+                continue
+
+            path, waveform, sr = item
+            try:
+                self._write(path, waveform, sr)
+                self.saved += 1
+            except Exception as e:
+                print(f"⚠️  保存錄音失敗 {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def sweep(self):
+        """刪除過期檔案，再由最舊的檔案開始刪除直到總容量低於上限"""
+        now = time.time()
+        files = directory_usage((self.directory,) + self.sweep_dirs)
+        total = sum(size for _, size, _ in files)
+
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.deleted += 1
+            self.deleted_bytes += size
+
+        self.managed_bytes = total
+        self.last_sweep = now
+        return total
+
+    def flush(self):
+        """等待所有排入的錄音寫入完成"""
+        self._queue.join()
+
+    def get_stats(self):
+        return {
+            "enabled": self.enabled,
+            "saved": self.saved,
+            "pending": self._queue.qsize(),
+            "dropped": self.dropped,
+            "deleted": self.deleted,
+            "deleted_mb": self.deleted_bytes / 1024 ** 2,
+            "managed_mb": self.managed_bytes / 1024 ** 2,
+            "max_mb": self.max_bytes / 1024 ** 2
+        }
+
+
+_recording_stores = SharedInstances(RecordingStore)
+
+
+def get_recording_store(directory=DEFAULT_RECORDING_DIR, **kwargs):
+    """獲取錄音保存區實例（同一資料夾共用一個寫入與清理執行緒）"""
+    return _recording_stores.get(os.path.abspath(directory), directory=directory, **kwargs)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+response_parser.py - Qwen2-Audio 回應的增量解析器
+在生成過程中逐段解析回應，即時發出分數、分析、回應與建議事件
+"""
+
+import re
+from collections import namedtuple
+
+EVENT_SCORE = "score"
+EVENT_ANALYSIS_DELTA = "analysis_delta"
+EVENT_RESPONSE_DELTA = "response_delta"
+EVENT_SUGGESTION = "suggestion"
+
+ParseEvent = namedtuple("ParseEvent", ["type", "data"])
+
+# 依原本的判斷順序：分析 > 回應 > 建議
+_SECTION_PATTERNS = (
+    (re.compile(r"PRONUNCIATION ANALYSIS:"), "analysis"),
+    (re.compile(r"CONVERSATION RESPONSE:"), "response"),
+    (re.compile(r"SUGGESTED NEXT RESPONSES:"), "suggestions"),
+)
+_SCORE_LABEL_RE = re.compile(r"score:", re.IGNORECASE)
+_NUMBER_RE = re.compile(r"\d+")
+_SUGGESTION_PREFIX_RE = re.compile(r"^(?:[123]\.|[\-•])\s*")
+_PLACEHOLDER_RE = re.compile(r"\[.*?\]")
+_WORD_CHAR_RE = re.compile(r"\w")
+_SUGGESTION_STARTS = ("1.", "2.", "3.", "-", "•")
+
+
+class StreamingResponseParser:
+    """增量解析器 - 逐塊接收生成的文字，以完整行為單位解析並發出事件"""
+
+    def __init__(self):
+        self._buffer = ""
+        self.current_section = ""
+        self.pronunciation_score = None
+        self.analysis_lines = []
+        self.response_parts = []
+        self.suggestions = []
+        self.finished = False
+
+    def feed(self, chunk):
+        """接收一段新生成的文字，回傳本次產生的事件列表"""
+        if not chunk:
+            return []
+
+        self._buffer += chunk
+        if "\n" not in self._buffer:
+            return []
+
+        *lines, self._buffer = self._buffer.split("\n")
+        events = []
+        for line in lines:
+            events.extend(self._consume_line(line))
+        return events
+
+    def finish(self):
+        """生成結束時呼叫，處理最後一行未換行的文字"""
+        if self.finished:
+            return []
+
+        self.finished = True
+        remaining, self._buffer = self._buffer, ""
+        return self._consume_line(remaining)
+
+    def _consume_line(self, line):
+        line = line.strip()
+        if not line:
+            return []
+
+        for pattern, section in _SECTION_PATTERNS:
+            if pattern.search(line):
+                self.current_section = section
+                return []
+
+        events = []
+        if self.current_section == "analysis":
+            if _SCORE_LABEL_RE.search(line):
+                number = _NUMBER_RE.search(line)
+                if number:
+                    score = int(number.group())
+                    if 0 <= score <= 100:
+                        self.pronunciation_score = score
+                        events.append(ParseEvent(EVENT_SCORE, score))
+            self.analysis_lines.append(line)
+            events.append(ParseEvent(EVENT_ANALYSIS_DELTA, line + "\n"))
+
+        elif self.current_section == "response":
+            if not line.startswith("**") and not line.startswith("SUGGESTED"):
+                self.response_parts.append(line)
+                events.append(ParseEvent(EVENT_RESPONSE_DELTA, line + " "))
+
+        elif self.current_section == "suggestions":
+            if line.startswith(_SUGGESTION_STARTS):
+                suggestion = _SUGGESTION_PREFIX_RE.sub("", line)
+                suggestion = _PLACEHOLDER_RE.sub("", suggestion).strip()
+                # 只有預留位置的建議（例如 "1. [your answer]."）移除後只剩標點，不算建議
+                if _WORD_CHAR_RE.search(suggestion):
+                    self.suggestions.append(suggestion)
+                    events.append(ParseEvent(EVENT_SUGGESTION, suggestion))
+
+        return events
+
+    @property
+    def pronunciation_analysis(self):
+        return "".join(line + "\n" for line in self.analysis_lines)
+
+    @property
+    def response_text(self):
+        return "".join(part + " " for part in self.response_parts)
+
+
+def parse_response(text):
+    """一次解析完整回應文字"""
+    parser = StreamingResponseParser()
+    parser.feed(text)
+    parser.finish()
+    return parser
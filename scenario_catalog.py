@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+scenario_catalog.py - 場景目錄
+從 scenarios/*.json 載入場景、角色設定、各級別回應與建議回覆，建立唯讀索引；
+檔案變更時自動重新載入，新增內容不需重新啟動載有模型的程序
+"""
+
+import os
+import json
+import time
+import threading
+from types import MappingProxyType
+
+CATALOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+SETTINGS_FILE = "_catalog.json"
+LEVELS = ("beginner", "elementary", "intermediate", "upper_intermediate", "advanced")
+
+# role_prompt 模板可使用的欄位
+ROLE_PROMPT_FIELDS = ("level", "toeic_range", "vocab_level", "sentence_complexity")
+
+
+def _freeze(value):
+    """遞迴轉為唯讀結構（dict -> MappingProxyType, list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class ScenarioIndex:
+    """某一版本場景資料的唯讀索引，所有查詢皆為 O(1)"""
+
+    def __init__(self, scenarios, settings, version, signature):
+        self.version = version
+        self.signature = signature
+
+        fallback_scenario = settings["fallback_scenario"]
+        fallback_level = settings["fallback_level"]
+        default_responses = tuple(settings["default_responses"])
+        default_suggestions = tuple(settings["default_suggestions"])
+
+        by_name = {scenario["name"]: scenario for scenario in scenarios}
+        if fallback_scenario not in by_name:
+            raise ValueError(f"找不到預設場景: {fallback_scenario}")
+
+        self.names = tuple(sorted(by_name, key=lambda name: (by_name[name].get("order", 999), name)))
+        self.fallback_scenario = fallback_scenario
+
+        self.examples = tuple(
+            _freeze(dict(by_name[name]["example"], scenario=name))
+            for name in self.names if "example" in by_name[name]
+        )
+        self.presets = _freeze({name: by_name[name]["preset"] for name in self.names if "preset" in by_name[name]})
+        self._role_prompts = {name: by_name[name]["role_prompt"] for name in self.names}
+
+        # 沒有任何場景提供的級別改用 fallback_level 的內容；
+        # 場景缺少該級別時使用預設場景的同級別內容，再缺少則使用通用回應
+        levels_with_responses = {level for s in scenarios for level in s.get("responses", {})}
+        fallback_responses = by_name[fallback_scenario].get("responses", {})
+        self._responses = {}
+        self._own_responses = set()
+        self._fallback_responses = {}
+        for level in LEVELS:
+            table_level = level if level in levels_with_responses else fallback_level
+            fallback = tuple(fallback_responses.get(table_level, default_responses))
+            self._fallback_responses[level] = fallback
+            for name in self.names:
+                responses = by_name[name].get("responses", {}).get(table_level)
+                self._responses[(name, level)] = tuple(responses) if responses else fallback
+                if responses:
+                    self._own_responses.add((name, level))
+
+        self._suggestions = {}
+        for name in self.names:
+            for level, suggestions in by_name[name].get("suggestions", {}).items():
+                self._suggestions[(name, level)] = tuple(suggestions)
+        self._default_suggestions = default_suggestions
+        self._fallback_level = fallback_level
+
+    def __contains__(self, scenario):
+        return scenario in self._role_prompts
+
+    def responses(self, scenario, level):
+        """助教回應候選（簡化模式使用）"""
+        responses = self._responses.get((scenario, level))
+        if responses is None:
+            responses = self._fallback_responses.get(level, self._fallback_responses[self._fallback_level])
+        return responses
+
+    def has_responses(self, scenario, level):
+        """場景是否有自己的回應候選（自由對話等自訂場景沒有，只能套用通用回應）"""
+        return (scenario, level) in self._own_responses
+
+    def suggestions(self, scenario, level):
+        """建議學習者使用的回覆"""
+        return self._suggestions.get((scenario, level), self._default_suggestions)
+
+    def role_prompt(self, scenario, difficulty_config):
+        """依難度設定渲染場景角色說明"""
+        template = self._role_prompts.get(scenario, self._role_prompts[self.fallback_scenario])
+        return template.format(
+            level=difficulty_config["level"],
+            toeic_range=difficulty_config["toeic_range"],
+            vocab_level=difficulty_config["vocabulary_level"],
+            sentence_complexity=difficulty_config["sentence_complexity"]
+        )
+
+
+def _validate_scenario(path, scenario):
+    for field in ("id", "name", "role_prompt"):
+        if not scenario.get(field):
+            raise ValueError(f"{os.path.basename(path)} 缺少欄位: {field}")
+    try:
+        scenario["role_prompt"].format(**{field: "" for field in ROLE_PROMPT_FIELDS})
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"{os.path.basename(path)} 的 role_prompt 模板無效: {e}")
+    for section in ("responses", "suggestions"):
+        for level in scenario.get(section, {}):
+            if level not in LEVELS:
+                raise ValueError(f"{os.path.basename(path)} 的 {section} 含有未知級別: {level}")
+    preset = scenario.get("preset")
+    if preset is not None and ("roles" not in preset or "sample_dialog" not in preset):
+        raise ValueError(f"{os.path.basename(path)} 的 preset 需包含 roles 與 sample_dialog")
+
+
+class ScenarioCatalog:
+    """場景目錄 - 提供目前的索引，並在檔案變更時重新載入"""
+
+    def __init__(self, directory=CATALOG_DIR, check_interval=2.0):
+        """
+        Args:
+            directory (str): 場景資料夾
+            check_interval (float): 兩次檢查檔案變更之間的最短間隔（秒）
+        """
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = 0
+        self._index = self._load(self._signature())
+        self._last_check = time.monotonic()
+
+    def _signature(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+        return tuple(sorted(entries))
+
+    def _load(self, signature):
+        settings = None
+        scenarios = []
+        names = set()
+        for file_name, _, _ in signature:
+            path = os.path.join(self.directory, file_name)
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if file_name == SETTINGS_FILE:
+                settings = data
+                continue
+            _validate_scenario(path, data)
+            if data["name"] in names:
+                raise ValueError(f"場景名稱重複: {data['name']}")
+            names.add(data["name"])
+            scenarios.append(data)
+
+        if settings is None:
+            raise ValueError(f"找不到場景目錄設定檔: {SETTINGS_FILE}")
+
+        self._version += 1
+        return ScenarioIndex(scenarios, settings, self._version, signature)
+
+    def maybe_reload(self):
+        """檔案有變更時重新載入；載入失敗時保留原本的索引"""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return False
+
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return False
+            self._last_check = now
+
+            try:
+                signature = self._signature()
+                if signature == self._index.signature:
+                    return False
+                index = self._load(signature)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"⚠️  場景目錄重新載入失敗，繼續使用版本 {self._index.version}: {e}")
+                return False
+
+            self._index = index
+            print(f"🔄 場景目錄已重新載入（版本 {index.version}，{len(index.names)} 個場景）")
+            return True
+
+    @property
+    def index(self):
+        self.maybe_reload()
+        return self._index
+
+
+scenario_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_scenario_catalog():
+    """獲取場景目錄實例"""
+    global scenario_catalog
+    if scenario_catalog is None:
+        with _catalog_lock:
+            if scenario_catalog is None:
+                scenario_catalog = ScenarioCatalog()
+    return scenario_catalog
+
+
+def get_scenario_index():
+    """取得目前版本的場景索引（必要時先重新載入）"""
+    return get_scenario_catalog().index
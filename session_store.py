@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+session_store.py - 每個使用者工作階段的對話狀態
+以 Gradio session 為鍵保存對話歷史與目前設定，閒置過久的工作階段會自動移除
+"""
+
+import re
+import hashlib
+import threading
+import time
+import datetime
+from collections import OrderedDict, deque
+
+DEFAULT_SESSION_ID = "default"
+DEFAULT_SCENARIO = "機場對話 (Airport Conversation)"
+DEFAULT_LANGUAGE = "英文 (English)"
+DEFAULT_DIFFICULTY = "初級 (TOEIC 405-600分)"
+# 學習紀錄金鑰：瀏覽器產生的 128 位元以上隨機值（十六進位）。金鑰本身就是憑證，
+# 只有知道金鑰的人能看到對應的學習紀錄，因此不接受可猜測的名稱
+LEARNER_KEY_PATTERN = re.compile(r"^[0-9a-f]{32,128}$")
+LEARNER_ID_PREFIX = "learner-"
+
+
+def learner_id_from_key(learner_key):
+    """由學習紀錄金鑰推得學習者代號（資料庫與匯出使用），伺服器不保存金鑰本身；金鑰不合法時拋出 ValueError"""
+    learner_key = (learner_key or "").strip().lower()
+    if not LEARNER_KEY_PATTERN.match(learner_key):
+        raise ValueError("學習紀錄金鑰須為至少 32 個十六進位字元（由瀏覽器自動產生）")
+    return LEARNER_ID_PREFIX + hashlib.sha256(learner_key.encode("ascii")).hexdigest()[:24]
+
+
+class SessionState:
+    """單一工作階段的狀態：有上限的對話歷史與目前的場景/語言/難度"""
+
+    def __init__(self, session_id, max_history=10):
+        self.session_id = session_id
+        self.history = deque(maxlen=max_history)
+        self.scenario = DEFAULT_SCENARIO
+        self.language = DEFAULT_LANGUAGE
+        self.difficulty = DEFAULT_DIFFICULTY
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.lock = threading.RLock()
+
+    def add_entry(self, scenario, user_text, assistant_text):
+        entry = {
+            "timestamp": datetime.datetime.now(),
+            "scenario": scenario,
+            "user": user_text,
+            "assistant": assistant_text
+        }
+        with self.lock:
+            self.history.append(entry)
+        return entry
+
+    def get_history(self):
+        with self.lock:
+            return list(self.history)
+
+    def clear_history(self):
+        with self.lock:
+            self.history.clear()
+
+    def update_settings(self, scenario=None, language=None, difficulty=None):
+        with self.lock:
+            if scenario is not None:
+                self.scenario = scenario
+            if language is not None:
+                self.language = language
+            if difficulty is not None:
+                self.difficulty = difficulty
+
+
+class SessionStore:
+    """工作階段儲存區 - 執行緒安全、LRU上限與閒置逾時淘汰"""
+
+    def __init__(self, max_history=10, ttl_seconds=3600, max_sessions=1000, sweep_interval=60):
+        """
+        Args:
+            max_history (int): 每個工作階段保留的對話筆數
+            ttl_seconds (int): 閒置超過此秒數的工作階段會被移除
+            max_sessions (int): 同時保留的工作階段上限，超過時移除最久未使用者
+            sweep_interval (int): 兩次逾時掃描之間的最短間隔（秒）
+        """
+        self.max_history = max_history
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.evicted = 0
+
+    def get(self, session_id=None):
+        """取得工作階段，不存在時建立"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.time()
+
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep_locked(now)
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SessionState(session_id, self.max_history)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.last_access = now
+            return session
+
+    def remove(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def sweep(self):
+        """立即移除所有閒置逾時的工作階段"""
+        with self._lock:
+            return self._sweep_locked(time.time())
+
+    def _sweep_locked(self, now):
+        self._last_sweep = now
+        expired = [sid for sid, session in self._sessions.items()
+                   if now - session.last_access > self.ttl_seconds]
+        for session_id in expired:
+            del self._sessions[session_id]
+        self.evicted += len(expired)
+        return len(expired)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evicted": self.evicted,
+                "ttl_seconds": self.ttl_seconds
+            }
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+shared_instances.py - 依鍵值共用的元件實例
+模型管理器、學習進度資料庫、錄音保存區等元件在同一程序中依鍵值（例如資料庫路徑）共用；
+每個鍵值各有建立鎖，多個執行緒同時第一次取用時只會建立一個實例，
+建立中（例如載入模型）只有取用同一鍵值的呼叫端需要等待；
+要求的設定與已建立的實例不同時拋出 ValueError，不會默默沿用舊設定
+"""
+
+import inspect
+import threading
+
+
+class SharedInstances:
+    """以鍵值保存共用實例的登錄表"""
+
+    def __init__(self, factory):
+        """
+        Args:
+            factory: 建立實例的類別或函式，以關鍵字參數傳入設定
+        """
+        self.factory = factory
+        self._signature = inspect.signature(factory)
+        self._instances = {}
+        self._creating = {}           # 鍵值 -> 建立鎖（建立完成後移除）
+        self._lock = threading.Lock()
+
+    def get(self, key=None, **settings):
+        """取得鍵值對應的實例，不存在時以 settings 建立
+
+        已存在時，呼叫端明確指定的每個設定都必須與實例建立時的設定（含預設值）相同
+        """
+        with self._lock:
+            entry = self._instances.get(key)
+            if entry is None:
+                create_lock = self._creating.setdefault(key, threading.Lock())
+        if entry is None:
+            entry = self._create(key, create_lock, settings)
+        instance, effective = entry
+
+        conflicts = [
+            f"{name}={value!r}（現有: {effective.get(name)!r}）"
+            for name, value in settings.items() if effective.get(name) != value
+        ]
+        if conflicts:
+            raise ValueError(f"{getattr(self.factory, '__name__', self.factory)} 已以不同設定建立: {', '.join(conflicts)}")
+        return instance
+
+    def _create(self, key, create_lock, settings):
+        """在鍵值的建立鎖內建立實例（不持有登錄表的鎖）；建立失敗時下一個呼叫端重試"""
+        with create_lock:
+            with self._lock:
+                entry = self._instances.get(key)
+            if entry is not None:
+                return entry
+
+            bound = self._signature.bind_partial(**settings)
+            bound.apply_defaults()
+            entry = (self.factory(**settings), dict(bound.arguments))
+            with self._lock:
+                self._instances[key] = entry
+                self._creating.pop(key, None)
+            return entry
+
+    def peek(self, key=None):
+        """已建立的實例；尚未建立時回傳None"""
+        entry = self._instances.get(key)
+        return entry[0] if entry is not None else None
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+stage_limiter.py - 模型階段的並行上限
+不論請求來自 Gradio、非同步流程或批次評估，同一模型階段同時執行的呼叫數都不超過設定值，
+突發流量時在此排隊等待，GPU記憶體用量維持可預期
+"""
+
+import time
+import inspect
+import functools
+import threading
+from contextlib import contextmanager
+
+from tracing import get_tracer
+
+DEFAULT_STAGE_CONCURRENCY = {
+    "asr": 1,
+    "audio_llm": 1
+}
+
+
+class StageLimiter:
+    """單一模型階段的計數號誌，並統計排隊與執行狀況"""
+
+    def __init__(self, name, limit=1):
+        """
+        Args:
+            name (str): 階段名稱
+            limit (int): 同時執行的呼叫上限
+        """
+        self.name = name
+        self.limit = max(1, int(limit))
+        self._semaphore = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.max_waiting = 0
+        self.total_wait = 0.0
+
+    @contextmanager
+    def acquire(self):
+        """取得執行名額；名額用完時排隊等待"""
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        start = time.perf_counter()
+        self._semaphore.acquire()
+        wait = time.perf_counter() - start
+
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+            self.total_wait += wait
+        get_tracer().set_attribute(f"{self.name}_queue_wait_ms", round(wait * 1000, 3))
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+            self._semaphore.release()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "completed": self.completed,
+                "avg_wait_ms": self.total_wait / self.completed * 1000 if self.completed else 0.0
+            }
+
+
+def create_stage_limiters(stage_concurrency=None):
+    """依設定建立各階段的限制器，未指定的階段使用預設值"""
+    limits = dict(DEFAULT_STAGE_CONCURRENCY)
+    limits.update(stage_concurrency or {})
+    return {name: StageLimiter(name, limit) for name, limit in limits.items()}
+
+
+def stage_limited(stage):
+    """方法裝飾器：以 self.stage_limiters[stage] 限制並行數；產生器會在整個串流期間佔用名額"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def generator_wrapper(self, *args, **kwargs):
+                with self.stage_limiters[stage].acquire():
+                    yield from fn(self, *args, **kwargs)
+            return generator_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with self.stage_limiters[stage].acquire():
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
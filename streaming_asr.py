@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+streaming_asr.py - 邊說邊辨識的串流語音識別
+接收麥克風串流的音頻片段，以能量 VAD 偵測語句內的停頓與語句結束：
+- 說話中定期辨識尚未確定的尾段（最多最近幾秒），即時顯示部分結果；語音辨識階段有人排隊時略過
+- 語句內出現停頓時先確定停頓之前的段落（含逐字時間），之後不再重新辨識
+- 偵測到語句結束時只需辨識最後一段，合併後即為完整的辨識結果
+
+音頻以麥克風的原始取樣率累積，VAD 也直接在原始取樣率上判斷；只有送去辨識的段落與最後的完整錄音
+各自一次重新取樣為 16kHz，不會逐片段重新取樣而在每個片段邊界產生濾波器的邊緣失真
+"""
+
+import time
+import threading
+import numpy as np
+
+from acoustic_scoring import SAMPLE_RATE, EPS, to_mono_float
+from tracing import get_tracer
+
+VAD_FRAME_SECONDS = 0.03
+SPEECH_THRESHOLD_DB = 12      # 高於噪音底多少 dB 視為說話
+MIN_SPEECH_DB = -50           # 絕對音量下限，避免安靜環境中的微小噪音被當成說話
+NOISE_ADAPT_RATE = 0.05       # 非說話幀更新噪音底的速度
+# 學習者思考時的停頓常超過 0.7 秒（fluency_analysis 視為猶豫），語句結束的靜音需明顯更長
+DEFAULT_ENDPOINT_SILENCE = 1.2
+MAX_PARTIAL_SECONDS = 6.0     # 部分結果只辨識尾段最近的幾秒，成本不隨未停頓的說話長度增加
+
+
+def merge_transcriptions(parts):
+    """合併依序辨識的段落 [(起始秒數, 辨識結果), ...]，時間軸換算為整段錄音的時間"""
+    texts = []
+    segments = []
+    words = []
+    language = None
+    for offset, transcription in parts:
+        if not transcription or not transcription.get("text"):
+            continue
+        texts.append(transcription["text"])
+        language = language or transcription.get("language")
+        for segment in transcription.get("segments", []):
+            segments.append(dict(segment, start=segment["start"] + offset, end=segment["end"] + offset))
+        for word in transcription.get("words", []):
+            words.append(dict(word, start=word["start"] + offset, end=word["end"] + offset))
+    return {
+        "text": " ".join(texts).strip(),
+        "language": language,
+        "segments": segments,
+        "words": words
+    }
+
+
+class EnergyVAD:
+    """以幀能量與自適應噪音底判斷說話 / 靜音"""
+
+    def __init__(self, sr=SAMPLE_RATE, frame_seconds=VAD_FRAME_SECONDS, threshold_db=SPEECH_THRESHOLD_DB):
+        self.frame_length = int(sr * frame_seconds)
+        self.threshold_db = threshold_db
+        self.noise_floor = None
+        self._remainder = np.zeros(0, dtype=np.float32)
+
+    def process(self, audio):
+        """回傳新片段中每個完整幀是否為說話的布林陣列"""
+        audio = np.concatenate([self._remainder, audio]) if len(self._remainder) else audio
+        frame_count = len(audio) // self.frame_length
+        self._remainder = audio[frame_count * self.frame_length:]
+        if frame_count == 0:
+            return np.zeros(0, dtype=bool)
+
+        frames = audio[:frame_count * self.frame_length].reshape(frame_count, self.frame_length)
+        db = 20 * np.log10(np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1)) + EPS)
+
+        decisions = np.zeros(frame_count, dtype=bool)
+        for i, frame_db in enumerate(db):
+            if self.noise_floor is None:
+                self.noise_floor = frame_db
+            is_speech = frame_db > max(self.noise_floor + self.threshold_db, MIN_SPEECH_DB)
+            if not is_speech:
+                self.noise_floor += NOISE_ADAPT_RATE * (frame_db - self.noise_floor)
+            elif frame_db < self.noise_floor:
+                self.noise_floor = frame_db
+            decisions[i] = is_speech
+        return decisions
+
+
+class StreamingTranscriber:
+    """單次錄音的串流辨識狀態；每個使用者的每次錄音各自建立一個"""
+
+    def __init__(self, model_manager, language="en", endpoint_silence=DEFAULT_ENDPOINT_SILENCE, commit_pause=0.3,
+                 min_commit_seconds=1.5, partial_interval=0.8, max_partial_seconds=MAX_PARTIAL_SECONDS,
+                 max_seconds=30.0):
+        """
+        Args:
+            model_manager: 提供 transcribe_audio 的模型管理器
+            language (str): 辨識語言
+            endpoint_silence (float): 說話後的靜音達到此秒數即判定語句結束
+            commit_pause (float): 語句內停頓達到此秒數時確定停頓前的段落
+            min_commit_seconds (float): 尚未確定的段落至少需有此長度才提前確定
+            partial_interval (float): 至少累積多少秒新音頻才更新一次部分結果
+            max_partial_seconds (float): 部分結果最多辨識尾段最近的秒數
+            max_seconds (float): 錄音長度上限，超過時直接結束
+        """
+        self.model_manager = model_manager
+        self.language = language
+        self.endpoint_silence = endpoint_silence
+        self.commit_pause = commit_pause
+        self.min_commit_seconds = min_commit_seconds
+        self.partial_interval = partial_interval
+        self.max_partial_seconds = max_partial_seconds
+        self.max_seconds = max_seconds
+
+        # 第一個片段到達時依麥克風取樣率建立
+        self.sample_rate = None
+        self.vad = None
+        self._chunks = []
+        self._audio = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+
+        self.total_frames = 0
+        self.speech_started = False
+        self.speech_end_frame = 0
+        self.silence_frames = 0
+        self.commit_sample = 0
+        self.committed = []
+        self.partial_text = ""
+        self._last_partial_sample = 0
+        self.skipped_partials = 0
+
+        self.ended = False
+        self.result = None
+        self.endpoint_at = None
+        self.finalize_seconds = None
+
+    @property
+    def frame_length(self):
+        return self.vad.frame_length if self.vad is not None else 0
+
+    @property
+    def duration(self):
+        return self.total_frames * self.frame_length / self.sample_rate if self.sample_rate else 0.0
+
+    def _audio_until(self, end_sample):
+        if self._chunks:
+            self._audio = np.concatenate([self._audio] + self._chunks)
+            self._chunks = []
+        return self._audio[:end_sample]
+
+    def _to_model_rate(self, audio):
+        """將累積的原始取樣率段落一次重新取樣為 16kHz"""
+        return to_mono_float(self.sample_rate, audio)
+
+    def _transcribe(self, audio, details):
+        if len(audio) < int(0.1 * self.sample_rate):
+            return None
+        return self.model_manager.transcribe_audio(self._to_model_rate(audio), language=self.language,
+                                                   return_details=details)
+
+    def committed_text(self):
+        return " ".join(t["text"] for _, t in self.committed if t and t.get("text")).strip()
+
+    def display_text(self):
+        """目前可顯示的辨識文字（已確定的段落 + 尾段的部分結果）"""
+        return " ".join(part for part in (self.committed_text(), self.partial_text) if part)
+
+    def feed(self, sample_rate, data):
+        """接收一段串流音頻；回傳 True 表示已偵測到語句結束並完成辨識"""
+        with self._lock:
+            if self.ended:
+                return True
+
+            if self.sample_rate is None:
+                self.sample_rate = sample_rate
+                self.vad = EnergyVAD(sr=sample_rate)
+            # 只轉為單聲道浮點；取樣率與第一個片段不同時才轉到第一個片段的取樣率
+            audio = to_mono_float(sample_rate, data, target_rate=self.sample_rate)
+            self._chunks.append(audio)
+            decisions = self.vad.process(audio)
+
+            for is_speech in decisions:
+                self.total_frames += 1
+                if is_speech:
+                    self.speech_started = True
+                    self.speech_end_frame = self.total_frames
+                    self.silence_frames = 0
+                elif self.speech_started:
+                    self.silence_frames += 1
+
+            silence = self.silence_frames * self.frame_length / self.sample_rate
+            if self.speech_started and silence >= self.endpoint_silence:
+                self._finalize(endpoint=True)
+                return True
+            if self.duration >= self.max_seconds:
+                self._finalize(endpoint=True)
+                return True
+
+            current_sample = self.total_frames * self.frame_length
+            if self.speech_started and silence >= self.commit_pause:
+                self._maybe_commit()
+            elif self.speech_started and current_sample - self._last_partial_sample >= self.partial_interval * self.sample_rate:
+                self._update_partial(current_sample)
+            return False
+
+    def _maybe_commit(self):
+        """語句內停頓：確定停頓中點之前的段落"""
+        pause_middle = (self.speech_end_frame + self.silence_frames // 2) * self.frame_length
+        if (pause_middle - self.commit_sample) < self.min_commit_seconds * self.sample_rate:
+            return
+
+        with get_tracer().span("streaming_asr.commit", seconds=(pause_middle - self.commit_sample) / self.sample_rate):
+            audio = self._audio_until(pause_middle)[self.commit_sample:]
+            transcription = self._transcribe(audio, details=True)
+        if transcription and transcription.get("text"):
+            self.committed.append((self.commit_sample / self.sample_rate, transcription))
+        self.commit_sample = pause_middle
+        self.partial_text = ""
+        self._last_partial_sample = pause_middle
+
+    def _asr_busy(self):
+        """語音辨識階段是否已滿或有人排隊（部分結果只是預覽，不與最終辨識搶名額）"""
+        limiter = getattr(self.model_manager, "stage_limiters", {}).get("asr")
+        return limiter is not None and (limiter.waiting > 0 or limiter.active >= limiter.limit)
+
+    def _update_partial(self, current_sample):
+        if self._asr_busy():
+            self.skipped_partials += 1
+            return
+        start_sample = max(self.commit_sample, current_sample - int(self.max_partial_seconds * self.sample_rate))
+        with get_tracer().span("streaming_asr.partial", seconds=(current_sample - start_sample) / self.sample_rate):
+            audio = self._audio_until(current_sample)[start_sample:]
+            text = (self._transcribe(audio, details=False) or "").strip()
+        # 尾段超過視窗時只顯示最近的部分
+        self.partial_text = f"… {text}" if text and start_sample > self.commit_sample else text
+        self._last_partial_sample = current_sample
+
+    def _finalize(self, endpoint):
+        start = time.perf_counter()
+        self.ended = True
+        if endpoint:
+            self.endpoint_at = time.time()
+
+        # 保留語句結束後一小段靜音，避免截斷最後一個字
+        end_sample = min(
+            (self.speech_end_frame + int(0.2 / VAD_FRAME_SECONDS)) * self.frame_length,
+            self.total_frames * self.frame_length
+        )
+        audio = self._audio_until(self.total_frames * self.frame_length)
+
+        with get_tracer().span("streaming_asr.finalize", committed_segments=len(self.committed)):
+            parts = list(self.committed)
+            if self.speech_started and end_sample > self.commit_sample:
+                tail = self._transcribe(audio[self.commit_sample:end_sample], details=True)
+                parts.append((self.commit_sample / self.sample_rate, tail))
+            transcription = merge_transcriptions(parts)
+
+        # 完整錄音以波形交給後續分析，不寫入暫存檔
+        waveform = self._to_model_rate(audio[:max(end_sample, 0)]) if self.speech_started else None
+        self.partial_text = ""
+        self.result = (waveform, transcription if transcription["text"] else None)
+        self.finalize_seconds = time.perf_counter() - start
+        return self.result
+
+    def finish(self):
+        """錄音停止時呼叫；尚未偵測到語句結束時以目前的音頻完成辨識，回傳 (16kHz 波形, 辨識結果)"""
+        with self._lock:
+            if not self.ended:
+                self._finalize(endpoint=False)
+            return self.result
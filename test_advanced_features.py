@@ -9,12 +9,23 @@ import os
 import tempfile
 import wave
 import struct
+import json
 import numpy as np
 from datetime import datetime
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from processors import get_conversation_manager, create_advanced_prompt, DIFFICULTY_CONFIGS
+from processors import get_conversation_manager, create_advanced_prompt, DIFFICULTY_CONFIGS, PromptCompiler
+from acoustic_scoring import extract_acoustic_features, score_pronunciation, score_fluency, to_mono_float
+from progress_store import ProgressStore
+from progress_analytics import ProgressAnalytics
+from history_export import HistoryExporter, available_formats
+from streaming_asr import StreamingTranscriber
+from recording_store import RecordingStore
+from shared_instances import SharedInstances
+from analysis_gate import AnalysisGate
+from batch_evaluate import load_manifest, ResultWriter
+from scenario_catalog import get_scenario_index
 
 def create_test_audio_file(duration=2, frequency=440, sample_rate=44100):
     """創建測試用音頻文件"""
@@ -102,6 +113,918 @@ def test_prompt_generation():
         print(f"  📄 Prompt 預覽:")
         print(f"    {prompt[:200]}...")
 
+def test_prompt_cache():
+    """測試 System Prompt 編譯快取"""
+    print("\n🧪 測試 System Prompt 編譯快取...")
+    
+    compiler = PromptCompiler(max_entries=2)
+    settings = ("機場對話 (Airport Conversation)", "中級 (TOEIC 605-780分)", ["語調", "子音發音"], "美式英文", "詳細回饋")
+    
+    first = compiler.compile(*settings)
+    reordered = compiler.compile(settings[0], settings[1], ["子音發音", "語調"], settings[3], settings[4])
+    assert first is reordered
+    print("  ✅ 發音重點順序不同仍命中同一快取")
+    
+    tokenize_calls = []
+    fake_tokenize = lambda text: tokenize_calls.append(text) or list(range(len(text.split())))
+    token_ids = compiler.get_prefix_token_ids(first, fake_tokenize)
+    assert compiler.get_prefix_token_ids(first, fake_tokenize) == token_ids
+    assert len(tokenize_calls) == 1
+    print("  ✅ token IDs 只計算一次")
+    
+    compiler.compile(settings[0], "高級 (TOEIC 905+分)", None, "英式英文", "基本回饋")
+    compiler.compile(settings[0], "初學者 (TOEIC 250-400分)", None, "英式英文", "基本回饋")
+    stats = compiler.get_stats()
+    assert stats["entries"] == 2
+    # 最久未使用的設定已被移除，再次編譯會產生新的結果
+    assert compiler.compile(*settings) is not first
+    print(f"  ✅ LRU 上限: {stats['entries']}/{stats['max_entries']}，命中率: {stats['hit_rate']:.0%}")
+
+def create_test_speech_like_audio(sample_rate=16000, words=8, pause_every=3):
+    """創建類語音測試訊號：帶音高變化的音節與停頓"""
+    rng = np.random.default_rng(0)
+    parts = [np.zeros(int(0.3 * sample_rate))]
+    for i in range(words):
+        t = np.arange(int(0.2 * sample_rate)) / sample_rate
+        f0 = np.linspace(110 + rng.uniform(0, 60), 110 + rng.uniform(0, 60), len(t))
+        phase = 2 * np.pi * np.cumsum(f0) / sample_rate
+        parts.append(sum(np.sin(k * phase) / k for k in range(1, 5)) * np.hanning(len(t)) * 0.3)
+        pause = 0.6 if (i + 1) % pause_every == 0 else 0.08
+        parts.append(np.zeros(int(pause * sample_rate)))
+    audio = np.concatenate(parts)
+    return audio + rng.normal(0, 0.002, len(audio))
+
+def test_acoustic_scoring():
+    """測試聲學特徵評分引擎（簡化模式）"""
+    print("\n🧪 測試聲學特徵評分引擎...")
+    
+    audio = create_test_speech_like_audio()
+    features = extract_acoustic_features(audio, word_count=8)
+    print(f"  語速: {features['speech_rate_wpm']:.0f} 字/分鐘, 停頓: {features['pause_count']} 次, "
+          f"音高變化: {features['pitch_range_st']:.1f} 半音")
+    
+    assert extract_acoustic_features(audio, word_count=8) == features
+    # 測試訊號在第 3、6 個音節後有 0.6 秒停頓
+    assert features["pause_count"] == 2 and abs(features["mean_pause"] - 0.6) < 0.1
+    
+    fluency_scores = []
+    for difficulty_name, config in DIFFICULTY_CONFIGS.items():
+        level = config["level"]
+        pronunciation, fluency = score_pronunciation(features, level), score_fluency(features, level)
+        assert 40 <= pronunciation <= 100 and 40 <= fluency <= 100
+        fluency_scores.append(fluency)
+        print(f"  {difficulty_name}: 發音 {pronunciation}, 流暢度 {fluency}")
+    # 級別越高，相同錄音的流暢度要求越嚴格
+    assert fluency_scores[0] >= fluency_scores[-1]
+    
+    silence = extract_acoustic_features(np.zeros(16000))
+    assert score_fluency(silence) == 40
+    print("  ✅ 相同錄音得到相同特徵，靜音錄音給予最低分")
+
+def test_audio_resampling():
+    """測試麥克風音頻轉為 16kHz 單聲道（抗混疊、整數與雙聲道正規化）"""
+    print("\n🧪 測試音頻重新取樣...")
+    
+    t = np.arange(48000) / 48000
+    # 10kHz 高於 16kHz 的奈奎斯特頻率，重新取樣後應被濾除而不是折回 6kHz
+    tone = (0.5 * np.sin(2 * np.pi * 10000 * t)).astype(np.float32)
+    aliased = to_mono_float(48000, tone)
+    assert len(aliased) == 16000
+    assert np.sqrt(np.mean(aliased ** 2)) < 0.02
+    
+    speech_band = (0.5 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+    stereo = to_mono_float(48000, np.stack([speech_band, speech_band], axis=1))
+    assert stereo.dtype == np.float32
+    assert abs(np.sqrt(np.mean(stereo ** 2)) - 0.5 / np.sqrt(2)) < 0.01
+    
+    same_rate = to_mono_float(16000, speech_band)
+    assert len(same_rate) == len(speech_band) and np.abs(same_rate).max() <= 0.5
+    print("  ✅ 高頻成分已濾除，整數雙聲道正規化正確")
+
+def test_shared_instances():
+    """測試共用元件：並行的第一次取用只建立一個實例，設定不同時拋出錯誤"""
+    print("\n🧪 測試共用元件...")
+    import time
+    import threading
+    
+    created = []
+    
+    class SlowComponent:
+        def __init__(self, path="default.db", limit=10):
+            time.sleep(0.05)
+            created.append(path)
+            self.path = path
+    
+    instances = SharedInstances(SlowComponent)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(instances.get("a", path="a.db"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert created == ["a.db"]
+    assert all(result is results[0] for result in results)
+    
+    assert instances.get("a") is results[0]
+    assert instances.get("a", limit=10) is results[0]
+    assert instances.get("b", path="b.db") is not results[0]
+    try:
+        instances.get("a", limit=5)
+        assert False, "設定不同時應拋出 ValueError"
+    except ValueError:
+        pass
+    
+    # 建立緩慢的實例（例如載入模型）時，取用其他鍵值不需等待
+    release = threading.Event()
+    
+    class BlockingComponent:
+        def __init__(self, path="default.db"):
+            if path == "slow.db":
+                release.wait(10)
+            self.path = path
+    
+    instances = SharedInstances(BlockingComponent)
+    loader = threading.Thread(target=instances.get, args=("slow",), kwargs={"path": "slow.db"})
+    loader.start()
+    time.sleep(0.05)
+    started = time.time()
+    assert instances.get("fast", path="fast.db").path == "fast.db" and time.time() - started < 1
+    assert instances.peek("slow") is None
+    release.set()
+    loader.join(5)
+    assert instances.peek("slow").path == "slow.db"
+    print("  ✅ 共用實例只建立一次，設定衝突時拋出錯誤，不同鍵值的建立互不阻塞")
+
+def test_analysis_gate():
+    """測試Audio-LLM閘門：一般句子走本地評分，自由對話與高級別一律使用Audio-LLM"""
+    print("\n🧪 測試分析閘門...")
+    
+    gate = AnalysisGate()
+    clear = {"low_confidence_count": 0, "intelligibility_score": 92}
+    assert gate.decide(clear, 2.0, 5, "intermediate") == (False, "routine")
+    assert gate.decide(clear, 2.0, 5, "advanced") == (True, "level")
+    assert gate.decide(clear, 2.0, 5, "beginner", has_preset_responses=False) == (True, "no_preset_responses")
+    
+    index = get_scenario_index()
+    assert index.has_responses("機場對話 (Airport Conversation)", "beginner")
+    assert not index.has_responses("自由對話", "beginner")
+    
+    stats = gate.get_stats()
+    assert stats["total"] == 3 and stats["local"] == 1
+    print(f"  ✅ 閘門判斷正確，本地比例 {stats['gating_rate']:.0%}")
+    
+    gate.reset_stats()
+    cases = [
+        ((None, 2.0, 5, "intermediate"), "no_confidence"),
+        (({"low_confidence_count": 1, "intelligibility_score": 92}, 2.0, 5, "intermediate"), "low_confidence_words"),
+        (({"low_confidence_count": 0, "intelligibility_score": 79}, 2.0, 5, "intermediate"), "low_intelligibility"),
+        ((clear, 8.5, 5, "intermediate"), "long_audio"),
+        ((clear, 8.0, 14, "intermediate"), "routine"),
+        ((clear, None, 15, "intermediate"), "long_transcript"),
+        ((clear, 2.0, 5, "upper_intermediate"), "level")
+    ]
+    for args, reason in cases:
+        assert gate.decide(*args) == (reason != "routine", reason), (args, reason)
+    assert AnalysisGate(enabled=False).decide(clear, 2.0, 5, "beginner") == (True, "gate_disabled")
+    
+    stats = gate.get_stats()
+    assert stats["total"] == len(cases) and stats["local"] == 1 and stats["reasons"]["level"] == 1
+    assert AnalysisGate().get_stats()["gating_rate"] == 0.0
+    print("  ✅ 各項門檻（含邊界值）判斷正確")
+
+def test_response_parser():
+    """測試 Qwen2-Audio 回應的增量解析：任意切塊、標題跨塊、缺少段落與只有標點的建議"""
+    print("\n🧪 測試回應解析器...")
+    from response_parser import (StreamingResponseParser, parse_response, EVENT_SCORE,
+                                 EVENT_ANALYSIS_DELTA, EVENT_RESPONSE_DELTA, EVENT_SUGGESTION)
+    
+    text = (
+        "**PRONUNCIATION ANALYSIS:**\n"
+        "Overall score: 85/100\n"
+        "- The 'th' in 'thank' was clear.\n"
+        "\n"
+        "**CONVERSATION RESPONSE:**\n"
+        "Thank you. Your gate is B12.\n"
+        "Have a nice flight!\n"
+        "**SUGGESTED NEXT RESPONSES:**\n"
+        "1. Where is gate B12?\n"
+        "2. [Your question about boarding].\n"
+        "- Thanks a lot!\n"
+        "3. Could I get a window seat?"
+    )
+    full = parse_response(text)
+    assert full.pronunciation_score == 85
+    assert full.pronunciation_analysis == "Overall score: 85/100\n- The 'th' in 'thank' was clear.\n"
+    assert full.response_text == "Thank you. Your gate is B12. Have a nice flight! "
+    # 只有預留位置的建議移除後剩下 "."，不算建議；編號的 "." 不會留在建議開頭
+    assert full.suggestions == ["Where is gate B12?", "Thanks a lot!", "Could I get a window seat?"]
+    
+    # 任意位置切塊（包含切在標題中間）都得到與一次解析相同的結果
+    for size in (1, 2, 3, 7, 16):
+        parser = StreamingResponseParser()
+        events = []
+        for i in range(0, len(text), size):
+            events.extend(parser.feed(text[i:i + size]))
+        events.extend(parser.finish())
+        assert parser.pronunciation_score == full.pronunciation_score
+        assert parser.pronunciation_analysis == full.pronunciation_analysis
+        assert parser.response_text == full.response_text
+        assert parser.suggestions == full.suggestions
+        assert [event.data for event in events if event.type == EVENT_SUGGESTION] == full.suggestions
+        assert [event.data for event in events if event.type == EVENT_SCORE] == [85]
+    
+    parser = StreamingResponseParser()
+    assert parser.feed("**CONVERSATION RES") == []
+    assert parser.feed("PONSE:**\nHello") == []
+    assert parser.current_section == "response"
+    assert parser.feed(" there\n") == [(EVENT_RESPONSE_DELTA, "Hello there ")]
+    assert parser.finish() == [] and parser.finish() == []
+    
+    # 缺少段落：沒有標題的文字不屬於任何段落
+    untitled = parse_response("Great job!\nScore: 90\n1. Hi")
+    assert untitled.pronunciation_score is None and untitled.response_text == "" and untitled.suggestions == []
+    response_only = parse_response("CONVERSATION RESPONSE:\nSure, here you go.")
+    assert response_only.response_text == "Sure, here you go. " and response_only.pronunciation_analysis == ""
+    assert response_only.pronunciation_score is None and response_only.suggestions == []
+    
+    # 超出範圍的分數與沒有數字的分數行只保留為分析文字
+    analysis = parse_response("PRONUNCIATION ANALYSIS:\nScore: 150\nScore: excellent\n")
+    assert analysis.pronunciation_score is None and len(analysis.analysis_lines) == 2
+    events = StreamingResponseParser()
+    events.feed("PRONUNCIATION ANALYSIS:\n")
+    assert events.feed("Score: 72.\n") == [(EVENT_SCORE, 72), (EVENT_ANALYSIS_DELTA, "Score: 72.\n")]
+    print("  ✅ 任意切塊的解析結果一致，缺少段落與只有標點的建議處理正確")
+
+def test_batch_manifest():
+    """測試批次評分的清單檔解析與續跑檢查點（不需模型）"""
+    print("\n🧪 測試批次評分清單與續跑...")
+    
+    temp_dir = tempfile.mkdtemp()
+    settings = {"scenario": "日常社交 (Daily Social Conversation)", "difficulty": "中級 (TOEIC 605-780分)",
+                "pronunciation_focus": [], "accent_preference": "不指定", "feedback_detail": "詳細回饋"}
+    
+    csv_path = os.path.join(temp_dir, "class.csv")
+    with open(csv_path, "w", encoding="utf-8-sig") as f:
+        f.write("id,audio_path,difficulty,pronunciation_focus\n")
+        f.write("s1,audio/a.wav,,語調|子音發音\n")
+        f.write(",/abs/b.wav,高級 (TOEIC 905+分),\n")
+        f.write("s3,,,\n")
+    jobs = load_manifest(csv_path, settings)
+    assert [job["id"] for job in jobs] == ["s1", "/abs/b.wav"]
+    assert jobs[0]["audio_path"] == os.path.join(temp_dir, "audio/a.wav")
+    assert jobs[0]["pronunciation_focus"] == ["語調", "子音發音"]
+    assert jobs[0]["difficulty"] == settings["difficulty"]
+    assert jobs[1]["difficulty"] == "高級 (TOEIC 905+分)" and jobs[1]["pronunciation_focus"] == []
+    
+    jsonl_path = os.path.join(temp_dir, "class.jsonl")
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "j1", "audio_path": "c.wav", "scenario": "自由對話"}) + "\n\n")
+    jobs = load_manifest(jsonl_path, settings)
+    assert len(jobs) == 1 and jobs[0]["scenario"] == "自由對話"
+    
+    for suffix in ("jsonl", "csv"):
+        output_path = os.path.join(temp_dir, f"results.{suffix}")
+        writer = ResultWriter(output_path)
+        writer.write({"id": "s1", "success": True})
+        writer.write({"id": "s2", "success": False})
+        writer.close()
+        if suffix == "jsonl":
+            # 中斷時留下的不完整最後一行不算完成
+            with open(output_path, "a", encoding="utf-8") as f:
+                f.write('{"id": "s3", "succ')
+        resumed = ResultWriter(output_path, resume=True)
+        assert resumed.completed == {"s1", "s2"}, resumed.completed
+        resumed.write({"id": "s3", "success": True})
+        resumed.close()
+        reopened = ResultWriter(output_path, resume=True)
+        reopened.close()
+        assert reopened.completed == {"s1", "s2", "s3"}
+    print("  ✅ 清單解析與續跑檢查點正確")
+
+def test_api_server():
+    """測試無介面 API：音頻解碼、請求與回應格式、工作階段隔離與權杖驗證（以替身對話管理器執行）"""
+    print("\n🧪 測試推論 API...")
+    import io
+    import base64
+    import types
+    import soundfile
+    from fastapi import WebSocketDisconnect
+    from fastapi.testclient import TestClient
+    from api_server import create_api_app, decode_audio, api_session_id
+    from response_parser import ParseEvent
+    
+    samples = (0.2 * np.sin(np.arange(16000) / 9) * 32767).astype(np.int16)
+    b64 = lambda raw: base64.b64encode(raw).decode()
+    
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, 22050, format="WAV")
+    sample_rate, decoded = decode_audio(b64(buffer.getvalue()), "wav")
+    assert sample_rate == 22050 and len(decoded) == 16000
+    sample_rate, decoded = decode_audio(b64(samples.tobytes()), "pcm_s16le", 16000)
+    assert decoded.dtype == np.int16 and len(decoded) == 16000
+    for args in (("@@", "wav"), (b64(b"x"), "mp3"), (b64(samples.tobytes()), "pcm_s16le"), ("", "wav")):
+        try:
+            decode_audio(*args)
+            assert False, f"應拋出 ValueError: {args[1]}"
+        except ValueError:
+            pass
+    
+    assert api_session_id("learner-1") == "api-learner-1"
+    assert api_session_id("api-x") == "api-x" and api_session_id().startswith("api-")
+    
+    class StubManager:
+        active_requests = 0
+        audio_processor = types.SimpleNamespace(model_manager=types.SimpleNamespace(whisper_model=object(), use_audio_llm=False))
+        
+        def __init__(self):
+            self.calls = []
+        
+        def get_conversation_context(self, session_id):
+            return ""
+        
+        async def process_user_input_async(self, audio, scenario, session_id=None, on_event=None, **kwargs):
+            self.calls.append(session_id)
+            if on_event:
+                on_event(ParseEvent("score", {"pronunciation_score": np.int64(82)}))
+            return {"success": True, "recognized_text": "hello", "pronunciation_score": np.float32(82),
+                    "fluency_score": 75, "suggested_responses": ("a", "b"), "analysis_mode": "local"}
+    
+    manager = StubManager()
+    client = TestClient(create_api_app(manager, auth_token="secret"))
+    headers = {"Authorization": "Bearer secret"}
+    body = {"audio": b64(samples.tobytes()), "audio_format": "pcm_s16le", "sample_rate": 16000,
+            "scenario": "機場對話 (Airport Conversation)", "session_id": "some-ui-session"}
+    
+    assert client.get("/api/health").status_code == 200
+    assert client.get("/api/ready").json()["ready"] is True
+    
+    # 只啟動介面時，健康與就緒檢查掛在 Gradio 應用的路由最前面
+    from fastapi import FastAPI
+    from api_server import InferenceService, create_status_router
+    ui_app = FastAPI()
+    ui_app.router.routes[:0] = create_status_router(InferenceService(StubManager())).routes
+    assert TestClient(ui_app).get("/api/ready").status_code == 200
+    assert client.post("/api/analyze", json=body).status_code == 401
+    assert client.post("/api/analyze", json=body, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    
+    response = client.post("/api/analyze", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["session_id"] == "api-some-ui-session" and manager.calls == ["api-some-ui-session"]
+    assert result["pronunciation_score"] == 82 and result["suggested_responses"] == ["a", "b"]
+    assert result["analysis_mode"] == "local" and result["latency_ms"] >= 0
+    
+    assert client.post("/api/analyze", json=dict(body, scenario="未知"), headers=headers).status_code == 422
+    assert client.post("/api/analyze", json=dict(body, session_id="../x"), headers=headers).status_code == 422
+    assert client.post("/api/analyze", json={"scenario": "自由對話"}, headers=headers).status_code == 422
+    
+    with client.websocket_connect("/api/analyze/stream?token=secret") as websocket:
+        websocket.send_json(body)
+        messages = [websocket.receive_json() for _ in range(3)]
+    assert [message["type"] for message in messages] == ["accepted", "score", "result"]
+    assert messages[1]["data"]["pronunciation_score"] == 82
+    assert messages[2]["result"]["session_id"] == "api-some-ui-session"
+    try:
+        with client.websocket_connect("/api/analyze/stream") as websocket:
+            websocket.receive_json()
+        assert False, "未帶權杖的 WebSocket 應被關閉"
+    except WebSocketDisconnect:
+        pass
+    print("  ✅ 解碼、回應格式、工作階段前綴與權杖驗證正確")
+
+def test_pregenerated_routing():
+    """測試預先生成的回合只在閘門選擇本地評分時使用，且查詢不重複編譯 prompt"""
+    print("\n🧪 測試預先生成回合的路由...")
+    import types
+    from processors import AudioProcessor, prompt_compiler
+    from pregeneration import PregeneratedTurns
+    
+    temp_dir = tempfile.mkdtemp()
+    turns = PregeneratedTurns(os.path.join(temp_dir, "turns.json"))
+    processor = AudioProcessor(model_manager=types.SimpleNamespace(use_audio_llm=True), pregenerated_turns=turns)
+    scenario = "機場對話 (Airport Conversation)"
+    utterance = "Here is my passport"
+    for difficulty in ("中級 (TOEIC 605-780分)", "高級 (TOEIC 905+分)"):
+        turns.put(scenario, difficulty, utterance, processor.pregeneration_fingerprint(scenario, difficulty),
+                  "Thank you.", ["Sure."])
+    
+    # 清楚、簡短的句子：閘門會選擇本地評分
+    transcription = {
+        "text": utterance,
+        "segments": [{"start": 0.0, "end": 1.4, "avg_logprob": -0.1, "no_speech_prob": 0.01, "compression_ratio": 1.1}],
+        "words": [{"word": f" {word}", "start": i * 0.35, "end": i * 0.35 + 0.3, "probability": 0.97}
+                  for i, word in enumerate(utterance.split())]
+    }
+    compiles = prompt_compiler.hits + prompt_compiler.misses
+    routine = processor.route_analysis(utterance, "中級 (TOEIC 605-780分)", transcription, scenario)
+    assert routine["use_llm"] is False, routine["gate_reason"]
+    assert routine["pregenerated"]["response_text"] == "Thank you."
+    
+    advanced = processor.route_analysis(utterance, "高級 (TOEIC 905+分)", transcription, scenario)
+    assert advanced["use_llm"] is True and advanced["gate_reason"] == "level"
+    assert advanced["pregenerated"] is None
+    
+    for _ in range(5):
+        processor.route_analysis(utterance, "中級 (TOEIC 605-780分)", transcription, scenario)
+    assert prompt_compiler.hits + prompt_compiler.misses == compiles
+    print("  ✅ 高級別仍使用Audio-LLM，查詢預先生成回合不影響 prompt 快取統計")
+
+def test_analysis_cache_key():
+    """測試分析快取鍵：正規化句子，並依對話上下文區分（回應內容取決於先前的對話）"""
+    print("\n🧪 測試分析快取鍵...")
+    from analysis_cache import AnalysisCache
+    
+    settings = ("機場對話 (Airport Conversation)", "中級 (TOEIC 605-780分)", ["語調"], "不指定", "詳細回饋")
+    make_key = lambda text, history="": AnalysisCache.make_key(text, *settings, conversation_history=history)
+    
+    assert make_key("Here is my passport.") == make_key("here is my  PASSPORT")
+    assert make_key("...") is None
+    history = "User: Hello\nAssistant: Good morning, may I see your passport?"
+    assert make_key("Here is my passport", history) != make_key("Here is my passport")
+    assert make_key("Here is my passport", history) == make_key("Here is my passport", history.replace("\n", "  \n "))
+    assert make_key("Here is my passport", "   ") == make_key("Here is my passport")
+    
+    cache = AnalysisCache(max_entries=2)
+    cache.put(make_key("Here is my passport"), {"response_text": "Thank you."})
+    assert cache.get(make_key("Here is my passport", history)) is None
+    assert cache.get(make_key("here is my passport!"))["response_text"] == "Thank you."
+    print("  ✅ 不同對話上下文不共用快取的回應")
+    
+    # 發音分數與分析來自某位學習者的錄音，不寫入快取；命中時由目前的錄音重新評分
+    import types
+    from processors import AudioProcessor
+    from analysis_cache import ANALYSIS_MODE_CACHED
+    
+    llm_response = ("PRONUNCIATION ANALYSIS:\nScore: 99\nPerfect th sounds.\nCONVERSATION RESPONSE:\nThank you.\n"
+                    "SUGGESTED NEXT RESPONSES:\n1. Where is the gate?")
+    generations = []
+    model = types.SimpleNamespace(
+        use_audio_llm=True, tokenize_text=lambda text: None,
+        generate_audio_response=lambda audio, prompt, **kw: generations.append(audio) or llm_response
+    )
+    processor = AudioProcessor(model_manager=model)
+    first_learner = create_test_speech_like_audio()
+    second_learner = np.zeros(16000, dtype=np.float32)
+    analyze = lambda audio: processor._analyze_with_audio_llm(audio, "Here is my passport", *settings[:1], "", settings[1],
+                                                               *settings[2:], True)
+    first = analyze(first_learner)
+    assert first["pronunciation_score"] == 99 and "Perfect th" in first["pronunciation_analysis"]
+    second = analyze(second_learner)
+    assert len(generations) == 1 and second["analysis_mode"] == ANALYSIS_MODE_CACHED
+    assert second["response_text"] == first["response_text"] and second["suggested_responses"] == ["Where is the gate?"]
+    assert second["pronunciation_score"] != 99 and "Perfect th" not in second["pronunciation_analysis"]
+    assert [set(result) for _, result in processor.analysis_cache._cache.values()] == [
+        {"response_text", "suggested_responses"}
+    ]
+    print("  ✅ 快取只保存回應與建議，發音分數由每位學習者的錄音計算")
+
+def test_async_pipeline():
+    """測試非同步流程：模型階段的呼叫個別執行、平行度與並行上限一致，建構時不載入模型"""
+    print("\n🧪 測試非同步流程...")
+    import time
+    import asyncio
+    from processors import ConversationManager
+    from async_pipeline import AsyncPipeline
+    
+    manager = ConversationManager(config={"models": {"stage_concurrency": {"asr": 2}}})
+    pipeline = AsyncPipeline(manager)
+    assert manager.audio_processor._model_manager is None
+    assert pipeline.asr_executor._max_workers == 2 and pipeline.llm_executor._max_workers == 1
+    
+    finished = []
+    
+    def work(name, seconds):
+        time.sleep(seconds)
+        finished.append(name)
+        return name
+    
+    def fail():
+        raise RuntimeError("boom")
+    
+    async def run():
+        start = time.perf_counter()
+        slow = asyncio.ensure_future(pipeline.asr_stage.submit(work, "slow", 0.3))
+        fast = asyncio.ensure_future(pipeline.asr_stage.submit(work, "fast", 0.05))
+        # 較快的呼叫不必等待同時送出的其他呼叫
+        assert await fast == "fast" and not slow.done()
+        assert await slow == "slow"
+        elapsed = time.perf_counter() - start
+        try:
+            await pipeline.asr_stage.submit(fail)
+            assert False, "呼叫的例外應傳回呼叫端"
+        except RuntimeError:
+            pass
+        return elapsed
+    
+    try:
+        elapsed = asyncio.run(run())
+        assert finished == ["fast", "slow"] and elapsed < 0.34
+        stats = pipeline.get_stats()["asr"]
+        assert stats["max_active"] == 2 and stats["completed"] == 3 and stats["failed"] == 1 and stats["active"] == 0
+        print(f"  ✅ 兩個呼叫平行執行（{elapsed:.2f} 秒），建構時未載入模型")
+    finally:
+        pipeline.shutdown()
+
+def test_learner_ids():
+    """測試學習紀錄金鑰：不同分頁（Gradio session）以同一金鑰連結時，進度、儀表板與匯出都累積到同一位學習者"""
+    print("\n🧪 測試學習紀錄金鑰...")
+    import types
+    import secrets
+    from processors import ConversationManager
+    from session_store import learner_id_from_key
+    
+    temp_dir = tempfile.mkdtemp()
+    store = ProgressStore(os.path.join(temp_dir, "progress.db"), flush_interval=0.05)
+    manager = ConversationManager(
+        progress_store=store, model_manager=types.SimpleNamespace(use_audio_llm=False),
+        config={"exports": {"output_dir": os.path.join(temp_dir, "exports")}, "sessions": {"max_learner_links": 2}}
+    )
+    scenario, difficulty = "機場對話 (Airport Conversation)", "中級 (TOEIC 605-780分)"
+    key = secrets.token_hex(16)
+    
+    try:
+        learner_id = learner_id_from_key(key)
+        assert learner_id.startswith("learner-") and key not in learner_id
+        assert learner_id_from_key(f"  {key.upper()} ") == learner_id
+        # 可猜測的名稱或太短的金鑰不接受
+        for invalid in ("", "   ", "小明", "learner-abc", "api-" + key, key[:31], "g" * 32, None):
+            try:
+                learner_id_from_key(invalid)
+                assert False, f"應拒絕學習紀錄金鑰: {invalid!r}"
+            except ValueError:
+                pass
+        
+        assert manager.get_learner_id("page-1") == "page-1"
+        # 重新整理頁面後 Gradio session 改變，瀏覽器保存的金鑰相同
+        for page, score in (("page-1", 70), ("page-2", 80)):
+            assert manager.attach_learner(page, key) == learner_id
+            manager._complete_turn(
+                {"recognized_text": "Here is my passport"},
+                {"response_text": "Thank you.", "pronunciation_score": score, "fluency_score": 75},
+                page, None, scenario, difficulty, [], "不指定", "詳細回饋", True, None
+            )
+        dashboard = manager.get_progress_dashboard(learner_id)
+        assert dashboard["turns"] == 2 and dashboard["pronunciation"]["moving_average"] == 75.0, dashboard
+        
+        job = manager.history_exporter.wait(manager.export_history(learner_id), timeout=30)
+        assert job["status"] == "done" and job["rows"] == 2 and key not in job["path"]
+        assert store.get_summary("page-1")["count"] == 0
+        
+        # 連結數量有上限，最久未使用的分頁先移除
+        manager.attach_learner("page-3", secrets.token_hex(16))
+        assert manager.get_learner_id("page-1") == "page-1"
+        assert manager.get_learner_id("page-2") == learner_id
+        print("  ✅ 不同分頁的練習記錄到同一位學習者，可猜測的金鑰被拒絕")
+    finally:
+        store.close()
+
+def test_session_store():
+    """測試工作階段儲存區：對話歷史上限、LRU 淘汰與閒置逾時"""
+    print("\n🧪 測試工作階段儲存區...")
+    from session_store import SessionStore, DEFAULT_SESSION_ID
+    
+    store = SessionStore(max_history=2, ttl_seconds=60, max_sessions=2, sweep_interval=3600)
+    session = store.get("a")
+    assert store.get("a") is session and store.get(None).session_id == DEFAULT_SESSION_ID
+    for i in range(3):
+        session.add_entry("機場對話 (Airport Conversation)", f"user {i}", f"assistant {i}")
+    assert [entry["user"] for entry in session.get_history()] == ["user 1", "user 2"]
+    session.update_settings(difficulty="高級 (TOEIC 905+分)")
+    assert session.difficulty == "高級 (TOEIC 905+分)" and session.language == "英文 (English)"
+    
+    # 上限 2 個：取用 "a" 後 default 變成最久未使用，建立 "b" 時被移除
+    store.get("a")
+    store.get("b")
+    assert len(store) == 2 and store.get_stats()["evicted"] == 1
+    assert store.get("a") is session
+    
+    store.get("b").last_access -= 120
+    assert store.sweep() == 1 and len(store) == 1 and store.get("a") is session
+    store.remove("a")
+    store.remove("missing")
+    assert len(store) == 0
+    print("  ✅ 對話歷史上限、LRU 淘汰與閒置逾時正確")
+
+def test_fluency_analysis():
+    """測試由逐字時間戳計算的流暢度指標"""
+    print("\n🧪 測試流暢度分析...")
+    from fluency_analysis import (analyze_word_timings, estimate_syllables, score_fluency_from_timings,
+                                  format_fluency_feedback)
+    
+    assert [estimate_syllables(word) for word in (" Hello,", "make", "table", "coffee", "rhythm", "...")] == [2, 1, 2, 2, 1, 0]
+    assert analyze_word_timings([]) is None
+    assert analyze_word_timings([{"word": " ...", "start": 0.0, "end": 0.5}, {"word": " a", "start": 1.0, "end": 0.5}]) is None
+    
+    words = [
+        {"word": " I", "start": 0.0, "end": 0.2},
+        {"word": " would", "start": 0.25, "end": 0.5},
+        {"word": " um,", "start": 0.9, "end": 1.1},
+        {"word": " like", "start": 1.2, "end": 1.5},
+        {"word": " coffee.", "start": 2.5, "end": 3.0}
+    ]
+    metrics = analyze_word_timings(words)
+    assert metrics["word_count"] == 4 and metrics["filler_count"] == 1 and metrics["duration"] == 3.0
+    assert metrics["words_per_minute"] == 80
+    # 0.05 秒的空隙不算停頓；0.4 秒算停頓；1.0 秒是猶豫
+    assert metrics["pause_count"] == 2 and abs(metrics["max_pause"] - 1.0) < 1e-9
+    assert [h["type"] for h in metrics["hesitations"]] == ["filler", "pause"]
+    assert metrics["hesitations"][1]["after_word"] == "like"
+    
+    score = score_fluency_from_timings(metrics, "intermediate")
+    smooth = [{"word": f" {word}", "start": i * 0.35, "end": i * 0.35 + 0.3}
+              for i, word in enumerate("I would like a cup of coffee please".split())]
+    smooth_score = score_fluency_from_timings(analyze_word_timings(smooth), "intermediate")
+    assert 40 <= score < smooth_score <= 100
+    assert "um" in format_fluency_feedback(metrics) and "無，說話連貫" in format_fluency_feedback(analyze_word_timings(smooth))
+    print(f"  ✅ 停頓、填充詞與猶豫片段正確（流暢 {smooth_score} 分 / 猶豫 {score} 分）")
+
+def test_confidence_scoring():
+    """測試由辨識信心度計算的可懂度分數與低信心單字"""
+    print("\n🧪 測試可懂度評分...")
+    from confidence_scoring import score_confidence, format_confidence_feedback
+    
+    assert score_confidence({"text": "hi"}) is None
+    assert score_confidence({"words": [{"word": " hi", "start": 0.0, "end": 0.3, "probability": None}]}) is None
+    
+    words = [
+        {"word": " I'd", "start": 0.0, "end": 0.3, "probability": 0.95},
+        {"word": " uh", "start": 0.3, "end": 0.5, "probability": 0.1},
+        {"word": " like", "start": 0.5, "end": 0.8, "probability": 0.45},
+        {"word": " water.", "start": 0.8, "end": 1.3, "probability": 0.3}
+    ]
+    segment = {"start": 0.0, "end": 1.3, "avg_logprob": -0.2, "no_speech_prob": 0.05, "compression_ratio": 1.2}
+    confidence = score_confidence({"words": words, "segments": [segment]}, "intermediate")
+    # 填充詞不標記；依機率由低到高排序
+    assert [w["word"] for w in confidence["low_confidence_words"]] == ["water.", "like"]
+    assert confidence["low_confidence_count"] == 2
+    assert 40 <= confidence["intelligibility_score"] <= 100
+    # 初學者的門檻較寬鬆
+    assert score_confidence({"words": words}, "beginner")["low_confidence_count"] == 1
+    
+    clear = [dict(word, probability=0.99) for word in words]
+    assert score_confidence({"words": clear})["intelligibility_score"] == 100
+    assert score_confidence({"words": clear, "segments": [dict(segment, avg_logprob=None)]})["segment_confidence"] is None
+    penalized = score_confidence({"words": clear, "segments": [dict(segment, avg_logprob=0.0, no_speech_prob=0.9, compression_ratio=3.0)]})
+    assert penalized["repetitive"] and penalized["intelligibility_score"] == 80
+    assert "water. (30%)" in format_confidence_feedback(confidence)
+    assert "清楚辨識" in format_confidence_feedback(score_confidence({"words": clear}))
+    print(f"  ✅ 低信心單字與懲罰正確（可懂度 {confidence['intelligibility_score']}）")
+
+def test_progress_store():
+    """測試學習進度儲存（批次背景寫入與趨勢查詢）"""
+    print("\n🧪 測試學習進度儲存...")
+    
+    temp_dir = tempfile.mkdtemp()
+    store = ProgressStore(os.path.join(temp_dir, "progress.db"), flush_interval=0.05)
+    
+    try:
+        for i in range(10):
+            store.record(
+                "session-a" if i % 2 else "session-b",
+                "機場對話 (Airport Conversation)" if i < 6 else "餐廳點餐 (Restaurant Ordering)",
+                "中級 (TOEIC 605-780分)",
+                {"recognized_text": f"test {i}", "pronunciation_score": 60 + i, "fluency_score": 70},
+                level="intermediate",
+                settings={"feedback_detail": "詳細回饋"}
+            )
+        store.flush()
+        
+        stats = store.get_stats()
+        assert stats["written"] == 10 and stats["batches"] >= 1
+        
+        trend = {row["group"]: row for row in store.score_trend("scenario", "day")}
+        assert trend["機場對話 (Airport Conversation)"]["count"] == 6
+        assert trend["餐廳點餐 (Restaurant Ordering)"]["avg_pronunciation"] == 67.5
+        
+        recent = store.get_recent("session-a", limit=3)
+        assert [r["recognized_text"] for r in recent] == ["test 9", "test 7", "test 5"]
+        assert store.get_summary("session-b")["count"] == 5
+        assert store.get_summary("unknown")["count"] == 0
+        print(f"  ✅ 已寫入 {stats['written']} 筆（{stats['batches']} 批），趨勢與最近紀錄正確")
+    finally:
+        store.close()
+
+def test_history_export():
+    """測試學習歷程匯出（背景分批寫入 JSONL / Parquet，完成後過期刪除）"""
+    print("\n🧪 測試學習歷程匯出...")
+    import time
+    
+    temp_dir = tempfile.mkdtemp()
+    store = ProgressStore(os.path.join(temp_dir, "progress.db"), flush_interval=0.05)
+    exporter = HistoryExporter(store, output_dir=os.path.join(temp_dir, "exports"), chunk_size=7)
+    
+    try:
+        for i in range(25):
+            store.record(
+                "learner" if i % 5 else "other",
+                "機場對話 (Airport Conversation)",
+                "中級 (TOEIC 605-780分)",
+                {"recognized_text": f"test {i}", "pronunciation_score": 60 + i, "fluency_score": 70},
+                settings={"feedback_detail": "詳細回饋"},
+                audio_ref=f"user_recordings/{i}.wav"
+            )
+        
+        for export_format in available_formats():
+            job = exporter.wait(exporter.start("learner", export_format, include_audio_refs=True), timeout=30)
+            assert job["status"] == "done" and job["rows"] == 20 and os.path.exists(job["path"]), job
+            print(f"  ✅ {export_format}: {job['rows']} 筆 -> {job['path']}")
+            if export_format == "jsonl":
+                with open(job["path"], encoding="utf-8") as f:
+                    rows = [json.loads(line) for line in f]
+                assert len(rows) == 20 and rows[0]["settings"]["feedback_detail"] == "詳細回饋"
+                assert rows[-1]["audio_ref"] == "user_recordings/24.wav"
+        
+        try:
+            exporter.start("learner", "csv")
+            assert False, "不支援的格式應拋出 ValueError"
+        except ValueError:
+            pass
+        assert exporter.get_stats()["completed"] == len(available_formats())
+        
+        # 匯出檔依完成時間過期刪除；先前執行留下的檔案依修改時間判斷
+        stale = os.path.join(exporter.output_dir, "history_old.jsonl")
+        with open(stale, "w") as f:
+            f.write("{}\n")
+        os.utime(stale, (1000, 1000))
+        paths = [job["path"] for job in exporter._jobs.values()]
+        assert exporter.cleanup() == 1 and not os.path.exists(stale)
+        assert all(os.path.exists(path) for path in paths)
+        assert exporter.cleanup(now=time.time() + exporter.file_ttl_seconds + 1) == len(paths)
+        assert os.listdir(exporter.output_dir) == [] and exporter.status(job["job_id"]) is None
+    finally:
+        store.close()
+
+def test_progress_analytics():
+    """測試學習進度分析的累計統計（與直接計算的結果比對）"""
+    print("\n🧪 測試學習進度分析...")
+    import threading
+    import time
+    
+    analytics = ProgressAnalytics(window=5)
+    scores = [(60 + i + (i % 3) * 2, 70 - (i % 4)) for i in range(40)]
+    for i, (pronunciation, fluency) in enumerate(scores):
+        analytics.record("learner", "機場對話 (Airport Conversation)" if i % 2 else "餐廳點餐 (Restaurant Ordering)",
+                         pronunciation, fluency, timestamp=1000 + i)
+    
+    dashboard = analytics.get_dashboard("learner")
+    values = np.array(scores, dtype=float)
+    expected_slope = np.polyfit(np.arange(40), values[:, 0], 1)[0]
+    expected_recent = np.polyfit(np.arange(35, 40), values[-5:, 0], 1)[0]
+    pronunciation = dashboard["pronunciation"]
+    assert dashboard["turns"] == 40 and dashboard["window"] == 5
+    assert pronunciation["moving_average"] == round(values[-5:, 0].mean(), 1)
+    assert abs(pronunciation["slope"] - expected_slope) < 0.01
+    assert abs(pronunciation["recent_slope"] - expected_recent) < 0.01
+    restaurant = dashboard["scenarios"]["餐廳點餐 (Restaurant Ordering)"]
+    assert restaurant["count"] == 20 and restaurant["avg_pronunciation"] == round(values[::2, 0].mean(), 1)
+    assert analytics.get_dashboard("nobody") == {"turns": 0}
+    print(f"  ✅ 移動平均 {pronunciation['moving_average']}，進步斜率 {pronunciation['slope']:+.2f} / "
+          f"最近 {pronunciation['recent_slope']:+.2f} 分每回合")
+    
+    # 淘汰後重新載入：背景寫入器尚未落盤的回合也要載入
+    temp_dir = tempfile.mkdtemp()
+    store = ProgressStore(os.path.join(temp_dir, "progress.db"), flush_interval=2.0)
+    analytics = ProgressAnalytics(store, max_learners=1)
+    try:
+        for learner_id in ("a", "a", "a", "b"):
+            analytics.record(learner_id, "機場對話 (Airport Conversation)", 80, 70)
+            store.record(learner_id, "機場對話 (Airport Conversation)", "中級 (TOEIC 605-780分)",
+                         {"pronunciation_score": 80, "fluency_score": 70})
+        assert analytics.get_dashboard("a")["turns"] == 3 and analytics.get_stats()["evictions"] == 2
+    finally:
+        store.close()
+    
+    # 載入在鎖外進行：一個學習者載入緩慢時不阻塞其他學習者
+    class SlowStore:
+        def __init__(self):
+            self.release = threading.Event()
+        
+        def flush(self):
+            pass
+        
+        def iter_records(self, session_id=None):
+            if session_id == "slow":
+                self.release.wait(10)
+            return iter(())
+    
+    slow_store = SlowStore()
+    analytics = ProgressAnalytics(slow_store)
+    loader = threading.Thread(target=analytics.get_dashboard, args=("slow",))
+    loader.start()
+    time.sleep(0.1)
+    started = time.time()
+    analytics.record("fast", "機場對話 (Airport Conversation)", 80, 70)
+    assert analytics.get_dashboard("fast")["turns"] == 1 and time.time() - started < 1
+    slow_store.release.set()
+    loader.join(5)
+    assert not loader.is_alive() and analytics.get_stats()["learners"] == 2
+    print("  ✅ 學習紀錄於鎖外載入，淘汰後重新載入包含尚未寫入的回合")
+
+def test_recording_store():
+    """測試錄音保存區（背景寫入與依容量清理）"""
+    print("\n🧪 測試錄音保存區...")
+    
+    temp_dir = tempfile.mkdtemp()
+    scratch_dir = os.path.join(temp_dir, "temp_audio")
+    os.makedirs(scratch_dir)
+    for i in range(3):
+        path = os.path.join(scratch_dir, f"old_{i}.wav")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 64000)
+        os.utime(path, (1000 + i, 1000 + i))
+    
+    store = RecordingStore(os.path.join(temp_dir, "recordings"), max_bytes=100000, max_age_days=1,
+                           sweep_dirs=(scratch_dir,), sweep_interval=3600)
+    waveform = (0.1 * np.sin(np.arange(16000) / 10)).astype(np.float32)
+    path = store.save(waveform, "session-a")
+    store.flush()
+    
+    with wave.open(path, "r") as wav_file:
+        assert wav_file.getnframes() == 16000 and wav_file.getframerate() == 16000
+    
+    store.sweep()
+    stats = store.get_stats()
+    assert os.listdir(scratch_dir) == [] and os.path.exists(path)
+    assert stats["deleted"] == 3
+    print(f"  ✅ 背景寫入錄音，過期與超出容量的舊檔已清理 "
+          f"(刪除 {stats['deleted']} 個，剩餘 {stats['managed_mb'] * 1024:.0f}KB)")
+
+def test_streaming_asr():
+    """測試串流辨識的 VAD 斷句（以替身模型計算每次辨識的音頻長度）"""
+    print("\n🧪 測試串流辨識...")
+    
+    class LengthTranscriber:
+        def __init__(self):
+            self.calls = []
+        
+        def transcribe_audio(self, audio, language="en", return_details=False):
+            seconds = len(audio) / 16000
+            self.calls.append(seconds)
+            text = f"segment of {seconds:.1f} seconds"
+            if not return_details:
+                return text
+            return {"text": text, "language": language, "segments": [{"start": 0.0, "end": seconds, "text": text}],
+                    "words": [{"word": " segment", "start": 0.0, "end": seconds, "probability": 0.9}]}
+    
+    sample_rate = 48000
+    rng = np.random.default_rng(0)
+    tone = lambda seconds: 0.3 * np.sin(2 * np.pi * 150 * np.arange(int(seconds * sample_rate)) / sample_rate)
+    silence = lambda seconds: 0.001 * rng.standard_normal(int(seconds * sample_rate))
+    # 0.45 秒的短停頓與 0.9 秒的思考停頓都不應結束語句
+    audio = np.concatenate([silence(0.3), tone(2.0), silence(0.45), tone(1.5), silence(0.9), tone(1.6), silence(1.6)])
+    pcm = (audio * 32767).astype(np.int16)
+    chunk = int(0.1 * sample_rate)
+    
+    def run(transcriber):
+        for start in range(0, len(pcm), chunk):
+            if transcriber.feed(sample_rate, pcm[start:start + chunk]):
+                return (start + chunk) / sample_rate
+        return None
+    
+    model = LengthTranscriber()
+    transcriber = StreamingTranscriber(model)
+    endpoint_time = run(transcriber)
+    speech_end = 0.3 + 2.0 + 0.45 + 1.5 + 0.9 + 1.6
+    assert endpoint_time is not None, "靜音超過 endpoint_silence 後應結束語句"
+    delay = endpoint_time - speech_end
+    assert transcriber.endpoint_silence <= delay < transcriber.endpoint_silence + 0.3, delay
+    print(f"  ✅ 思考停頓不截斷，語句結束後 {delay:.2f} 秒完成斷句")
+    
+    waveform, transcription = transcriber.result
+    assert len(transcriber.committed) == 3, len(transcriber.committed)
+    assert max(model.calls) < 2.5, max(model.calls)
+    assert transcription and len(transcription["words"]) == 3 and waveform is not None
+    assert [word["start"] for word in transcription["words"]] == [offset for offset, _ in transcriber.committed]
+    # 以麥克風取樣率累積，交出的完整錄音一次重新取樣為 16kHz（保留語句結束後 0.2 秒）
+    assert transcriber.sample_rate == sample_rate and waveform.dtype == np.float32
+    assert abs(len(waveform) / 16000 - (speech_end + 0.2)) < 0.05, len(waveform)
+    # 與整段錄音一次重新取樣的結果相同，片段邊界沒有濾波器的邊緣失真
+    assert np.array_equal(waveform, to_mono_float(sample_rate, pcm[:len(waveform) * 3]))
+    print(f"  ✅ 停頓時已提前確定 {len(transcriber.committed)} 個段落，最長辨識 {max(model.calls):.2f} 秒")
+    
+    short = StreamingTranscriber(LengthTranscriber(), endpoint_silence=0.5)
+    assert run(short) < 0.3 + 2.0 + 0.45 + 1.5 + 0.9, "endpoint_silence 應可調整"
+    
+    # 長時間不停頓時，部分結果只辨識尾段最近的幾秒
+    long_model = LengthTranscriber()
+    windowed = StreamingTranscriber(long_model, max_partial_seconds=3.0)
+    long_pcm = (np.concatenate([silence(0.3), tone(8.0)]) * 32767).astype(np.int16)
+    for start in range(0, len(long_pcm), chunk):
+        windowed.feed(sample_rate, long_pcm[start:start + chunk])
+    assert max(long_model.calls) <= 3.05, max(long_model.calls)
+    assert windowed.partial_text.startswith("…")
+    
+    # 語音辨識階段有人排隊時略過部分結果
+    from stage_limiter import StageLimiter
+    busy_model = LengthTranscriber()
+    busy_model.stage_limiters = {"asr": StageLimiter("asr", 1)}
+    busy_model.stage_limiters["asr"].waiting = 1
+    busy = StreamingTranscriber(busy_model)
+    for start in range(0, int(3 * sample_rate), chunk):
+        busy.feed(sample_rate, long_pcm[start:start + chunk])
+    assert busy_model.calls == [] and busy.skipped_partials > 0
+    print(f"  ✅ 部分結果限制在最近 {windowed.max_partial_seconds:.0f} 秒，辨識忙碌時略過 {busy.skipped_partials} 次")
+
 def test_conversation_manager():
     """測試對話管理器的進階功能整合"""
     print("\n🧪 測試對話管理器...")
@@ -237,6 +1160,26 @@ def main():
     try:
         # 1. 測試 Prompt 生成
         test_prompt_generation()
+        test_prompt_cache()
+        test_acoustic_scoring()
+        test_audio_resampling()
+        test_shared_instances()
+        test_analysis_gate()
+        test_response_parser()
+        test_session_store()
+        test_fluency_analysis()
+        test_confidence_scoring()
+        test_batch_manifest()
+        test_api_server()
+        test_pregenerated_routing()
+        test_analysis_cache_key()
+        test_async_pipeline()
+        test_learner_ids()
+        test_progress_store()
+        test_progress_analytics()
+        test_history_export()
+        test_recording_store()
+        test_streaming_asr()
         
         # 2. 測試難度配置
         test_difficulty_configs()
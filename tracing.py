@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+tracing.py - 輕量級請求追蹤
+為每個處理階段建立 span（含屬性），取樣到的請求以 Chrome Trace Event 格式逐行寫入會自動輪替的 JSONL 檔；
+未取樣的請求只需一次 contextvar 讀取即可略過，幾乎沒有額外成本
+
+檢視方式:
+    python tracing.py traces/trace.jsonl -o trace.json
+    再以 chrome://tracing 或 https://ui.perfetto.dev 開啟 trace.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import functools
+import threading
+import contextvars
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_TRACE_PATH = os.path.join("traces", "trace.jsonl")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class _NoopSpan:
+    """未取樣時使用的 span，所有操作皆為空"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _SuppressedSpan(_NoopSpan):
+    """未取樣的根 span：標記目前的執行範圍，讓內層 span 不再重新取樣"""
+
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        return False
+
+
+class _Trace:
+    """一個取樣到的請求，收集所有 span 並在根 span 結束時匯出"""
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.events = []
+        self.lock = threading.Lock()
+        self.next_span_id = 0
+
+    def new_span_id(self):
+        with self.lock:
+            self.next_span_id += 1
+            return self.next_span_id
+
+
+class Span:
+    """取樣到的 span，結束時轉為 Chrome Trace 的 complete event（ph="X"）"""
+
+    __slots__ = ("tracer", "trace", "name", "span_id", "parent_id", "attributes", "start_ns", "tid", "_token")
+
+    def __init__(self, tracer, trace, name, parent_id, attributes):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.span_id = trace.new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.tid = threading.get_ident()
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+
+        args = {"trace_id": self.trace.trace_id, "span_id": self.span_id, "parent_id": self.parent_id}
+        args.update(self.attributes)
+        event = {
+            "name": self.name,
+            "cat": self.name.split(".")[0],
+            "ph": "X",
+            "ts": self.tracer.to_trace_us(self.start_ns),
+            "dur": (end_ns - self.start_ns) / 1000,
+            "pid": self.tracer.pid,
+            "tid": self.tid,
+            "args": args
+        }
+        with self.trace.lock:
+            self.trace.events.append(event)
+
+        if self.parent_id is None:
+            self.tracer.export(self.trace)
+        return False
+
+
+class Tracer:
+    """依取樣率建立 span，取樣到的請求寫入輪替的 JSONL 檔"""
+
+    def __init__(self, sample_rate=0.0, path=DEFAULT_TRACE_PATH, max_bytes=10 * 1024 * 1024, backup_count=5):
+        """
+        Args:
+            sample_rate (float): 0-1，請求被追蹤的機率
+            path (str): 輸出 JSONL 檔路徑
+            max_bytes (int): 單一檔案的大小上限，超過時輪替
+            backup_count (int): 保留的舊檔數量
+        """
+        self.sample_rate = sample_rate
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.pid = os.getpid()
+
+        # 以牆鐘時間為基準，再以高精度計時器計算相對時間
+        self._wall_anchor_us = time.time_ns() / 1000
+        self._perf_anchor_ns = time.perf_counter_ns()
+
+        self._logger = None
+        self._logger_lock = threading.Lock()
+        self.sampled = 0
+        self.exported_spans = 0
+
+    def to_trace_us(self, perf_ns):
+        return self._wall_anchor_us + (perf_ns - self._perf_anchor_ns) / 1000
+
+    def span(self, name, **attributes):
+        """建立 span；沒有進行中的追蹤時依取樣率決定是否開始新的追蹤"""
+        current = _current_span.get()
+        if current is None:
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return _SuppressedSpan()
+            self.sampled += 1
+            trace = _Trace(f"{self.pid:x}-{time.time_ns():x}-{random.getrandbits(16):04x}")
+            return Span(self, trace, name, None, attributes)
+        if not isinstance(current, Span):
+            return _NOOP_SPAN
+        return Span(self, current.trace, name, current.span_id, attributes)
+
+    def set_attribute(self, key, value):
+        """設定目前 span 的屬性"""
+        current = _current_span.get()
+        if isinstance(current, Span):
+            current.attributes[key] = value
+
+    def _get_logger(self):
+        with self._logger_lock:
+            if self._logger is None:
+                directory = os.path.dirname(self.path)
+                if directory and not os.path.exists(directory):
+                    os.makedirs(directory)
+                handler = RotatingFileHandler(
+                    self.path, maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger(f"tracing.{id(self)}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+                self._logger = logger
+            return self._logger
+
+    def export(self, trace):
+        """將追蹤中的所有 span 寫入檔案（每行一個 trace event）"""
+        with trace.lock:
+            events = sorted(trace.events, key=lambda event: event["ts"])
+        logger = self._get_logger()
+        for event in events:
+            logger.info(json.dumps(event, ensure_ascii=False, default=str))
+        self.exported_spans += len(events)
+
+    def get_stats(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "sampled_requests": self.sampled,
+            "exported_spans": self.exported_spans,
+            "path": self.path
+        }
+
+
+def carry_context(fn, *args, **kwargs):
+    """包裝要交給其他執行緒執行的呼叫，讓 span 能延續到該執行緒"""
+    return functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def traced(name=None, **attributes):
+    """以 span 包裝函數的裝飾器"""
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with get_tracer().span(span_name, **attributes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+_tracer = None
+
+
+def get_tracer():
+    """獲取追蹤器實例，取樣率與輸出路徑可由 TRACE_SAMPLE_RATE / TRACE_FILE 環境變數設定"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(
+            sample_rate=float(os.environ.get("TRACE_SAMPLE_RATE", "0")),
+            path=os.environ.get("TRACE_FILE", DEFAULT_TRACE_PATH)
+        )
+    return _tracer
+
+
+def configure_tracing(sample_rate=None, path=None):
+    """調整取樣率或輸出路徑"""
+    global _tracer
+    tracer = get_tracer()
+    if path is not None and path != tracer.path:
+        _tracer = tracer = Tracer(tracer.sample_rate, path, tracer.max_bytes, tracer.backup_count)
+    if sample_rate is not None:
+        tracer.sample_rate = sample_rate
+    return tracer
+
+
+def to_chrome_trace(paths, output_path):
+    """合併 JSONL 追蹤檔為 chrome://tracing / Perfetto 可直接開啟的 JSON"""
+    events = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            events.extend(json.loads(line) for line in f if line.strip())
+    events.sort(key=lambda event: event["ts"])
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    return len(events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="將追蹤 JSONL 轉為 Chrome Trace JSON")
+    parser.add_argument("inputs", nargs="+", help="追蹤 JSONL 檔（可包含輪替後的舊檔）")
+    parser.add_argument("-o", "--output", default="trace.json", help="輸出 JSON 檔")
+    args = parser.parse_args()
+    count = to_chrome_trace(args.inputs, args.output)
+    print(f"✅ 已輸出 {count} 個 span 至 {args.output}")
+    sys.exit(0)